@@ -0,0 +1,74 @@
+"""
+Benchmark of note content storage on a corpus of mixed-size notes: stored bytes
+with and without compression, and list latency of the full and preview views.
+
+    python -m benchmarks.bench_content_storage
+"""
+
+import random
+
+from benchmarks.common import setup_django, summarize, timer
+
+NOTES = 500
+RUNS = 20
+# (share of notes, approximate content size in characters)
+SIZES = [(0.80, 300), (0.15, 8_000), (0.05, 100_000)]
+WORDS = (
+    'note idea meeting project plan review draft design budget client release test deploy '
+    'research summary question answer follow up deadline team roadmap feature bug fix'
+).split()
+
+
+def make_corpus(rng: random.Random) -> list:
+    """
+    Returns NOTES texts with sizes drawn from SIZES.
+    """
+    texts = []
+    for share, size in SIZES:
+        for _ in range(int(NOTES * share)):
+            words = []
+            length = 0
+            while length < size:
+                word = rng.choice(WORDS)
+                words.append(word)
+                length += len(word) + 1
+            texts.append(' '.join(words))
+    return texts
+
+
+def main() -> None:
+    setup_django()
+
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+
+    from notes.models import Note
+
+    texts = make_corpus(random.Random(0))
+    raw_bytes = sum(len(text.encode()) for text in texts)
+    print(f'corpus: {len(texts)} notes, {raw_bytes / 1e6:.1f} MB of content')
+
+    for codec in [None, 'zlib']:
+        with override_settings(NOTES_CONTENT_COMPRESSION=codec, NOTES_LIST_CACHE_ENABLED=False):
+            user = User.objects.create_user(username=f'bench-{codec}@example.com')
+            Note.objects.bulk_create([Note(user=user, title=f'Note {i}', content=text) for i, text in enumerate(texts)])
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT SUM(LENGTH(CAST(content AS BLOB))) FROM notes_note WHERE user_id = %s', [user.id])
+                stored = cursor.fetchone()[0]
+            print(f'== compression={codec}: stored {stored / 1e6:.2f} MB ({stored / raw_bytes:.0%} of raw)')
+
+            client = APIClient()
+            client.force_authenticate(user)
+            for view in ['', '?view=preview']:
+                samples = []
+                for _ in range(RUNS):
+                    with timer(samples):
+                        response = client.get(f'/api/v1/notes/{view}')
+                    assert response.status_code == 200 and len(response.data) == len(texts)
+                print(summarize(f'list {view or "full"}', samples))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark of duplicate detection as a user's collection grows: latency of checking
+one new note, of checking an import chunk, and of listing duplicate clusters.
+
+    python -m benchmarks.bench_duplicates
+"""
+
+import random
+
+from benchmarks.common import setup_django, summarize, timer
+
+SIZES = [1_000, 10_000, 100_000]
+CHECKS = 50
+CHUNK = 1000
+DUPLICATE_SHARE = 0.05
+WORDS = [f'w{i}' for i in range(5000)]
+
+
+def make_text(rng: random.Random) -> str:
+    """
+    Returns a random 20-60 word note body.
+    """
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 60)))
+
+
+def main() -> None:
+    setup_django()
+
+    from django.contrib.auth.models import User
+
+    from notes.fingerprints import check_duplicates, duplicate_clusters, index_notes, signature
+    from notes.models import Note
+
+    rng = random.Random(0)
+    for size in SIZES:
+        user = User.objects.create_user(username=f'bench-{size}@example.com')
+        texts = [make_text(rng) for _ in range(size)]
+        # A share of the notes repeat an earlier note with one word changed.
+        for i in rng.sample(range(1, size), int(size * DUPLICATE_SHARE)):
+            words = texts[rng.randrange(i)].split()
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            texts[i] = ' '.join(words)
+        for start in range(0, size, CHUNK):
+            chunk = [Note(user=user, title='', content=text) for text in texts[start:start + CHUNK]]
+            index_notes(Note.objects.bulk_create(chunk), [signature('', text) for text in texts[start:start + CHUNK]])
+
+        print(f'== {size} notes')
+        samples = []
+        for _ in range(CHECKS):
+            with timer(samples):
+                check_duplicates(user.id, [('', texts[rng.randrange(size)])])
+        print(summarize('check one note', samples))
+
+        samples = []
+        for _ in range(5):
+            with timer(samples):
+                check_duplicates(user.id, [('', make_text(rng)) for _ in range(CHUNK)])
+        print(summarize(f'check chunk of {CHUNK}', samples))
+
+        samples = []
+        with timer(samples):
+            clusters = duplicate_clusters(user.id)
+        print(summarize(f'clusters ({len(clusters)} found)', samples))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark comparing populate_llm's per-category loop with the combined structured request,
+against a local stub of the OpenAI API (see benchmarks/llm_stub.py).
+
+    python -m benchmarks.bench_llm_modes
+"""
+
+import os
+
+from benchmarks.common import setup_django, summarize, timer
+from benchmarks.llm_stub import StubServer
+
+RUNS = 5
+
+
+def main() -> None:
+    setup_django()
+
+    import openai
+    from django.contrib.auth.models import User
+    from rest_framework.test import APIClient
+
+    from notes.models import Category
+
+    os.environ['NEXT_PUBLIC_OPENAI_API_KEY'] = 'stub-key'
+    user = User.objects.create_user(username='bench@example.com')
+    for name in ['Random Thoughts', 'School', 'Personal']:
+        Category.objects.create(user=user, name=name)
+    client = APIClient()
+    client.force_authenticate(user)
+
+    with StubServer() as stub:
+        openai.api_base = stub.api_base
+        for mode in ['per_category', 'combined']:
+            stub.reset()
+            samples = []
+            for _ in range(RUNS):
+                with timer(samples):
+                    response = client.post('/api/v1/populate_llm/', {'subject': 'Space', 'mode': mode}, format='json')
+                assert response.status_code == 200 and response.data['count'] == 9, response.data
+            usage = stub.usage
+            print(summarize(mode, samples))
+            print(f'  per run: {usage["requests"] / RUNS:.1f} requests, '
+                  f'{usage["prompt_tokens"] / RUNS:.0f} prompt tokens, '
+                  f'{usage["completion_tokens"] / RUNS:.0f} completion tokens')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark of GET /api/v1/notes/ with and without the per-user list cache.
+Reads are interleaved with an edit every WRITE_EVERY requests, so the hit rate
+reflects invalidation rather than a read-only workload.
+
+    python -m benchmarks.bench_notes_list_cache
+"""
+
+from benchmarks.common import setup_django, summarize, timer
+
+NOTES = 200
+REQUESTS = 400
+WRITE_EVERY = 20
+
+
+def main() -> None:
+    setup_django()
+
+    from django.contrib.auth.models import User
+    from django.core.cache import caches
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+
+    from notes import metrics
+    from notes.models import Category, Note
+
+    user = User.objects.create_user(username='bench@example.com')
+    category = Category.objects.create(user=user, name='Personal')
+    Note.objects.bulk_create([
+        Note(user=user, category=category, title=f'Note {i}', content='Lorem ipsum dolor sit amet. ' * 20)
+        for i in range(NOTES)
+    ])
+    note_id = Note.objects.filter(user=user).values_list('id', flat=True).first()
+    client = APIClient()
+    client.force_authenticate(user)
+
+    for enabled in [False, True]:
+        caches['default'].clear()
+        hits = metrics.get('notes_list_cache_requests_total', result='hit')
+        misses = metrics.get('notes_list_cache_requests_total', result='miss')
+        samples = []
+        with override_settings(NOTES_LIST_CACHE_ENABLED=enabled):
+            for i in range(REQUESTS):
+                if i % WRITE_EVERY == 0:
+                    client.patch(f'/api/v1/notes/{note_id}/', {'title': f'Edit {i}'}, format='json')
+                with timer(samples):
+                    response = client.get('/api/v1/notes/')
+                assert response.status_code == 200 and len(response.json()) == NOTES
+
+        print(summarize(f'list cache={"on" if enabled else "off"}', samples))
+        if enabled:
+            hits = metrics.get('notes_list_cache_requests_total', result='hit') - hits
+            misses = metrics.get('notes_list_cache_requests_total', result='miss') - misses
+            print(f'  hit rate: {hits / (hits + misses):.1%} ({hits:g} hits, {misses:g} misses)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark for note revision storage: bytes stored per edit and reconstruction latency.
+
+    python -m benchmarks.bench_revisions
+"""
+
+import random
+
+from benchmarks.common import setup_django, summarize, timer
+
+EDITS = 300
+PARAGRAPHS = 200
+
+
+def main() -> None:
+    setup_django()
+
+    from django.contrib.auth.models import User
+    from django.db.models import Sum
+
+    from notes.models import Note, NoteRevision
+    from notes.revisions import rebuild_content, record_revision
+
+    rng = random.Random(42)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'note', 'draft', 'idea', 'plan', 'todo', 'done']
+    paragraphs = [' '.join(rng.choice(words) for _ in range(20)) + '\n' for _ in range(PARAGRAPHS)]
+
+    user = User.objects.create_user(username='bench@example.com')
+    note = Note.objects.create(user=user, title='Bench', content=''.join(paragraphs))
+    record_revision(note)
+
+    versions = [note.content]
+    for _ in range(EDITS):
+        previous = note.content
+        index = rng.randrange(len(paragraphs))
+        paragraphs[index] = ' '.join(rng.choice(words) for _ in range(20)) + '\n'
+        note.content = ''.join(paragraphs)
+        note.save()
+        record_revision(note, previous_content=previous)
+        versions.append(note.content)
+
+    revisions = NoteRevision.objects.filter(note=note)
+    stored = revisions.aggregate(total=Sum('content_length'))['total']
+    compressed = sum(len(bytes(data)) for data in revisions.values_list('data', flat=True))
+    kept = revisions.count()
+    newest = revisions.order_by('-number').first().number
+
+    print(f'note size: {len(note.content)} chars, edits: {EDITS}, revisions kept: {kept}')
+    print(f'full copies would store: {stored} chars')
+    print(f'stored (compressed deltas + snapshots): {compressed} bytes, '
+          f'{compressed / kept:.0f} bytes/revision '
+          f'({compressed / stored * 100:.2f}% of full copies)')
+
+    samples = []
+    for number in range(newest - kept + 1, newest + 1):
+        with timer(samples):
+            content = rebuild_content(note, number)
+        assert content == versions[number - 1], f'revision {number} mismatch'
+    print(summarize('reconstruction', samples))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark of semantic search: embedding throughput of the hashing embedder and
+query latency of the brute-force int8 index as a user's collection grows.
+
+    python -m benchmarks.bench_semantic_search
+"""
+
+import random
+
+from benchmarks.common import setup_django, summarize, timer
+
+SIZES = [1_000, 10_000, 100_000]
+QUERIES = 50
+WORDS = [f'w{i}' for i in range(5000)]
+
+
+def make_text(rng: random.Random) -> str:
+    """
+    Returns a random 20-60 word note body.
+    """
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 60)))
+
+
+def main() -> None:
+    setup_django()
+
+    from django.contrib.auth.models import User
+
+    from notes import embeddings
+    from notes.models import Note
+
+    rng = random.Random(0)
+    for size in SIZES:
+        user = User.objects.create_user(username=f'bench-{size}@example.com')
+        Note.objects.bulk_create(
+            [Note(user=user, title='', content=make_text(rng)) for _ in range(size)],
+            batch_size=1000
+        )
+        print(f'== {size} notes')
+        samples = []
+        with timer(samples):
+            embeddings.refresh_embeddings(user.id, batch_size=1000)
+        print(f'embedded in {samples[0]:.1f}s ({size / samples[0]:.0f} notes/s)')
+
+        samples = []
+        with timer(samples):
+            embeddings.get_index(user.id, embeddings.get_embedder().name)
+        print(summarize('index load', samples))
+
+        samples = []
+        for _ in range(QUERIES):
+            with timer(samples):
+                embeddings.search(user.id, make_text(rng), 10)
+        print(summarize('search top 10', samples))
+
+
+if __name__ == '__main__':
+    main()
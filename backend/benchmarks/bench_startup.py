@@ -0,0 +1,90 @@
+"""
+Startup-time benchmark: loads the WSGI application and runs the warm-up in a fresh
+interpreter under `python -X importtime`, for each settings profile.
+
+    python -m benchmarks.bench_startup
+
+Reports wall time to ready, total import time and the heaviest top-level imports,
+so regressions in cold start (pod start, HPA scale-out) show up over time.
+"""
+
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from benchmarks.common import summarize
+
+RUNS = 5
+TOP = 10
+PROFILES = ['turbo_ai.settings', 'turbo_ai.settings_api']
+
+STARTUP_SNIPPET = (
+    'import sys, time\n'
+    'start = time.perf_counter()\n'
+    'from turbo_ai.wsgi import application\n'
+    'from notes import warmup\n'
+    'warmup.warm_up()\n'
+    'print(time.perf_counter() - start)\n'
+    'print(int("openai" in sys.modules))\n'
+)
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Parses -X importtime output into (total self time, {top-level module: cumulative time}), in seconds.
+    """
+    total = 0.0
+    top_level = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        name = name[1:]
+        total += int(self_us) / 1e6
+        if not name.startswith('  '):
+            top_level[name.strip()] = int(cumulative_us) / 1e6
+    return total, top_level
+
+
+def run_once(profile: str) -> Tuple[float, float, Dict[str, float], bool]:
+    """
+    Starts one interpreter; returns (wall time to ready, import time, top-level imports, openai loaded).
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=profile, NOTES_WARMUP='0')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SNIPPET],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    wall, openai_loaded = result.stdout.split()
+    total, top_level = parse_importtime(result.stderr)
+    return float(wall), total, top_level, openai_loaded == '1'
+
+
+def main() -> None:
+    for profile in PROFILES:
+        walls: List[float] = []
+        imports: List[float] = []
+        heaviest = defaultdict(list)
+        openai_loaded = False
+        for _ in range(RUNS):
+            wall, total, top_level, openai_loaded = run_once(profile)
+            walls.append(wall)
+            imports.append(total)
+            for name, seconds in top_level.items():
+                heaviest[name].append(seconds)
+
+        print(f'== {profile} (openai imported at startup: {openai_loaded})')
+        print(summarize('ready', walls))
+        print(summarize('imports', imports))
+        ranked = sorted(heaviest.items(), key=lambda item: -sorted(item[1])[len(item[1]) // 2])
+        for name, samples in ranked[:TOP]:
+            print(f'  {sorted(samples)[len(samples) // 2] * 1000:8.1f}ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark of tag filters (notes/tagging.py) against the title-encoded tags they
+replace, on one user with many notes and tags. Tag popularity is Zipf-like, so
+filters mix very common and rare tags; all-of filters are driven by their rarest tag.
+
+    python -m benchmarks.bench_tags
+"""
+
+import random
+
+from benchmarks.common import setup_django, summarize, timer
+
+NOTES = 100_000
+TAGS = 2_000
+TAGS_PER_NOTE = 3
+QUERIES = 30
+
+
+def main() -> None:
+    setup_django()
+
+    from django.contrib.auth.models import User
+    from django.db.models import Q
+
+    from notes import tagging
+    from notes.models import Note, NoteTag, Tag
+
+    rng = random.Random(42)
+    user = User.objects.create_user(username='bench@example.com')
+    tags = Tag.objects.bulk_create([Tag(user=user, name=f'tag{index}') for index in range(TAGS)])
+    weights = [1 / (rank + 1) for rank in range(TAGS)]
+    tagged = [set(rng.choices(range(TAGS), weights, k=TAGS_PER_NOTE)) for _ in range(NOTES)]
+    notes = Note.objects.bulk_create([
+        Note(user=user, title='Note ' + ''.join(f'#tag{index} ' for index in sorted(indexes)), content='body')
+        for indexes in tagged
+    ], batch_size=5000)
+    NoteTag.objects.bulk_create([
+        NoteTag(tag=tags[index], note_id=note.id) for note, indexes in zip(notes, tagged) for index in indexes
+    ], batch_size=5000)
+    counts = {}
+    for indexes in tagged:
+        for index in indexes:
+            counts[index] = counts.get(index, 0) + 1
+    for index, count in counts.items():
+        Tag.objects.filter(id=tags[index].id).update(note_count=count)
+    print(f'{NOTES} notes, {TAGS} tags, {sum(counts.values())} postings; '
+          f'most common tag on {max(counts.values())} notes')
+
+    def pick() -> str:
+        return f'tag{rng.choices(range(TAGS), weights)[0]}'
+
+    def in_title(name: str) -> Q:
+        return Q(title__contains=f'#{name} ')
+
+    cases = {
+        'all of 2 (index)': lambda names: tagging.note_filter(user.id, names[:2]),
+        'all of 2 (title scan)': lambda names: in_title(names[0]) & in_title(names[1]),
+        'any of 3 (index)': lambda names: tagging.note_filter(user.id, any_of=names),
+        'any of 3 (title scan)': lambda names: in_title(names[0]) | in_title(names[1]) | in_title(names[2]),
+    }
+    for name, condition in cases.items():
+        samples = []
+        for _ in range(QUERIES):
+            names = [pick(), pick(), pick()]
+            with timer(samples):
+                list(Note.objects.filter(user=user).filter(condition(names)).values_list('id', flat=True))
+        print(summarize(name, samples))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Throughput of the database-backed task queue (notes/tasks.py): enqueueing, and
+draining the queue with one worker in-process and with pools of worker processes.
+Tasks either return at once (queue overhead only) or sleep for SLEEP_MS (I/O-bound
+work, where more processes help until the database's write lock is the limit: every
+claim and completion is a committed write, and SQLite admits one writer at a time).
+
+    python -m benchmarks.bench_task_queue
+"""
+
+import os
+import tempfile
+import time
+
+from benchmarks.common import setup_django
+
+TASKS = 1000
+SLEEP_MS = 5
+
+
+def main() -> None:
+    database_file = os.path.join(tempfile.mkdtemp(), 'bench_tasks.sqlite3')
+    setup_django(database_file)
+
+    from notes import tasks
+    from notes.models import Task
+
+    @tasks.task()
+    def bench_noop() -> None:
+        pass
+
+    @tasks.task()
+    def bench_sleep() -> None:
+        time.sleep(SLEEP_MS / 1000)
+
+    def fill(name: str, count: int) -> float:
+        start = time.perf_counter()
+        for _ in range(count):
+            tasks.enqueue(name)
+        return time.perf_counter() - start
+
+    elapsed = fill('bench_noop', TASKS)
+    print(f'enqueue: {TASKS / elapsed:.0f} tasks/s')
+
+    start = time.perf_counter()
+    ran = tasks.work('bench', burst=True)
+    elapsed = time.perf_counter() - start
+    assert ran == TASKS, ran
+    print(f'drain, 1 worker in-process, no-op tasks: {TASKS / elapsed:.0f} tasks/s')
+
+    pools = sorted({1, 2, 4, os.cpu_count() or 1})
+    for name, count in (('bench_noop', TASKS), ('bench_sleep', TASKS // 2)):
+        for processes in pools:
+            fill(name, count)
+            start = time.perf_counter()
+            tasks.run_pool(processes, burst=True)
+            elapsed = time.perf_counter() - start
+            left = Task.objects.count()
+            assert left == 0, f'{left} tasks left'
+            print(f'drain, {processes} processes, {name[6:]} tasks: {count / elapsed:.0f} tasks/s')
+
+
+if __name__ == '__main__':
+    main()
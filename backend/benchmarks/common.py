@@ -0,0 +1,60 @@
+"""
+Shared setup for the backend benchmarks.
+
+Benchmarks are plain scripts run from the backend directory, e.g.:
+
+    python -m benchmarks.bench_revisions
+
+Each one runs against a throwaway test database, never db.sqlite3.
+"""
+
+import logging
+import os
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import django
+
+
+def setup_django(database_file: Optional[str] = None) -> None:
+    """
+    Configures Django and creates a fresh test database, in memory unless
+    database_file names a SQLite file (needed by benchmarks that fork processes).
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'turbo_ai.settings')
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    if database_file:
+        connection.settings_dict['TEST']['NAME'] = database_file
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    logging.disable(logging.INFO)
+
+
+@contextmanager
+def timer(samples: List[float]) -> Iterator[None]:
+    """
+    Appends the elapsed wall time of the block (in seconds) to samples.
+    """
+    start = time.perf_counter()
+    yield
+    samples.append(time.perf_counter() - start)
+
+
+def summarize(name: str, samples: List[float]) -> str:
+    """
+    Formats p50/p95/max of timing samples in milliseconds.
+    """
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (
+        f'{name}: n={len(samples)} '
+        f'p50={statistics.median(ordered) * 1000:.2f}ms '
+        f'p95={p95 * 1000:.2f}ms '
+        f'max={ordered[-1] * 1000:.2f}ms'
+    )
@@ -0,0 +1,105 @@
+"""
+Local stand-in for the OpenAI chat completions API, used by the LLM benchmarks.
+
+Answers per-category prompts with a JSON array and function-calling requests with
+the function arguments, sleeping for a simulated latency. Token usage is estimated
+at 4 characters per token and accumulated in StubServer.usage.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_LATENCY = 0.25
+LATENCY_PER_TOKEN = 0.002
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (4 characters per token).
+    """
+    return max(1, len(text) // 4)
+
+
+def fake_notes(category: str) -> list:
+    """
+    Returns three deterministic notes for a category.
+    """
+    return [
+        {'title': f'{category} idea {i}', 'content': f'A short generated note number {i} about {category}.'}
+        for i in range(1, 4)
+    ]
+
+
+class StubServer:
+    """
+    Runs the stub on a background thread. Use as a context manager.
+    """
+
+    def __init__(self) -> None:
+        self.usage = {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self.handler_class())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def api_base(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}/v1'
+
+    def reset(self) -> None:
+        with self.lock:
+            for key in self.usage:
+                self.usage[key] = 0
+
+    def __enter__(self) -> 'StubServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.httpd.shutdown()
+
+    def handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                prompt_text = json.dumps(body['messages']) + json.dumps(body.get('functions', ''))
+                message = {'role': 'assistant', 'content': None}
+
+                if body.get('functions'):
+                    names = list(body['functions'][0]['parameters']['properties'])
+                    arguments = json.dumps({name: fake_notes(name) for name in names})
+                    message['function_call'] = {'name': body['functions'][0]['name'], 'arguments': arguments}
+                    output = arguments
+                else:
+                    prompt = body['messages'][-1]['content']
+                    category = prompt.split('category: "', 1)[1].split('"', 1)[0]
+                    output = json.dumps(fake_notes(category))
+                    message['content'] = output
+
+                prompt_tokens = estimate_tokens(prompt_text)
+                completion_tokens = estimate_tokens(output)
+                time.sleep(BASE_LATENCY + completion_tokens * LATENCY_PER_TOKEN)
+                with server.lock:
+                    server.usage['requests'] += 1
+                    server.usage['prompt_tokens'] += prompt_tokens
+                    server.usage['completion_tokens'] += completion_tokens
+
+                payload = json.dumps({
+                    'id': 'stub',
+                    'object': 'chat.completion',
+                    'choices': [{'index': 0, 'message': message, 'finish_reason': 'stop'}],
+                    'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens},
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
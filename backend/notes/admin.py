@@ -3,9 +3,29 @@ Admin site registrations for 'notes' application.
 Enables Category and Note models to be managed in the Django admin.
 """
 
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from django.utils import timezone
 
-from .models import Category, Note
+from .deletion import schedule_category_deletion, schedule_user_deletion
+from .models import ArchivedNote, Category, DeletionJob, Note, Task
+from .pagination import EstimatedCountPaginator
+
+
+@admin.action(description='Delete selected in the background')
+def delete_in_background(modeladmin, request, queryset) -> None:
+    """
+    Schedules a deferred deletion job per selected user or category.
+    """
+    schedule = schedule_user_deletion if queryset.model is User else schedule_category_deletion
+    for obj in queryset:
+        schedule(obj)
+    modeladmin.message_user(
+        request,
+        f'Scheduled background deletion of {queryset.count()} item(s).',
+        messages.SUCCESS
+    )
 
 
 @admin.register(Category)
@@ -13,7 +33,14 @@ class CategoryAdmin(admin.ModelAdmin):
     """
     Admin configuration for Category model.
     """
-    list_display = ('id', 'user', 'name', 'color')
+    list_display = ('id', 'user', 'name', 'color', 'deleted_at')
+    list_select_related = ('user',)
+    list_filter = (('deleted_at', admin.EmptyFieldListFilter),)
+    search_fields = ('=name', '=user__username')
+    raw_id_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = [delete_in_background]
 
 
 @admin.register(Note)
@@ -22,3 +49,68 @@ class NoteAdmin(admin.ModelAdmin):
     Admin configuration for Note model.
     """
     list_display = ('id', 'user', 'title', 'category', 'created_at', 'updated_at')
+    # Category.__str__ reads the category's user, so that join is needed too.
+    list_select_related = ('user', 'category', 'category__user')
+    list_filter = ('updated_at',)
+    search_fields = ('=title', '=user__username')
+    raw_id_fields = ('user', 'category')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(ArchivedNote)
+class ArchivedNoteAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for archived (cold) notes.
+    """
+    list_display = ('id', 'user', 'title', 'category', 'updated_at', 'archived_at')
+    list_select_related = ('user', 'category', 'category__user')
+    search_fields = ('=title', '=user__username')
+    raw_id_fields = ('user', 'category')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    """
+    Read-only progress view of deferred deletion jobs.
+    """
+    list_display = ('id', 'kind', 'target_id', 'status', 'processed', 'total', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = [field.name for field in DeletionJob._meta.fields]
+
+
+@admin.action(description='Retry selected tasks now')
+def retry_tasks(modeladmin, request, queryset) -> None:
+    """
+    Queues failed tasks again with a fresh set of attempts.
+    """
+    count = queryset.filter(status=Task.STATUS_FAILED).update(
+        status=Task.STATUS_QUEUED,
+        attempts=0,
+        run_after=timezone.now()
+    )
+    modeladmin.message_user(request, f'Queued {count} task(s) again.', messages.SUCCESS)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    """
+    Read-only view of the task queue (see notes/tasks.py), with retries of failed tasks.
+    """
+    list_display = ('id', 'name', 'priority', 'status', 'attempts', 'max_attempts', 'run_after', 'locked_by')
+    list_filter = ('status', 'name')
+    readonly_fields = [field.name for field in Task._meta.fields]
+    actions = [retry_tasks]
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class NotesUserAdmin(UserAdmin):
+    """
+    Default user admin plus background deletion for users with many notes.
+    """
+    actions = [delete_in_background]
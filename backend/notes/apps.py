@@ -9,13 +9,33 @@ class NotesConfig(AppConfig):
     """
     Configuration class for the notes app.
     """
-    default_auto_field = 'django.db.models.BigAutoField'
+    default_auto_field = 'notes.fields.ShardedAutoField'
     name = 'notes'
 
     def ready(self) -> None:
         """
         Override this method if you need to run code when Django starts.
         (E.g., to connect signals.)
+        Registers the system checks, starts the background warm-up that /readyz waits
+        for, and makes buffered autosave edits get written on shutdown.
         """
         # import notes.signals  # uncomment if you have signals
-        pass
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.core.checks import register
+        from django.db.models.signals import post_migrate, post_save, pre_delete
+
+        from . import autosave, checks, sharding, warmup
+
+        register(checks.check_list_cache)
+        register(checks.check_autosave_cache)
+        register(checks.check_throttle_cache)
+
+        post_save.connect(sharding.user_saved, sender=User, dispatch_uid='notes_shard_user_saved')
+        pre_delete.connect(sharding.user_deleted, sender=User, dispatch_uid='notes_shard_user_deleted')
+        post_migrate.connect(sharding.prepare_after_migrate, sender=self, dispatch_uid='notes_shard_prepare')
+
+        if autosave.is_enabled():
+            autosave.install_shutdown_hooks()
+        if settings.NOTES_WARMUP_ON_STARTUP:
+            warmup.start()
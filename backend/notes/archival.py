@@ -0,0 +1,133 @@
+"""
+Archival of cold notes.
+
+Notes not updated for NOTES_ARCHIVE_AFTER_DAYS are moved, in batches of
+NOTES_ARCHIVE_BATCH_SIZE, from the hot Note table to ArchivedNote, keeping their ids.
+This keeps the hot table and its indexes sized by recent activity. Reads stay
+transparent: NoteViewSet lists and searches both tables and serves archived notes
+by id. Writing to an archived note first moves it back (rehydrate()).
+
+Revision history is not archived: a note's revisions are dropped when it is moved,
+and a rehydrated note starts a new history from its archived content. The same
+goes for duplicate-detection fingerprints and search embeddings, which are
+rebuilt on rehydration.
+
+Run the mover periodically with `python manage.py archive_notes`.
+"""
+
+import heapq
+import logging
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import sharding
+from .caching import invalidate_notes_list
+from .embeddings import schedule_refresh
+from .fields import MARKER
+from .fingerprints import index_note
+from .models import ArchivedNote, Note
+
+logger = logging.getLogger(__name__)
+
+# Columns copied between the hot and the archive table.
+NOTE_FIELDS = ['id', 'user_id', 'category_id', 'title', 'content', 'created_at', 'updated_at', 'client_id']
+
+
+def archive_cutoff(days: Optional[int] = None):
+    """
+    Returns the updated_at before which notes are archived.
+    """
+    days = settings.NOTES_ARCHIVE_AFTER_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_batch(cutoff, batch_size: int) -> int:
+    """
+    Moves up to batch_size notes last updated before cutoff, oldest first, in one
+    transaction. Notes updated while the batch runs, and those of users being moved
+    to another shard, stay hot. Returns the number moved.
+    """
+    with sharding.atomic():
+        rows = list(
+            Note.objects.filter(updated_at__lt=cutoff)
+            .exclude(user_id__in=sharding.moving_users())
+            .order_by('updated_at')
+            .values(*NOTE_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        ids = [row['id'] for row in rows]
+
+        with sharding.keep_sequence(ArchivedNote, sharding.current()):
+            ArchivedNote.objects.bulk_create([ArchivedNote(**row) for row in rows])
+        Note.objects.filter(id__in=ids, updated_at__lt=cutoff).delete()
+        still_hot = list(Note.objects.filter(id__in=ids).values_list('id', flat=True))
+        if still_hot:
+            ArchivedNote.objects.filter(id__in=still_hot).delete()
+
+        for user_id in {row['user_id'] for row in rows}:
+            invalidate_notes_list(user_id)
+    return len(rows) - len(still_hot)
+
+
+def archive_notes(cutoff=None, batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> int:
+    """
+    Archives notes in batches until none are left (or max_batches ran). Returns the number moved.
+    """
+    cutoff = archive_cutoff() if cutoff is None else cutoff
+    batch_size = batch_size or settings.NOTES_ARCHIVE_BATCH_SIZE
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            break
+        moved += count
+        batches += 1
+        logger.debug(f"Archived batch {batches} ({count} notes)")
+    logger.info(f"Archived {moved} notes last updated before {cutoff:%Y-%m-%d}")
+    return moved
+
+
+def rehydrate(archived: ArchivedNote) -> Note:
+    """
+    Moves an archived note back to the hot table (with the same id) and returns it.
+    """
+    note_id = archived.id
+    with sharding.atomic(), sharding.keep_sequence(Note, archived._state.db):
+        Note.objects.bulk_create([Note(**{field: getattr(archived, field) for field in NOTE_FIELDS})])
+        # auto_now overwrote the timestamps on insert; keep the archived ones.
+        Note.objects.filter(id=note_id).update(
+            created_at=archived.created_at,
+            updated_at=archived.updated_at
+        )
+        archived.delete()
+        note = Note.objects.get(id=note_id)
+        index_note(note)
+        schedule_refresh(note.user_id)
+    logger.info(f"Rehydrated archived note {note_id}")
+    return note
+
+
+def search_filter(queryset, term: str):
+    """
+    Restricts a Note or ArchivedNote queryset to rows whose title or content contains term.
+    Compressed content (see notes/fields.py) is never matched in SQL, where only its
+    encoded form is visible: those rows are decompressed and matched here instead.
+    """
+    compressed = Q(content__startswith=MARKER)
+    needle = term.lower()
+    unpacked = queryset.filter(compressed).exclude(title__icontains=term).values_list('id', 'content')
+    found = [note_id for note_id, content in unpacked if needle in content.lower()]
+    return queryset.filter(Q(title__icontains=term) | (Q(content__icontains=term) & ~compressed) | Q(pk__in=found))
+
+
+def merge_by_updated(hot: Iterable, archived: Iterable) -> list:
+    """
+    Merges two lists already ordered by -updated_at into one.
+    """
+    return list(heapq.merge(hot, archived, key=lambda note: note.updated_at, reverse=True))
@@ -0,0 +1,345 @@
+"""
+Write coalescing for editor autosave bursts.
+
+The editor saves a note on nearly every pause in typing. With NOTES_AUTOSAVE_INTERVAL
+set, a title or content edit of a note whose row was written less than that many
+seconds ago is not written: it is kept in a buffer (an entry per note in the
+NOTES_AUTOSAVE_CACHE cache) and written, merged with any later edits, once the
+interval since the last write has passed. A note is therefore written at most once
+per interval however fast it is edited, and records one revision per write.
+
+Reads see buffered edits: NoteViewSet lays the buffer over the notes it returns
+(overlay(), overlay_many()), and change events and list cache invalidation are sent
+for every edit as usual. Category changes, deletes and edits made after the interval
+are written at once (flushing the buffer first).
+
+Buffered edits are written by a thread of the process that buffered them, and
+by every process when it shuts down (atexit, and SIGTERM when install_shutdown_hooks()
+ran in the main thread). A buffer is only written if the note's row is older than
+its last edit, so a buffer never overwrites a later write. The cache must be shared
+by all processes serving the API (e.g. Redis) for them to see each other's buffers,
+and the notes.E001 system check refuses to start with a process-local one. A process
+killed outright loses the edits it buffered in the last interval.
+"""
+
+import atexit
+import logging
+import signal
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions, status
+
+from . import embeddings, metrics, sharding
+from .caching import invalidate_notes_list
+from .fields import make_preview
+from .fingerprints import index_note
+from .models import PREVIEW_LENGTH, Note
+from .revisions import record_revision
+
+logger = logging.getLogger(__name__)
+
+# Fields whose edits are buffered; anything else is written at once.
+FIELDS = ('title', 'content')
+# Seconds a buffer entry is locked for at most, and between lock attempts.
+LOCK_TIMEOUT = 5
+LOCK_POLL_INTERVAL = 0.01
+# Seconds to wait for a lock: long enough for one left by a crashed holder to expire.
+LOCK_WAIT = LOCK_TIMEOUT + 1
+
+metrics.describe('notes_autosave_edits_total', 'Note edits by autosave outcome (buffered or written).')
+metrics.describe('notes_autosave_flushes_total', 'Buffered note edits written to the database.')
+
+# Buffer entries this process wrote, by note id, with the time they are due.
+_pending: Dict[int, object] = {}
+_pending_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+_wake = threading.Event()
+_previous_sigterm = None
+
+
+class StaleEdit(Exception):
+    """
+    The note changed since the version an edit was made against.
+    """
+
+
+class BufferBusy(exceptions.APIException):
+    """
+    A note's buffer entry stayed locked by another process; the edit should be retried.
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('The note is being saved, please retry shortly.')
+    default_code = 'autosave_busy'
+    # DRF's exception handler sends this as Retry-After.
+    wait = 1
+
+
+def is_enabled() -> bool:
+    """
+    Whether edits are coalesced.
+    """
+    return settings.NOTES_AUTOSAVE_INTERVAL > 0
+
+
+def _cache():
+    return caches[settings.NOTES_AUTOSAVE_CACHE]
+
+
+def _key(note_id: int) -> str:
+    return f'notes:autosave:{note_id}'
+
+
+@contextmanager
+def _locked(note_id: int):
+    """
+    Serializes changes to a note's buffer entry across processes. A lock left by a
+    crashed holder expires after LOCK_TIMEOUT; raises BufferBusy if the lock is
+    still held after LOCK_WAIT.
+    """
+    key = f'notes:autosave-lock:{note_id}'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_WAIT
+    while not _cache().add(key, token, timeout=LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            raise BufferBusy()
+        time.sleep(LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        # Not if it expired and another process holds it now.
+        if _cache().get(key) == token:
+            _cache().delete(key)
+
+
+def _apply(note: Note, entry: dict) -> Note:
+    """
+    Lays a buffer entry over a note loaded from the database.
+    """
+    note.written_at = note.updated_at
+    for name, value in entry['fields'].items():
+        setattr(note, name, value)
+    if 'content' in entry['fields']:
+        note.preview = make_preview(note.content, PREVIEW_LENGTH)
+    note.updated_at = entry['updated_at']
+    note.autosave_entry = entry
+    return note
+
+
+def overlay(note):
+    """
+    Returns the note with its buffered edits applied. Other objects (e.g. archived
+    notes) are returned unchanged.
+    """
+    if not is_enabled() or not isinstance(note, Note):
+        return note
+    entry = _cache().get(_key(note.pk))
+    return _apply(note, entry) if entry is not None else note
+
+
+def overlay_many(notes: Iterable[Note]) -> List[Note]:
+    """
+    overlay() for many notes with one cache lookup, keeping them ordered by -updated_at.
+    """
+    notes = list(notes)
+    if not is_enabled() or not notes:
+        return notes
+    entries = _cache().get_many([_key(note.pk) for note in notes])
+    if not entries:
+        return notes
+    for note in notes:
+        entry = entries.get(_key(note.pk))
+        if entry is not None:
+            _apply(note, entry)
+    return sorted(notes, key=lambda note: note.updated_at, reverse=True)
+
+
+def should_coalesce(note) -> bool:
+    """
+    Whether an edit of the note should be buffered. When the note's buffer is due
+    it is written first and the edit is written at once.
+    """
+    if not is_enabled() or not isinstance(note, Note):
+        return False
+    entry = getattr(note, 'autosave_entry', None)
+    now = timezone.now()
+    if entry is not None:
+        if entry['due'] > now:
+            return True
+        flush(note.pk)
+        note.written_at = note.updated_at
+        note.autosave_entry = None
+        return False
+    written_at = getattr(note, 'written_at', note.updated_at)
+    return now - written_at < timedelta(seconds=settings.NOTES_AUTOSAVE_INTERVAL)
+
+
+def buffer(note: Note, previous_content: str, expected_version=None) -> None:
+    """
+    Buffers the note's current title and content (see module docstring).
+    previous_content is the content before this edit. With expected_version (the
+    updated_at the edit was made against, buffered edits included), raises StaleEdit
+    instead if the note has changed since.
+    """
+    now = timezone.now()
+    with _locked(note.pk):
+        entry = _cache().get(_key(note.pk))
+        if expected_version is not None:
+            if entry is not None:
+                version = entry['updated_at']
+            else:
+                version = Note.objects.filter(pk=note.pk).values_list('updated_at', flat=True).first()
+            if version != expected_version:
+                raise StaleEdit()
+        if entry is None:
+            written_at = getattr(note, 'written_at', note.updated_at)
+            entry = {
+                'user_id': note.user_id,
+                'previous_content': previous_content,
+                'due': written_at + timedelta(seconds=settings.NOTES_AUTOSAVE_INTERVAL),
+            }
+        entry['fields'] = {name: getattr(note, name) for name in FIELDS}
+        entry['updated_at'] = now
+        _cache().set(_key(note.pk), entry, timeout=None)
+    note.updated_at = now
+    note.autosave_entry = entry
+    metrics.inc('notes_autosave_edits_total', result='buffered')
+
+    with _pending_lock:
+        _pending[note.pk] = entry['due']
+    _start_flusher()
+
+
+def discard(note_id: int) -> None:
+    """
+    Drops the buffered edits of a deleted note.
+    """
+    if not is_enabled():
+        return
+    with _locked(note_id):
+        _cache().delete(_key(note_id))
+    with _pending_lock:
+        _pending.pop(note_id, None)
+
+
+def flush(note_id: int) -> bool:
+    """
+    Writes a note's buffered edits, if any, keeping the time of the last edit as
+    updated_at. Edits older than the note's row (written meanwhile, e.g. by another
+    process) are dropped. Returns whether anything was written.
+    """
+    with _pending_lock:
+        _pending.pop(note_id, None)
+    with _locked(note_id):
+        entry = _cache().get(_key(note_id))
+        if entry is None:
+            return False
+        user_id = entry['user_id']
+        fields = dict(entry['fields'])
+        if 'content' in fields:
+            fields['preview'] = make_preview(fields['content'], PREVIEW_LENGTH)
+        with sharding.for_user(user_id):
+            with sharding.atomic():
+                written = Note.objects.filter(pk=note_id, user_id=user_id, updated_at__lt=entry['updated_at']).update(
+                    updated_at=entry['updated_at'],
+                    **fields
+                )
+                note = Note.objects.filter(pk=note_id).first() if written else None
+                if note is not None:
+                    if note.content != entry['previous_content']:
+                        record_revision(note, previous_content=entry['previous_content'])
+                    index_note(note)
+                    invalidate_notes_list(user_id)
+                    embeddings.schedule_refresh(user_id)
+        _cache().delete(_key(note_id))
+    if note is None:
+        logger.info(f"Dropped buffered edits of note {note_id}, which was deleted or written since")
+        return False
+    metrics.inc('notes_autosave_flushes_total')
+    return True
+
+
+def flush_due(now=None) -> int:
+    """
+    Writes the buffered edits of this process that are due. Returns how many notes were written.
+    """
+    now = now or timezone.now()
+    with _pending_lock:
+        due = [note_id for note_id, deadline in _pending.items() if deadline <= now]
+    return sum(_flush_logged(note_id) for note_id in due)
+
+
+def flush_all() -> int:
+    """
+    Writes every buffered edit of this process. Returns how many notes were written.
+    """
+    with _pending_lock:
+        note_ids = list(_pending)
+    count = sum(_flush_logged(note_id) for note_id in note_ids)
+    if note_ids:
+        logger.info(f"Flushed buffered edits of {count} notes")
+    return count
+
+
+def _flush_logged(note_id: int) -> bool:
+    try:
+        return flush(note_id)
+    except Exception:
+        # Kept for the next round (e.g. while the user's shard is being moved).
+        logger.exception(f"Could not write buffered edits of note {note_id}.")
+        with _pending_lock:
+            _pending.setdefault(note_id, timezone.now())
+        return False
+
+
+def _run_flusher() -> None:
+    """
+    Writes due buffers every half interval until the process exits.
+    """
+    while True:
+        _wake.wait(settings.NOTES_AUTOSAVE_INTERVAL / 2)
+        _wake.clear()
+        try:
+            flush_due()
+        finally:
+            connections.close_all()
+
+
+def _start_flusher() -> None:
+    """
+    Lazily starts this process's flusher thread.
+    """
+    global _flusher
+    with _pending_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run_flusher, name='notes-autosave', daemon=True)
+            _flusher.start()
+
+
+def _on_sigterm(signum, frame) -> None:
+    flush_all()
+    if callable(_previous_sigterm):
+        _previous_sigterm(signum, frame)
+    else:
+        raise SystemExit(128 + signum)
+
+
+def install_shutdown_hooks() -> None:
+    """
+    Flushes the buffer when the process exits: at interpreter exit and, when called
+    from the main thread, on SIGTERM (whose default action skips atexit).
+    """
+    global _previous_sigterm
+    atexit.register(flush_all)
+    if threading.current_thread() is threading.main_thread():
+        _previous_sigterm = signal.getsignal(signal.SIGTERM)
+        signal.signal(signal.SIGTERM, _on_sigterm)
@@ -0,0 +1,66 @@
+"""
+Minimal in-process background runner for work that must not block a request.
+Work is started only after the surrounding transaction commits.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from . import sharding
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Lazily creates the shared thread pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.NOTES_BACKGROUND_WORKERS,
+                thread_name_prefix='notes-background'
+            )
+    return _executor
+
+
+def _run(shard: str, owner: Optional[int], func: Callable, args: tuple, kwargs: dict) -> None:
+    """
+    Runs a job in a worker thread on the shard it was submitted from, logging
+    failures and releasing the thread's database connections afterwards.
+    """
+    try:
+        with sharding.use_shard(shard, owner):
+            func(*args, **kwargs)
+    except Exception:
+        logger.exception(f"Background job {func.__name__} failed.")
+    finally:
+        connections.close_all()
+
+
+def submit(func: Callable, *args, **kwargs) -> None:
+    """
+    Schedules func(*args, **kwargs) to run once the current transaction commits.
+    With NOTES_BACKGROUND_EAGER the job runs inline, which tests rely on.
+    The job runs with the submitting code's shard active, writing for the same user.
+    """
+    shard = sharding.current()
+    owner = sharding.current_owner()
+
+    def start() -> None:
+        if settings.NOTES_BACKGROUND_EAGER:
+            with sharding.use_shard(shard, owner):
+                func(*args, **kwargs)
+        else:
+            _get_executor().submit(_run, shard, owner, func, args, kwargs)
+
+    sharding.on_commit(start)
@@ -0,0 +1,148 @@
+"""
+Batch execution of API operations (POST /api/v1/batch/).
+
+A batch is a list of ordinary API calls, answered in order:
+
+    {"operations": [
+        {"method": "GET", "path": "/api/v1/notes/?view=preview"},
+        {"method": "GET", "path": "/api/v1/categories/"},
+        {"method": "POST", "path": "/api/v1/notes/", "body": {"client_id": "n-1", "title": "Hi"}},
+        {"method": "PATCH", "path": "/api/v1/notes/client:n-1/", "body": {"content": "..."}}
+    ]}
+
+Each operation is dispatched to the view serving its path, as the batch's user, so
+validation, permissions, throttling and side effects are those of the single call.
+Only the views a BatchView allows can be reached. All operations run in one
+transaction and the first failing one rolls the whole batch back. A DELETE answered
+with 404 does not count as a failure, since the object is gone either way; together
+with client ids (see ClientIdMixin) this makes replaying a batch whose response was
+lost safe. Change events, cache invalidation and other after-commit work only
+happen when the batch commits.
+"""
+
+import io
+import json
+from collections import namedtuple
+from typing import List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework.request import Request
+
+from . import sharding
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Request metadata describing the batch's own body, replaced for every operation.
+# The batch's Idempotency-Key is dropped too: operations must not replay each other.
+BODY_META = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'QUERY_STRING', 'wsgi.input', 'HTTP_IDEMPOTENCY_KEY')
+
+Operation = namedtuple('Operation', ['method', 'path', 'query', 'body', 'match'])
+
+
+class BatchError(ValueError):
+    """
+    Raised when a batch or one of its operations is malformed.
+    """
+
+
+class _Abort(Exception):
+    """
+    Raised inside the batch transaction to roll it back.
+    """
+
+
+def parse_operations(data, allowed: Sequence[type], max_operations: int) -> List[Operation]:
+    """
+    Validates the request body of a batch and resolves each operation's view.
+    """
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise BatchError('operations must be a non-empty list.')
+    if len(operations) > max_operations:
+        raise BatchError(f'A batch holds at most {max_operations} operations.')
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise BatchError(f'Operation {index} must be an object.')
+        method = str(operation.get('method', 'GET')).upper()
+        if method not in METHODS:
+            raise BatchError(f'Operation {index}: method must be one of {", ".join(METHODS)}.')
+        url = urlsplit(str(operation.get('path', '')))
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            match = None
+        if match is None or getattr(match.func, 'cls', None) not in allowed:
+            raise BatchError(f'Operation {index}: {url.path or "(no path)"} cannot be used in a batch.')
+        parsed.append(Operation(method, url.path, url.query, operation.get('body'), match))
+    return parsed
+
+
+def _sub_request(request: Request, operation: Operation) -> HttpRequest:
+    """
+    Builds the HttpRequest of one operation from the batch request.
+    """
+    raw = b'' if operation.body is None else json.dumps(operation.body).encode('utf-8')
+    inner = HttpRequest()
+    inner.method = operation.method
+    inner.path = inner.path_info = operation.path
+    inner.META = {key: value for key, value in request.META.items() if key not in BODY_META}
+    inner.META.update(
+        REQUEST_METHOD=operation.method,
+        PATH_INFO=operation.path,
+        QUERY_STRING=operation.query,
+        CONTENT_TYPE='application/json',
+        CONTENT_LENGTH=str(len(raw))
+    )
+    inner.GET = QueryDict(operation.query)
+    inner.COOKIES = request.COOKIES
+    inner.resolver_match = operation.match
+    inner._stream = io.BytesIO(raw)
+    inner._read_started = False
+    # The batch is already authenticated; DRF's forced authentication skips the token lookup.
+    inner._force_auth_user = request.user
+    inner._force_auth_token = request.auth
+    return inner
+
+
+def run_operation(request: Request, operation: Operation) -> dict:
+    """
+    Dispatches one operation to its view and returns {'status': ..., 'body': ...}.
+    """
+    match = operation.match
+    response = match.func(_sub_request(request, operation), *match.args, **match.kwargs)
+    if hasattr(response, 'data'):
+        body = response.data
+    else:
+        # Plain responses, e.g. a notes list served from the cache (see notes/caching.py).
+        body = json.loads(response.content) if response.content else None
+    return {'status': response.status_code, 'body': body}
+
+
+def is_failure(operation: Operation, result: dict) -> bool:
+    """
+    Whether a result aborts the batch.
+    """
+    if operation.method == 'DELETE' and result['status'] == 404:
+        return False
+    return result['status'] >= 400
+
+
+def run_batch(request: Request, operations: Sequence[Operation]) -> Tuple[List[dict], Optional[int]]:
+    """
+    Runs the operations in order in one transaction. Returns the results and the index
+    of the operation that failed (and rolled everything back), or None.
+    """
+    results = []
+    try:
+        with sharding.atomic():
+            for index, operation in enumerate(operations):
+                result = run_operation(request, operation)
+                results.append(result)
+                if is_failure(operation, result):
+                    raise _Abort(index)
+    except _Abort as abort:
+        return results, abort.args[0]
+    return results, None
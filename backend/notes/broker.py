@@ -0,0 +1,224 @@
+"""
+Per-user change event brokers for realtime push (see notes/realtime.py).
+
+InProcessBroker fans events out to the connections held by this process.
+PubSubBroker adds the cross-process hop: events are published to a pub/sub
+transport and every process runs a single listener that hands them to its own
+InProcessBroker, so one transport connection serves all clients of a pod.
+
+    NOTES_REALTIME_BROKER      'local' (this process only) or 'redis'
+    NOTES_REALTIME_REDIS_URL   Redis URL used by the 'redis' broker
+    NOTES_REALTIME_QUEUE_SIZE  events buffered per connection before it is told to resync
+
+Events are dicts: {'type': '<model>.<action>', 'id': pk, 'data': serialized object or None}.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Optional, Set
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import sharding
+
+logger = logging.getLogger(__name__)
+
+RESYNC_EVENT = {'type': 'resync', 'id': None, 'data': None}
+
+
+def make_event(model: str, action: str, pk, data: Optional[dict] = None) -> dict:
+    """
+    Builds a change event, e.g. make_event('note', 'updated', 5, {...}).
+    """
+    return {'type': f'{model}.{action}', 'id': pk, 'data': data}
+
+
+class Subscription:
+    """
+    One connection's view of a user's event stream, bound to the connection's event loop.
+    If the consumer falls more than the queue size behind, the backlog is replaced by
+    a single resync event telling the client to refetch.
+    """
+
+    def __init__(self, broker: 'InProcessBroker', user_id: int, maxsize: int) -> None:
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def deliver(self, event: dict) -> None:
+        """
+        Queues an event; must run on self.loop.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_EVENT)
+
+    async def get(self) -> dict:
+        """
+        Waits for the next event.
+        """
+        return await self.queue.get()
+
+    def close(self) -> None:
+        """
+        Stops receiving events.
+        """
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Fans events out to the subscriptions of this process. publish() is thread-safe
+    and may be called from sync request threads.
+    """
+
+    def __init__(self) -> None:
+        self._subscriptions: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """
+        Subscribes the calling coroutine's event loop to a user's events.
+        """
+        subscription = Subscription(self, user_id, settings.NOTES_REALTIME_QUEUE_SIZE)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Removes a subscription; safe to call more than once.
+        """
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def connection_count(self) -> int:
+        """
+        Returns the number of open subscriptions.
+        """
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def publish(self, user_id: int, event: dict) -> None:
+        """
+        Delivers an event to every subscription of the user in this process.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The connection's loop is closed; drop the stale subscription.
+                self.unsubscribe(subscription)
+
+
+class LocalPubSub:
+    """
+    In-memory pub/sub transport. Brokers sharing one instance behave like processes
+    sharing a Redis server; used as the stand-in for tests.
+    """
+
+    def __init__(self) -> None:
+        self._callbacks = defaultdict(list)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        self._callbacks[channel].append(callback)
+
+    def publish(self, channel: str, message: str) -> None:
+        for callback in list(self._callbacks[channel]):
+            callback(message)
+
+
+class RedisPubSub:
+    """
+    Redis pub/sub transport. The redis package is only needed when this is used.
+    """
+
+    def __init__(self, url: str) -> None:
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{channel: lambda message: callback(message['data'])})
+        pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def publish(self, channel: str, message: str) -> None:
+        self._client.publish(channel, message)
+
+
+class PubSubBroker:
+    """
+    Cross-process broker: publishes through a transport and delivers what the
+    transport receives to the local subscriptions.
+    """
+    channel = 'notes:events'
+
+    def __init__(self, transport, local: Optional[InProcessBroker] = None) -> None:
+        self.transport = transport
+        self.local = local or InProcessBroker()
+        transport.subscribe(self.channel, self._receive)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        return self.local.subscribe(user_id)
+
+    def connection_count(self) -> int:
+        return self.local.connection_count()
+
+    def publish(self, user_id: int, event: dict) -> None:
+        self.transport.publish(self.channel, json.dumps({'user_id': user_id, 'event': event}, cls=DjangoJSONEncoder))
+
+    def _receive(self, message) -> None:
+        try:
+            payload = json.loads(message)
+            self.local.publish(payload['user_id'], payload['event'])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed realtime message: {str(message)[:80]!r}")
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Returns this process's broker, creating it from NOTES_REALTIME_BROKER on first use.
+    """
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            if settings.NOTES_REALTIME_BROKER == 'redis':
+                _broker = PubSubBroker(RedisPubSub(settings.NOTES_REALTIME_REDIS_URL))
+            else:
+                _broker = InProcessBroker()
+    return _broker
+
+
+def publish_change(user_id: int, model: str, action: str, pk, data: Optional[dict] = None) -> None:
+    """
+    Publishes a change event once the current transaction commits.
+    Broker failures are logged and never fail the request.
+    """
+    event = make_event(model, action, pk, data)
+
+    def send() -> None:
+        try:
+            get_broker().publish(user_id, event)
+        except Exception:
+            logger.exception(f"Failed to publish realtime event {event['type']} for user {user_id}.")
+
+    sharding.on_commit(send)
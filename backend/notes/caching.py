@@ -0,0 +1,99 @@
+"""
+Per-user cache of rendered notes list responses.
+
+Each user has a version stamp; cached bodies are keyed by (user, stamp, query string),
+so bumping the stamp invalidates every cached list of that user at once without
+having to find the keys. Stamps are bumped after commit by every write path that
+changes what the list shows (see invalidate_notes_list callers).
+
+    NOTES_LIST_CACHE_ENABLED  turn the cache on or off
+    NOTES_LIST_CACHE          cache alias storing stamps and bodies, shared by every process
+                              serving the API (a process-local cache serves other processes' writes stale)
+    NOTES_LIST_CACHE_TIMEOUT  seconds a body is kept (bounds staleness from unhooked writes, e.g. the admin)
+"""
+
+import hashlib
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics, sharding
+
+metrics.describe('notes_list_cache_requests_total', 'Notes list requests by cache result (hit or miss).')
+
+
+def _cache():
+    """
+    Returns the cache storing stamps and bodies.
+    """
+    return caches[settings.NOTES_LIST_CACHE]
+
+
+def _version_key(user_id: int) -> str:
+    return f'notes:list-version:{user_id}'
+
+
+def _new_version() -> int:
+    """
+    Returns a fresh stamp. Stamps start from the clock, so a stamp lost to eviction
+    is never reissued with an old body still cached under it.
+    """
+    return time.time_ns()
+
+
+def get_version(user_id: int) -> int:
+    """
+    Returns the user's current stamp, creating one if needed.
+    """
+    cache = _cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), _new_version(), timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def bump_version(user_id: int) -> None:
+    """
+    Moves the user to a new stamp, orphaning all cached lists.
+    """
+    cache = _cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), _new_version(), timeout=None)
+
+
+def invalidate_notes_list(user_id: int) -> None:
+    """
+    Bumps the user's stamp once the current transaction commits (at once outside one).
+    Bumping before commit would let a concurrent reader cache the old rows under the new stamp.
+    """
+    if settings.NOTES_LIST_CACHE_ENABLED:
+        sharding.on_commit(lambda: bump_version(user_id))
+
+
+def list_cache_key(user_id: int, query_string: str) -> str:
+    """
+    Returns the cache key of a list response for the user's current stamp.
+    """
+    digest = hashlib.md5(query_string.encode()).hexdigest()
+    return f'notes:list:{user_id}:{get_version(user_id)}:{digest}'
+
+
+def get_cached_list(key: str) -> Optional[bytes]:
+    """
+    Returns a cached rendered body and records the hit or miss.
+    """
+    body = _cache().get(key)
+    metrics.inc('notes_list_cache_requests_total', result='miss' if body is None else 'hit')
+    return body
+
+
+def store_list(key: str, body: bytes) -> None:
+    """
+    Caches a rendered body.
+    """
+    _cache().set(key, body, timeout=settings.NOTES_LIST_CACHE_TIMEOUT)
@@ -0,0 +1,61 @@
+"""
+System checks for settings that are only safe with a cache shared by every process.
+"""
+
+from django.conf import settings
+from django.core.checks import Error, Warning
+
+# Cache backends whose entries other processes (or pods) do not see.
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+
+
+def is_process_local(alias: str) -> bool:
+    """
+    Whether a cache alias keeps its entries per process (or per host).
+    """
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_BACKENDS
+
+
+def check_list_cache(app_configs=None, **kwargs) -> list:
+    """
+    Warns when the notes list cache is on but not shared, so one process's writes
+    leave the lists cached by the others stale for NOTES_LIST_CACHE_TIMEOUT.
+    """
+    if not settings.NOTES_LIST_CACHE_ENABLED or not is_process_local(settings.NOTES_LIST_CACHE):
+        return []
+    return [Warning(
+        f'The notes list cache is enabled on the process-local cache "{settings.NOTES_LIST_CACHE}".',
+        hint='Set NOTES_CACHE_REDIS_URL, or NOTES_LIST_CACHE_ENABLED=0 when more than one process serves the API.',
+        id='notes.W001'
+    )]
+
+
+def check_autosave_cache(app_configs=None, **kwargs) -> list:
+    """
+    Refuses edit coalescing on a process-local cache, where processes would not see
+    each other's buffers and could write a note's older edits over its newer ones.
+    """
+    if settings.NOTES_AUTOSAVE_INTERVAL <= 0 or not is_process_local(settings.NOTES_AUTOSAVE_CACHE):
+        return []
+    return [Error(
+        f'Autosave coalescing is enabled on the process-local cache "{settings.NOTES_AUTOSAVE_CACHE}".',
+        hint='Set NOTES_CACHE_REDIS_URL, or NOTES_AUTOSAVE_INTERVAL=0.',
+        id='notes.E001'
+    )]
+
+
+def check_throttle_cache(app_configs=None, **kwargs) -> list:
+    """
+    Warns when throttle buckets and concurrency slots are kept per process, so every
+    process enforces the configured limits on its own and the real limits are multiplied.
+    """
+    if not settings.NOTES_THROTTLE_ENABLED or not is_process_local(settings.NOTES_THROTTLE_CACHE):
+        return []
+    return [Warning(
+        f'Throttling is enabled on the process-local cache "{settings.NOTES_THROTTLE_CACHE}".',
+        hint='Set NOTES_CACHE_REDIS_URL so the limits are shared by every process.',
+        id='notes.W002'
+    )]
@@ -0,0 +1,246 @@
+"""
+Precomputed per-user dashboard summary.
+
+The dashboard shows the user's categories with their colors and note counts, the
+number of uncategorized notes and the most recent notes. Computing that means
+scanning the user's notes, so it is kept in a DashboardSummary row instead,
+built on first use and updated in place by every note and category write:
+
+    note_created / notes_created   count +1, note enters the recent list
+    note_updated                   count moves on a category change, note moves to the top
+    note_deleted                   count -1, the recent list is refilled if needed
+    category_saved                 name and color
+    category_removed               its count moves to uncategorized
+
+Counts include archived notes, so archival and rehydration change nothing. Notes in a
+category pending deferred deletion count as uncategorized. A dashboard load is then
+one primary-key lookup. `python manage.py rebuild_dashboards` recomputes summaries
+from the notes, e.g. after bulk changes made outside these hooks.
+"""
+
+import logging
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils.dateparse import parse_datetime
+from rest_framework.fields import DateTimeField
+
+from . import autosave, sharding
+from .archival import merge_by_updated
+from .fields import make_preview
+from .models import PREVIEW_LENGTH, ArchivedNote, Category, DashboardSummary, Note
+
+logger = logging.getLogger(__name__)
+
+_timestamp = DateTimeField()
+
+
+def _recent_item(note) -> dict:
+    """
+    Returns the recent list entry of a note.
+    """
+    preview = note.preview
+    if 'content' not in note.get_deferred_fields():
+        # Buffered autosave edits change content without refreshing the stored preview.
+        preview = make_preview(note.content, PREVIEW_LENGTH)
+    return {
+        'id': note.id,
+        'title': note.title,
+        'preview': preview,
+        'category_id': note.category_id,
+        'updated_at': _timestamp.to_representation(note.updated_at),
+    }
+
+
+def _by_recency(item: dict):
+    """
+    Sort key of recent list entries.
+    """
+    return parse_datetime(item['updated_at']), item['id']
+
+
+def _bucket_add(summary: DashboardSummary, category_id: Optional[int], delta: int) -> None:
+    """
+    Adds delta to a category's count, or to the uncategorized count if the category is not listed.
+    """
+    for entry in summary.categories:
+        if entry['id'] == category_id:
+            entry['note_count'] = max(entry['note_count'] + delta, 0)
+            return
+    summary.uncategorized_count = max(summary.uncategorized_count + delta, 0)
+
+
+def _put_recent(summary: DashboardSummary, notes: Iterable) -> None:
+    """
+    Inserts or replaces notes in the recent list, keeping the newest NOTES_DASHBOARD_RECENT_NOTES.
+    """
+    items = {item['id']: item for item in summary.recent_notes}
+    items.update((note.id, _recent_item(note)) for note in notes)
+    limit = settings.NOTES_DASHBOARD_RECENT_NOTES
+    summary.recent_notes = sorted(items.values(), key=_by_recency, reverse=True)[:limit]
+
+
+def _recent_notes(user_id: int) -> list:
+    """
+    Returns the recent list entries read from the notes, hot and archived.
+    """
+    limit = settings.NOTES_DASHBOARD_RECENT_NOTES
+    hot = Note.objects.filter(user_id=user_id).order_by('-updated_at').defer('content')[:limit]
+    archived = ArchivedNote.objects.filter(user_id=user_id).order_by('-updated_at').defer('content')[:limit]
+    notes = merge_by_updated(autosave.overlay_many(hot), archived)[:limit]
+    return [_recent_item(note) for note in notes]
+
+
+def _change(user_id: int, apply: Callable[[DashboardSummary], None]) -> None:
+    """
+    Applies a change to the user's summary under a row lock. Users without a summary
+    get theirs built, from the committed notes, on their next dashboard load. Inside a
+    write's transaction no savepoint is needed: a failure rolls the write back too.
+    """
+    with sharding.atomic(savepoint=False):
+        summary = DashboardSummary.objects.select_for_update().filter(user_id=user_id).first()
+        if summary is None:
+            return
+        apply(summary)
+        summary.save()
+
+
+def _counts(user_id: int) -> Counter:
+    """
+    Returns the user's note counts (hot and archived) by category id, None for uncategorized.
+    """
+    counts = Counter()
+    for model in (Note, ArchivedNote):
+        rows = model.objects.filter(user_id=user_id).values('category_id').annotate(count=Count('pk')).order_by()
+        for row in rows:
+            counts[row['category_id']] += row['count']
+    return counts
+
+
+def build(user_id: int) -> DashboardSummary:
+    """
+    Computes the user's summary from the notes and categories and stores it. The row
+    is created, or locked, before the notes are read and in the same transaction, so
+    a write racing the build is either among the notes read or waits for the lock and
+    is then applied to the built summary by its hook.
+    """
+    with sharding.atomic():
+        summary, _ = DashboardSummary.objects.select_for_update().get_or_create(user_id=user_id)
+        counts = _counts(user_id)
+        summary.note_count = sum(counts.values())
+        summary.categories = [
+            {
+                'id': category.id,
+                'name': category.name,
+                'color': category.color,
+                'note_count': counts.pop(category.id, 0)
+            }
+            for category in Category.objects.filter(user_id=user_id, deleted_at__isnull=True).order_by('id')
+        ]
+        summary.uncategorized_count = sum(counts.values())
+        summary.recent_notes = _recent_notes(user_id)
+        summary.save()
+    logger.debug(f"Dashboard summary built for user {user_id}")
+    return summary
+
+
+def rebuild_all() -> int:
+    """
+    Rebuilds every existing summary of the active shard. Returns how many were rebuilt.
+    """
+    user_ids = list(DashboardSummary.objects.values_list('user_id', flat=True))
+    for user_id in user_ids:
+        build(user_id)
+    return len(user_ids)
+
+
+def get_summary(user_id: int) -> DashboardSummary:
+    """
+    Returns the user's summary, building it on first use.
+    """
+    return DashboardSummary.objects.filter(user_id=user_id).first() or build(user_id)
+
+
+def note_created(note) -> None:
+    """
+    Counts a new note and puts it in the recent list.
+    """
+    notes_created(note.user_id, [note])
+
+
+def notes_created(user_id: int, notes: list) -> None:
+    """
+    Counts new notes and puts them in the recent list.
+    """
+    if not notes:
+        return
+
+    def apply(summary: DashboardSummary) -> None:
+        for note in notes:
+            _bucket_add(summary, note.category_id, 1)
+        summary.note_count += len(notes)
+        _put_recent(summary, notes)
+
+    _change(user_id, apply)
+
+
+def note_updated(note, previous_category_id: Optional[int]) -> None:
+    """
+    Moves the note's count on a category change and the note to the top of the recent list.
+    """
+
+    def apply(summary: DashboardSummary) -> None:
+        if note.category_id != previous_category_id:
+            _bucket_add(summary, previous_category_id, -1)
+            _bucket_add(summary, note.category_id, 1)
+        _put_recent(summary, [note])
+
+    _change(note.user_id, apply)
+
+
+def note_deleted(user_id: int, note_id: int, category_id: Optional[int]) -> None:
+    """
+    Uncounts a deleted (hot or archived) note and drops it from the recent list.
+    """
+
+    def apply(summary: DashboardSummary) -> None:
+        _bucket_add(summary, category_id, -1)
+        summary.note_count = max(summary.note_count - 1, 0)
+        if any(item['id'] == note_id for item in summary.recent_notes):
+            summary.recent_notes = _recent_notes(user_id)
+
+    _change(user_id, apply)
+
+
+def category_saved(user_id: int, data: dict) -> None:
+    """
+    Adds a new category or updates the name and color of an existing one, from its serialized data.
+    """
+
+    def apply(summary: DashboardSummary) -> None:
+        for entry in summary.categories:
+            if entry['id'] == data['id']:
+                entry.update(name=data['name'], color=data['color'])
+                return
+        summary.categories.append({'id': data['id'], 'name': data['name'], 'color': data['color'], 'note_count': 0})
+
+    _change(user_id, apply)
+
+
+def category_removed(user_id: int, category_id: int) -> None:
+    """
+    Drops a deleted category; its notes now count as uncategorized.
+    """
+
+    def apply(summary: DashboardSummary) -> None:
+        for entry in summary.categories:
+            if entry['id'] == category_id:
+                summary.uncategorized_count += entry['note_count']
+        summary.categories = [entry for entry in summary.categories if entry['id'] != category_id]
+        for item in summary.recent_notes:
+            if item['category_id'] == category_id:
+                item['category_id'] = None
+
+    _change(user_id, apply)
@@ -0,0 +1,187 @@
+"""
+Deferred deletion of users and categories with many notes.
+
+Instead of one long cascading statement, the target row is marked as deleted
+and a queued task (see notes/tasks.py) detaches or deletes its notes in bounded
+batches, each in its own short transaction, recording progress on a DeletionJob.
+The task is queued in the transaction that schedules the deletion, so it survives
+restarts of the process that scheduled it.
+
+A runner claims a job with a conditional UPDATE and holds it for
+NOTES_DELETION_LEASE seconds, renewed after every batch. Other runners (e.g.
+`python manage.py process_deletions`) skip leased jobs, and take over a job whose
+runner died once its lease expires.
+"""
+
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import sharding, tasks
+from .caching import invalidate_notes_list
+from .models import ArchivedNote, Category, DeletionJob, Note
+
+logger = logging.getLogger(__name__)
+
+
+class JobLost(Exception):
+    """
+    The runner's lease on a job expired and another runner claimed it.
+    """
+
+
+def should_defer_category_deletion(category: Category) -> bool:
+    """
+    Returns True when the category has more notes than NOTES_DEFERRED_DELETE_THRESHOLD.
+    Only counts up to the threshold, so the check stays cheap for huge categories.
+    """
+    threshold = settings.NOTES_DEFERRED_DELETE_THRESHOLD
+    return Note.objects.filter(category=category)[:threshold + 1].count() > threshold
+
+
+def schedule_category_deletion(category: Category) -> DeletionJob:
+    """
+    Hides the category immediately and schedules its removal, on the owner's shard.
+    """
+    with sharding.for_user(category.user_id), sharding.atomic():
+        category.deleted_at = timezone.now()
+        category.save(update_fields=['deleted_at'])
+        job = DeletionJob.objects.create(
+            kind=DeletionJob.KIND_CATEGORY,
+            target_id=category.id,
+            owner_id=category.user_id,
+            total=Note.objects.filter(category=category).count()
+        )
+        tasks.enqueue('process_deletion_job', job.id, owner_id=category.user_id)
+    logger.info(f"Deferred deletion scheduled for category {category.id}")
+    return job
+
+
+def schedule_user_deletion(user: User) -> DeletionJob:
+    """
+    Deactivates the user immediately (revoking API access) and schedules its removal
+    on the user's shard, whichever shard the caller (e.g. a staff request) has active.
+    """
+    with sharding.for_user(user.id), sharding.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        job = DeletionJob.objects.create(
+            kind=DeletionJob.KIND_USER,
+            target_id=user.id,
+            owner_id=user.id,
+            total=Note.objects.filter(user=user).count() + ArchivedNote.objects.filter(user=user).count()
+        )
+        tasks.enqueue('process_deletion_job', job.id, owner_id=user.id)
+    logger.info(f"Deferred deletion scheduled for user {user.username}")
+    return job
+
+
+def _lease_until():
+    return timezone.now() + timedelta(seconds=settings.NOTES_DELETION_LEASE)
+
+
+def claimable():
+    """
+    Returns the deletion jobs of the active shard a runner may claim: pending and
+    failed ones, and running ones whose runner's lease expired.
+    """
+    expired = Q(locked_until__isnull=True) | Q(locked_until__lte=timezone.now())
+    return DeletionJob.objects.filter(
+        Q(status__in=[DeletionJob.STATUS_PENDING, DeletionJob.STATUS_FAILED])
+        | Q(expired, status=DeletionJob.STATUS_RUNNING)
+    )
+
+
+def _next_batch(queryset, batch_size: int) -> list:
+    """
+    Returns up to batch_size note ids from the queryset.
+    """
+    return list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+
+
+def _advance(job: DeletionJob, count: int) -> None:
+    """
+    Counts a finished batch and renews the lease, or raises JobLost if it is no longer this runner's.
+    """
+    renewed = DeletionJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        processed=F('processed') + count,
+        locked_until=_lease_until()
+    )
+    if not renewed:
+        raise JobLost(f'Deletion job {job.pk} was claimed by another runner.')
+
+
+def _process_category(job: DeletionJob, batch_size: int) -> None:
+    """
+    Detaches notes from the category batch by batch, then deletes it.
+    """
+    notes = Note.objects.filter(category_id=job.target_id)
+    while True:
+        ids = _next_batch(notes, batch_size)
+        if not ids:
+            break
+        with sharding.atomic():
+            Note.objects.filter(id__in=ids).update(category=None)
+        _advance(job, len(ids))
+    Category.objects.filter(id=job.target_id).delete()
+    invalidate_notes_list(job.owner_id)
+
+
+def _process_user(job: DeletionJob, batch_size: int) -> None:
+    """
+    Deletes the user's notes (hot and archived) and categories batch by batch, then the user itself.
+    """
+    for model in (Note, ArchivedNote):
+        notes = model.objects.filter(user_id=job.target_id)
+        while True:
+            ids = _next_batch(notes, batch_size)
+            if not ids:
+                break
+            with sharding.atomic():
+                model.objects.filter(id__in=ids).delete()
+            _advance(job, len(ids))
+    Category.objects.filter(user_id=job.target_id).delete()
+    User.objects.filter(id=job.target_id).delete()
+
+
+def process_deletion_job(job_id: int) -> bool:
+    """
+    Runs (or resumes) a deletion job, unless it is done or leased by another runner.
+    Safe to call again after a crash, since every batch only touches rows that still exist.
+    Returns whether this call finished the job.
+    """
+    runner = uuid.uuid4().hex
+    claimed = claimable().filter(pk=job_id).update(
+        status=DeletionJob.STATUS_RUNNING,
+        locked_by=runner,
+        locked_until=_lease_until()
+    )
+    if not claimed:
+        logger.info(f"Deletion job {job_id} skipped - finished or running elsewhere")
+        return False
+    job = DeletionJob.objects.get(id=job_id)
+    mine = DeletionJob.objects.filter(pk=job_id, locked_by=runner)
+
+    batch_size = settings.NOTES_DELETION_BATCH_SIZE
+    try:
+        if job.kind == DeletionJob.KIND_CATEGORY:
+            _process_category(job, batch_size)
+        else:
+            _process_user(job, batch_size)
+    except JobLost as ex:
+        logger.warning(f"{ex} Stopping.")
+        return False
+    except Exception as ex:
+        logger.error(f"Deletion job {job.id} failed: {ex}")
+        mine.update(status=DeletionJob.STATUS_FAILED, error=str(ex), locked_by='', locked_until=None)
+        raise
+
+    mine.update(status=DeletionJob.STATUS_DONE, finished_at=timezone.now(), locked_by='', locked_until=None)
+    job.refresh_from_db()
+    logger.info(f"Deletion job {job.id} finished ({job.processed} notes)")
+    return True
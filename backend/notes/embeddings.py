@@ -0,0 +1,364 @@
+"""
+Semantic search over notes.
+
+Notes are embedded by the embedder named in NOTES_EMBEDDER:
+
+    'hashing'  local and deterministic: signed feature hashing of words and word pairs
+               into NOTES_EMBEDDING_DIMENSIONS dimensions. Needs no network; it matches
+               notes by shared vocabulary rather than by meaning.
+    'openai'   the OpenAI embeddings API (NOTES_OPENAI_EMBEDDING_MODEL), using the key
+               PopulateLLMView uses.
+
+Vectors are L2-normalized and stored in NoteEmbedding as int8 with one scale per vector,
+a quarter of their float32 size. Each process keeps the vectors of recently searched
+users in memory (VectorIndex, at most NOTES_SEMANTIC_INDEX_CACHE_SIZE users) and answers
+a query by brute force: a matrix-vector product over the int8 rows, then a partial sort.
+At 256 dimensions that takes about 15ms for 100k notes, so no approximate (IVF)
+structure is needed. Rows embedded since an index was built are merged into it.
+
+Embeddings are refreshed incrementally: note writes call schedule_refresh(), which runs
+refresh_embeddings() for the user in the background after commit (once per user until
+the job starts). It re-embeds, in batches of NOTES_EMBEDDING_BATCH_SIZE, the notes whose
+vector is missing, older than the note or made by another embedder. Archived notes are
+not searched. Backfill with `python manage.py embed_notes`.
+
+NumPy is imported on first use, keeping it out of process startup.
+"""
+
+import logging
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Set, Tuple
+
+from django.conf import settings
+from django.db.models import F, Max, Q
+
+from . import background, llm, sharding
+from .models import Note, NoteEmbedding
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r'\w+')
+# Rows converted to float32 at a time while scoring an index.
+SCORE_CHUNK = 8192
+# Characters of a note sent to the embeddings API (its input is limited to ~8k tokens).
+OPENAI_MAX_CHARS = 24000
+
+_pending: Set[int] = set()
+_pending_lock = threading.Lock()
+_indexes: OrderedDict = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+class EmbeddingError(RuntimeError):
+    """
+    Raised when an embedder cannot produce vectors (e.g. the API key is missing).
+    """
+
+
+def normalize(vectors):
+    """
+    Scales each row to unit length; all-zero rows are left as they are.
+    """
+    import numpy as np
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class HashingEmbedder:
+    """
+    Local embedder: every word (of three or more characters) and word pair adds +1 or -1,
+    depending on its hash, to one of `dimensions` buckets; counts are dampened with log1p.
+    """
+
+    def __init__(self, dimensions: int) -> None:
+        self.dimensions = dimensions
+        self.name = f'hashing-{dimensions}'
+
+    def embed(self, texts: Sequence[str]):
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = [word for word in _WORD_RE.findall(text.lower()) if len(word) > 2]
+            features = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(feature.encode()) for feature in features), dtype=np.int64)
+            signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+            np.add.at(vectors[row], hashes % self.dimensions, signs)
+        return normalize(np.sign(vectors) * np.log1p(np.abs(vectors)))
+
+
+class OpenAIEmbedder:
+    """
+    Embedder backed by the OpenAI embeddings API.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.name = f'openai-{model}'
+
+    def embed(self, texts: Sequence[str]):
+        import numpy as np
+
+        if not llm.configure():
+            raise EmbeddingError('OpenAI API key not found in environment variables.')
+        try:
+            vectors = llm.embed([text[:OPENAI_MAX_CHARS] or ' ' for text in texts], self.model)
+        except Exception as ex:
+            raise EmbeddingError(f'OpenAI embedding request failed: {ex}') from ex
+        return normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def get_embedder():
+    """
+    Returns the embedder configured by NOTES_EMBEDDER.
+    """
+    if settings.NOTES_EMBEDDER == 'openai':
+        return OpenAIEmbedder(settings.NOTES_OPENAI_EMBEDDING_MODEL)
+    return HashingEmbedder(settings.NOTES_EMBEDDING_DIMENSIONS)
+
+
+def note_text(note) -> str:
+    """
+    Returns the text embedded for a note.
+    """
+    return f'{note.title}\n{note.content}'
+
+
+def quantize(vector) -> Tuple[bytes, float]:
+    """
+    Returns the int8 bytes and scale storing a unit vector.
+    """
+    import numpy as np
+
+    peak = float(np.abs(vector).max())
+    scale = peak / 127 if peak else 1.0
+    return np.round(vector / scale).astype(np.int8).tobytes(), scale
+
+
+def dequantize(data: bytes, scale: float):
+    """
+    Reverses quantize().
+    """
+    import numpy as np
+
+    return np.frombuffer(bytes(data), dtype=np.int8).astype(np.float32) * scale
+
+
+def store_embeddings(notes: Sequence[Note], vectors, embedder) -> None:
+    """
+    Inserts or replaces the embeddings of notes.
+    """
+    rows = []
+    for note, vector in zip(notes, vectors):
+        data, scale = quantize(vector)
+        rows.append(NoteEmbedding(
+            note_id=note.id,
+            user_id=note.user_id,
+            embedder=embedder.name,
+            vector=data,
+            scale=scale,
+            source_updated_at=note.updated_at
+        ))
+    NoteEmbedding.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['note'],
+        update_fields=['embedder', 'vector', 'scale', 'source_updated_at', 'embedded_at']
+    )
+
+
+def refresh_embeddings(user_id: Optional[int] = None, batch_size: Optional[int] = None, force: bool = False) -> int:
+    """
+    Embeds, batch by batch, the notes (of one user, or all) whose embedding is missing
+    or stale; with force every note. Returns the number of notes embedded.
+    """
+    embedder = get_embedder()
+    batch_size = batch_size or settings.NOTES_EMBEDDING_BATCH_SIZE
+    notes = Note.objects.all()
+    if user_id is not None:
+        notes = notes.filter(user_id=user_id)
+    if not force:
+        notes = notes.filter(
+            Q(embedding__isnull=True)
+            | Q(embedding__source_updated_at__lt=F('updated_at'))
+            | ~Q(embedding__embedder=embedder.name)
+        )
+
+    total = 0
+    last_id = 0
+    while True:
+        batch = list(
+            notes.filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', 'user_id', 'title', 'content', 'updated_at')[:batch_size]
+        )
+        if not batch:
+            break
+        store_embeddings(batch, embedder.embed([note_text(note) for note in batch]), embedder)
+        total += len(batch)
+        last_id = batch[-1].id
+    if total:
+        logger.info(f"Embedded {total} notes with {embedder.name}")
+    return total
+
+
+def schedule_refresh(user_id: int) -> None:
+    """
+    Refreshes the user's stale embeddings in the background once the current
+    transaction commits. Calls made while a refresh is still queued are merged into it.
+    """
+    sharding.on_commit(lambda: _enqueue_refresh(user_id))
+
+
+def _enqueue_refresh(user_id: int) -> None:
+    with _pending_lock:
+        if user_id in _pending:
+            return
+        _pending.add(user_id)
+    background.submit(_refresh_user, user_id)
+
+
+def _refresh_user(user_id: int) -> None:
+    with _pending_lock:
+        _pending.discard(user_id)
+    refresh_embeddings(user_id)
+
+
+class VectorIndex:
+    """
+    One user's vectors in memory: int8 rows with their scales, ordered by note id.
+    Indexes are never modified in place, so searches may run while a newer one is built.
+    """
+
+    def __init__(self, ids, matrix, scales) -> None:
+        self.ids = ids
+        self.matrix = matrix
+        self.scales = scales
+
+    @classmethod
+    def load(cls, queryset) -> 'VectorIndex':
+        """
+        Reads the embeddings of a NoteEmbedding queryset.
+        """
+        import numpy as np
+
+        ids, vectors, scales = [], [], []
+        rows = queryset.order_by('note_id').values_list('note_id', 'vector', 'scale')
+        for note_id, vector, scale in rows.iterator(chunk_size=2000):
+            ids.append(note_id)
+            vectors.append(bytes(vector))
+            scales.append(scale)
+        width = len(vectors[0]) if vectors else 0
+        matrix = np.frombuffer(b''.join(vectors), dtype=np.int8).reshape(len(ids), width)
+        return cls(np.array(ids, dtype=np.int64), matrix, np.array(scales, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def merged(self, other: 'VectorIndex') -> 'VectorIndex':
+        """
+        Returns a new index with the rows of other replacing or added to these.
+        """
+        import numpy as np
+
+        if not len(self) or not len(other):
+            return other if len(other) else self
+        positions = np.searchsorted(self.ids, other.ids)
+        found = self.ids[np.minimum(positions, len(self) - 1)] == other.ids
+        matrix = self.matrix.copy()
+        scales = self.scales.copy()
+        matrix[positions[found]] = other.matrix[found]
+        scales[positions[found]] = other.scales[found]
+
+        added = ~found
+        ids = np.concatenate([self.ids, other.ids[added]])
+        order = np.argsort(ids, kind='stable')
+        return VectorIndex(
+            ids[order],
+            np.concatenate([matrix, other.matrix[added]])[order],
+            np.concatenate([scales, other.scales[added]])[order]
+        )
+
+    def search(self, query, limit: int, exclude_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Returns up to limit (note id, cosine similarity) pairs, most similar first.
+        """
+        import numpy as np
+
+        if not len(self):
+            return []
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORE_CHUNK):
+            chunk = self.matrix[start:start + SCORE_CHUNK]
+            scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+        scores *= self.scales
+        if exclude_id is not None:
+            scores[self.ids == exclude_id] = -np.inf
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(self.ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+
+def get_index(user_id: int, embedder_name: str) -> VectorIndex:
+    """
+    Returns the user's in-memory index, brought up to date with two indexed queries
+    (row count and latest embedded_at). Rows embedded since the index was built are
+    merged into it; a lower count (notes deleted) reloads it from scratch.
+    """
+    key = (user_id, embedder_name)
+    rows = NoteEmbedding.objects.filter(user_id=user_id, embedder=embedder_name)
+    stamp = (rows.count(), rows.aggregate(last=Max('embedded_at'))['last'])
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is not None:
+            _indexes.move_to_end(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    index = None
+    if cached is not None and cached[0][1] is not None:
+        # >= rather than >: rows written in the same instant as the last build are re-read.
+        index = cached[1].merged(VectorIndex.load(rows.filter(embedded_at__gte=cached[0][1])))
+    if index is None or len(index) != stamp[0]:
+        index = VectorIndex.load(rows)
+    with _indexes_lock:
+        _indexes[key] = (stamp, index)
+        _indexes.move_to_end(key)
+        while len(_indexes) > settings.NOTES_SEMANTIC_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def search(user_id: int, query: str, limit: int) -> List[Tuple[int, float]]:
+    """
+    Returns the (note id, score) pairs of the user's notes closest to a text query.
+    """
+    embedder = get_embedder()
+    vector = embedder.embed([query])[0]
+    return get_index(user_id, embedder.name).search(vector, limit)
+
+
+def similar(note, limit: int) -> List[Tuple[int, float]]:
+    """
+    Returns the (note id, score) pairs of the notes closest to a note (hot or archived),
+    using its stored vector when it is current.
+    """
+    embedder = get_embedder()
+    embedding = NoteEmbedding.objects.filter(
+        note_id=note.id,
+        embedder=embedder.name,
+        source_updated_at__gte=note.updated_at
+    ).first()
+    if embedding is not None:
+        vector = dequantize(embedding.vector, embedding.scale)
+    else:
+        vector = embedder.embed([note_text(note)])[0]
+    return get_index(note.user_id, embedder.name).search(vector, limit, exclude_id=note.id)
@@ -0,0 +1,129 @@
+"""
+Model fields for note content storage.
+
+CompressedTextField stores values of at least NOTES_CONTENT_COMPRESS_THRESHOLD bytes
+compressed (NOTES_CONTENT_COMPRESSION: 'zlib', 'zstd' or None to disable) and
+base85-encoded behind a marker, so the column stays a plain text column and rows
+written before compression was enabled read back unchanged. Python code always
+sees the original string. Substring lookups (icontains) would only see the encoded
+form of compressed values, so search decompresses those rows instead (see
+search_filter in notes/archival.py).
+
+PreviewField keeps a truncated copy of another text field, computed on every
+save and bulk_create, so lists can defer the full content.
+
+ShardedAutoField is the id field of the notes models: it lets notes/sharding.py
+pick the ids of new rows where the database would pick ids of another shard.
+"""
+
+import base64
+import zlib
+
+from django.conf import settings
+from django.db import models
+
+# '\x01' is valid in every database's text type but never appears in typed text.
+MARKER = '\x01'
+CODECS = {'zlib': 'z', 'zstd': 's'}
+ELLIPSIS = '…'
+
+
+def compress(value: str, codec: str) -> str:
+    """
+    Returns the stored form of value: marker, codec id, ':' and the base85 payload.
+    """
+    raw = value.encode('utf-8')
+    if codec == 'zstd':
+        import zstandard
+
+        payload = zstandard.ZstdCompressor(level=9).compress(raw)
+    else:
+        payload = zlib.compress(raw, 6)
+    return f'{MARKER}{CODECS[codec]}:{base64.b85encode(payload).decode("ascii")}'
+
+
+def decompress(stored: str) -> str:
+    """
+    Reverses compress(); values without the marker are returned unchanged.
+    """
+    if not stored or not stored.startswith(MARKER):
+        return stored
+    codec_id, payload = stored[1], base64.b85decode(stored[3:])
+    if codec_id == CODECS['zstd']:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(payload).decode('utf-8')
+    return zlib.decompress(payload).decode('utf-8')
+
+
+class CompressedTextField(models.TextField):
+    """
+    TextField that compresses large values in the database.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        return decompress(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if not isinstance(value, str):
+            return value
+        codec = settings.NOTES_CONTENT_COMPRESSION
+        # Text that happens to start with the marker is always encoded, so reads are unambiguous.
+        if value.startswith(MARKER):
+            return compress(value, codec or 'zlib')
+        if codec and len(value.encode('utf-8')) >= settings.NOTES_CONTENT_COMPRESS_THRESHOLD:
+            return compress(value, codec)
+        return value
+
+
+class ShardedAutoField(models.BigAutoField):
+    """
+    BigAutoField taking new ids from sharding.next_id() when it returns one.
+    Migrations see a plain BigAutoField, the column is the same.
+    """
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        return name, 'django.db.models.BigAutoField', args, kwargs
+
+    def get_pk_value_on_save(self, instance):
+        # Imported here: the sharding module imports the models.
+        from .sharding import next_id
+
+        value = super().get_pk_value_on_save(instance)
+        return next_id(instance) if value is None else value
+
+
+class PreviewField(models.CharField):
+    """
+    Read-only CharField holding the first max_length characters of source_field
+    (ending in an ellipsis when truncated), refreshed whenever the row is written.
+    """
+
+    def __init__(self, *args, source_field: str = 'content', **kwargs) -> None:
+        self.source_field = source_field
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('blank', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source_field'] = self.source_field
+        kwargs.pop('editable', None)
+        kwargs.pop('blank', None)
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = make_preview(getattr(model_instance, self.source_field) or '', self.max_length)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+def make_preview(text: str, length: int) -> str:
+    """
+    Returns text truncated to length characters, ending in an ellipsis if it was cut.
+    """
+    if len(text) <= length:
+        return text
+    return text[:length - 1] + ELLIPSIS
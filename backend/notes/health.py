@@ -0,0 +1,89 @@
+"""
+Liveness and readiness endpoints served directly from middleware.
+
+HealthCheckMiddleware sits first in MIDDLEWARE and answers /healthz and /readyz
+before sessions, authentication, CSRF or URL resolution run, so probes stay cheap.
+
+    /healthz  the process is up and serving requests
+    /readyz   database reachable, migrations applied, warm-up finished (or disabled)
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.http import JsonResponse
+
+from . import warmup
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PATHS = ('/healthz', '/healthz/')
+READY_PATHS = ('/readyz', '/readyz/')
+
+_migrations_applied = False
+
+
+def check_database() -> bool:
+    """
+    Returns True if a trivial query succeeds on the default database.
+    """
+    try:
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except Exception as ex:
+        logger.warning(f"Readiness - database check failed: {ex}")
+        return False
+
+
+def check_migrations() -> bool:
+    """
+    Returns True if no migrations are pending. A positive result is remembered,
+    since migrations are not rolled back under a running process.
+    """
+    global _migrations_applied
+    if _migrations_applied:
+        return True
+    try:
+        executor = MigrationExecutor(connections[DEFAULT_DB_ALIAS])
+        pending = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    except Exception as ex:
+        logger.warning(f"Readiness - migration check failed: {ex}")
+        return False
+    _migrations_applied = not pending
+    return _migrations_applied
+
+
+def readiness() -> dict:
+    """
+    Runs all readiness checks and returns their results by name.
+    """
+    database = check_database()
+    return {
+        'database': database,
+        'migrations': database and check_migrations(),
+        'warmup': not settings.NOTES_WARMUP_ON_STARTUP or warmup.is_warm(),
+    }
+
+
+class HealthCheckMiddleware:
+    """
+    Short-circuits probe requests before the rest of the middleware stack.
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path in HEALTH_PATHS:
+            return JsonResponse({'status': 'ok'})
+        if request.path in READY_PATHS:
+            checks = readiness()
+            ready = all(checks.values())
+            return JsonResponse(
+                {'status': 'ok' if ready else 'unavailable', 'checks': checks},
+                status=200 if ready else 503
+            )
+        return self.get_response(request)
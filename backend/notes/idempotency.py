@@ -0,0 +1,207 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client that may retry a request (after a timeout or a dropped connection) sends
+a unique Idempotency-Key header with it. The first request with a key runs as usual
+and its response is stored for NOTES_IDEMPOTENCY_TTL seconds; repeating the request
+with the same key returns the stored response, marked with Idempotent-Replayed: true,
+without running the view again. Keys are scoped to the user.
+
+The key is claimed by inserting an IdempotencyRecord (unique per user and key)
+before the view runs, so concurrent duplicates, on any pod, find the claim and wait
+for the stored response instead of running the request a second time. If it is not
+ready within NOTES_IDEMPOTENCY_WAIT_TIMEOUT they get 409 with Retry-After.
+A claim whose request died without answering is taken over after
+NOTES_IDEMPOTENCY_LOCK_TIMEOUT.
+
+Server errors (5xx), 429 responses and streamed responses are not stored: the key
+is released and a retry runs the request again. Reusing a key for a different
+request (method, path or body) is answered with 422.
+
+Expired records are removed with `python manage.py purge_idempotency_keys`.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import time
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError
+from django.http import QueryDict
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import metrics, sharding
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+# Seconds between checks while waiting for a concurrent duplicate to finish.
+POLL_INTERVAL = 0.1
+
+metrics.describe('notes_idempotency_requests_total', 'Requests with an Idempotency-Key by outcome.')
+
+
+def _describe_value(value):
+    """
+    JSON fallback for request data: uploaded files are described by name and size.
+    """
+    if isinstance(value, UploadedFile):
+        return f'{value.name}:{value.size}'
+    return str(value)
+
+
+def request_fingerprint(request: Request) -> str:
+    """
+    Returns a hash of the request's method, path, query and body, used to detect
+    a key reused for a different request.
+    """
+    data = request.data
+    if isinstance(data, QueryDict):
+        data = {key: data.getlist(key) for key in data}
+    payload = json.dumps(
+        [request.method, request.path, request.META.get('QUERY_STRING', ''), data],
+        sort_keys=True,
+        default=_describe_value
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def replay(record: IdempotencyRecord) -> Response:
+    """
+    Rebuilds the stored response of a completed record.
+    """
+    data = json.loads(record.response_body) if record.response_body else None
+    return Response(data, status=record.response_status, headers={REPLAYED_HEADER: 'true'})
+
+
+def claim(user, key: str, fingerprint: str) -> Tuple[Optional[IdempotencyRecord], Optional[Response]]:
+    """
+    Claims the key for a new request. Returns (record, None) when the caller should
+    run the request, or (None, response) with the stored response or an error.
+    Waits while another request holding the key is in flight.
+    """
+    deadline = time.monotonic() + settings.NOTES_IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        now = timezone.now()
+        try:
+            with sharding.atomic():
+                record = IdempotencyRecord.objects.create(
+                    user=user,
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=now + timedelta(seconds=settings.NOTES_IDEMPOTENCY_TTL)
+                )
+            return record, None
+        except IntegrityError:
+            pass
+
+        existing = IdempotencyRecord.objects.filter(user=user, key=key).first()
+        if existing is None:
+            # Released between our insert and the lookup; try again.
+            continue
+        abandoned = (
+            existing.response_status is None
+            and existing.created_at < now - timedelta(seconds=settings.NOTES_IDEMPOTENCY_LOCK_TIMEOUT)
+        )
+        if existing.expires_at <= now or abandoned:
+            IdempotencyRecord.objects.filter(pk=existing.pk, created_at=existing.created_at).delete()
+            continue
+        if existing.fingerprint != fingerprint:
+            metrics.inc('notes_idempotency_requests_total', result='mismatch')
+            return None, Response(
+                {'error': f'This {HEADER} was already used for a different request.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if existing.response_status is not None:
+            metrics.inc('notes_idempotency_requests_total', result='replayed')
+            return None, replay(existing)
+        if time.monotonic() >= deadline:
+            metrics.inc('notes_idempotency_requests_total', result='in_flight')
+            return None, Response(
+                {'error': f'A request with this {HEADER} is still in progress, please retry later.'},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Retry-After': str(settings.NOTES_CONCURRENCY_RETRY_AFTER)}
+            )
+        time.sleep(POLL_INTERVAL)
+
+
+def is_storable(response) -> bool:
+    """
+    Whether a response is kept for replays. Retryable failures and streams are not.
+    """
+    if not hasattr(response, 'data') or response.streaming:
+        return False
+    return response.status_code < 500 and response.status_code != status.HTTP_429_TOO_MANY_REQUESTS
+
+
+def complete(record: IdempotencyRecord, response) -> None:
+    """
+    Stores the response of a claimed request, or releases the key if it is not storable.
+    """
+    if not is_storable(response):
+        release(record)
+        return
+    IdempotencyRecord.objects.filter(pk=record.pk).update(
+        response_status=response.status_code,
+        response_body='' if response.data is None else json.dumps(response.data, cls=JSONEncoder)
+    )
+    metrics.inc('notes_idempotency_requests_total', result='executed')
+
+
+def release(record: IdempotencyRecord) -> None:
+    """
+    Drops a claim without storing a response, so the request can be retried.
+    """
+    IdempotencyRecord.objects.filter(pk=record.pk).delete()
+
+
+def idempotent(method):
+    """
+    View method decorator honouring the Idempotency-Key header (see module docstring).
+    Requests without the header, or from anonymous users, run unchanged.
+    """
+
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return method(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        record, response = claim(request.user, key, request_fingerprint(request))
+        if response is not None:
+            return response
+        try:
+            response = method(view, request, *args, **kwargs)
+        except Exception:
+            release(record)
+            raise
+        complete(record, response)
+        return response
+
+    return wrapper
+
+
+def purge_expired(now=None) -> int:
+    """
+    Deletes expired records and returns how many were removed.
+    """
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    logger.info(f"Purged {deleted} expired idempotency records")
+    return deleted
@@ -0,0 +1,259 @@
+"""
+Streaming importers used to bulk-load notes from NDJSON, CSV and Markdown files.
+Records are parsed lazily and inserted in chunked bulk_create batches, so large
+archives never need to fit in memory. Every chunk is checked against the user's
+notes for duplicates (see notes/fingerprints.py) and, with skip_duplicates,
+duplicate records are left out.
+"""
+
+import codecs
+import csv
+import json
+import logging
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from . import dashboard, sharding
+from .caching import invalidate_notes_list
+from .embeddings import schedule_refresh
+from .fingerprints import check_duplicates, index_notes
+from .models import Category, Note
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FORMATS = ('ndjson', 'csv', 'markdown')
+
+FORMAT_EXTENSIONS = {
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.csv': 'csv',
+    '.md': 'markdown',
+    '.markdown': 'markdown',
+}
+
+DEFAULT_CHUNK_SIZE = 1000
+
+TITLE_MAX_LENGTH = Note._meta.get_field('title').max_length
+CATEGORY_NAME_MAX_LENGTH = Category._meta.get_field('name').max_length
+
+
+class ImportFormatError(ValueError):
+    """
+    Raised when an import is requested in an unsupported format.
+    """
+
+
+class ImportStats:
+    """
+    Running counters for an import. Rows counts every parsed record,
+    including skipped ones, so it can be used as a resume offset.
+    Duplicates counts records matching an existing note or an earlier record;
+    they are only left out (and not created) with skip_duplicates.
+    """
+
+    def __init__(self, start_row: int = 0) -> None:
+        self.rows = start_row
+        self.created = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.created / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'skipped': self.skipped,
+            'duplicates': self.duplicates,
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """
+    Guesses the import format from a file name, returning None if unknown.
+    """
+    lowered = filename.lower()
+    for extension, fmt in FORMAT_EXTENSIONS.items():
+        if lowered.endswith(extension):
+            return fmt
+    return None
+
+
+def text_lines(stream) -> Iterable[str]:
+    """
+    Wraps a binary stream in an incremental UTF-8 decoder.
+    Text streams are returned unchanged.
+    """
+    if isinstance(stream.read(0), bytes):
+        return codecs.getreader('utf-8-sig')(stream)
+    return stream
+
+
+def iter_ndjson(lines: Iterable[str]) -> Iterator[Optional[dict]]:
+    """
+    Yields one dict per non-empty line. Malformed lines yield None.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        yield record if isinstance(record, dict) else None
+
+
+def iter_csv(lines: Iterable[str]) -> Iterator[Optional[dict]]:
+    """
+    Yields one dict per CSV row. The first row must be a header
+    with at least 'title' and/or 'content' columns.
+    """
+    for row in csv.DictReader(lines):
+        yield {key.strip().lower(): value for key, value in row.items() if key}
+
+
+def iter_markdown(lines: Iterable[str]) -> Iterator[Optional[dict]]:
+    """
+    Splits a Markdown document into notes on level-one headings.
+    An optional 'Category: <name>' line right after the heading sets the category.
+
+        # Title A
+        Category: School
+        Content A...
+    """
+    record = None
+    body = []
+    for line in lines:
+        if line.startswith('# '):
+            if record is not None:
+                record['content'] = ''.join(body).strip()
+                yield record
+            record = {'title': line[2:].strip()}
+            body = []
+        elif record is not None:
+            if not body and 'category' not in record and line.lower().startswith('category:'):
+                record['category'] = line.split(':', 1)[1].strip()
+            else:
+                body.append(line)
+    if record is not None:
+        record['content'] = ''.join(body).strip()
+        yield record
+
+
+PARSERS = {
+    'ndjson': iter_ndjson,
+    'csv': iter_csv,
+    'markdown': iter_markdown,
+}
+
+
+class CategoryResolver:
+    """
+    Maps category names to ids for a single user, creating missing categories
+    on first use. Lookups are cached for the duration of the import.
+    """
+
+    def __init__(self, user) -> None:
+        self.user = user
+        categories = Category.objects.filter(user=user, deleted_at__isnull=True)
+        self.cache = {name: pk for pk, name in categories.values_list('id', 'name')}
+
+    def resolve(self, name) -> Optional[int]:
+        """
+        Returns the id of the named category, or None for a blank name. Names come
+        from parsed records and may be any JSON value; they are used as text.
+        """
+        name = str(name or '').strip()[:CATEGORY_NAME_MAX_LENGTH].strip()
+        if not name:
+            return None
+        if name not in self.cache:
+            category, _ = Category.objects.get_or_create(user=self.user, name=name, deleted_at=None)
+            self.cache[name] = category.id
+        return self.cache[name]
+
+
+def import_notes(
+    user,
+    stream,
+    fmt: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    skip: int = 0,
+    on_chunk: Optional[Callable[[ImportStats], None]] = None,
+    skip_duplicates: bool = False
+) -> ImportStats:
+    """
+    Imports notes for a user from a text or binary stream.
+    The first `skip` records are parsed but not inserted, which allows resuming an
+    interrupted import. Every chunk is committed in its own transaction and `on_chunk`
+    is called after each commit with the running stats. With skip_duplicates,
+    records duplicating an existing note or an earlier record are not inserted.
+    """
+    if fmt not in PARSERS:
+        raise ImportFormatError(f'Unsupported import format: {fmt}')
+
+    records = PARSERS[fmt](text_lines(stream))
+    resolver = CategoryResolver(user)
+    stats = ImportStats(start_row=skip)
+    batch = []
+
+    def flush() -> None:
+        notes, signatures = [], []
+        for note, (sig, match) in zip(batch, check_duplicates(user.id, [(n.title, n.content) for n in batch])):
+            if match is not None:
+                stats.duplicates += 1
+                if skip_duplicates:
+                    continue
+            notes.append(note)
+            signatures.append(sig)
+        with sharding.atomic():
+            Note.objects.bulk_create(notes, batch_size=chunk_size)
+            index_notes(notes, signatures)
+            dashboard.notes_created(user.id, notes)
+            invalidate_notes_list(user.id)
+            schedule_refresh(user.id)
+        stats.created += len(notes)
+        batch.clear()
+        if on_chunk is not None:
+            on_chunk(stats)
+
+    for index, record in enumerate(records):
+        if index < skip:
+            continue
+
+        title = str((record or {}).get('title') or '').strip()
+        content = str((record or {}).get('content') or '').strip()
+        if not title and not content:
+            logger.debug(f"Import row {index + 1} skipped - no title or content.")
+            stats.skipped += 1
+        else:
+            batch.append(Note(
+                user=user,
+                category_id=resolver.resolve(record.get('category')),
+                title=title[:TITLE_MAX_LENGTH],
+                content=content
+            ))
+        stats.rows = index + 1
+
+        if len(batch) >= chunk_size:
+            flush()
+
+    if batch:
+        flush()
+
+    logger.info(
+        f"Imported {stats.created} notes for user {user.username} "
+        f"({stats.skipped} skipped, {stats.duplicates} duplicates, {stats.rows_per_second:.0f} rows/s)"
+    )
+    return stats
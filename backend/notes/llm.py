@@ -0,0 +1,271 @@
+"""
+Helpers for generating notes with OpenAI: prompts, completion calls and
+an incremental parser that extracts note objects from (streamed) JSON text.
+
+The openai package is imported on first use (see _openai()), keeping it out of
+process startup for workers that never call the LLM.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODEL = 'gpt-4'
+TEMPERATURE = 0.7
+SYSTEM_PROMPT = 'You are a helpful assistant that creates short note data.'
+DEFAULT_CATEGORIES = ["Random Thoughts", "School", "Personal"]
+NOTES_FUNCTION = 'save_notes'
+
+
+def _openai():
+    """
+    Imports and returns the openai module.
+    """
+    import openai
+
+    return openai
+
+
+def configure() -> str:
+    """
+    Loads the API key from the environment into the client and returns it ('' if missing).
+    """
+    openai = _openai()
+    openai.api_key = os.environ.get('NEXT_PUBLIC_OPENAI_API_KEY', '')
+    return openai.api_key
+
+
+def build_prompt(category_name: str, subject: str) -> str:
+    """
+    Returns the user prompt asking for 3 notes in one category.
+    """
+    return (
+        f'Create 3 short notes with a Title and Content for category: "{category_name}". '
+        f'They should be inspired by the subject: "{subject}". '
+        f'Return them as valid JSON array of objects, e.g.:\n'
+        f'[\n'
+        f'  {{"title":"Title A","content":"Content A"}},\n'
+        f'  {{"title":"Title B","content":"Content B"}},\n'
+        f'  {{"title":"Title C","content":"Content C"}}\n'
+        f']\n'
+        f'Keep them brief but meaningful.'
+    )
+
+
+def build_combined_prompt(category_names: List[str], subject: str) -> str:
+    """
+    Returns the user prompt asking for 3 notes in each of several categories at once.
+    """
+    names = ', '.join(f'"{name}"' for name in category_names)
+    return (
+        f'Create 3 short notes with a Title and Content for each of these categories: {names}. '
+        f'They should be inspired by the subject: "{subject}". '
+        f'Keep them brief but meaningful.'
+    )
+
+
+def notes_function_schema(category_names: List[str]) -> dict:
+    """
+    Returns the function definition used to request structured output:
+    one array of {title, content} objects per category name.
+    """
+    note_list = {
+        'type': 'array',
+        'items': {
+            'type': 'object',
+            'properties': {
+                'title': {'type': 'string'},
+                'content': {'type': 'string'},
+            },
+            'required': ['title', 'content'],
+        },
+    }
+    return {
+        'name': NOTES_FUNCTION,
+        'description': 'Save the generated notes, grouped by category name.',
+        'parameters': {
+            'type': 'object',
+            'properties': {name: note_list for name in category_names},
+            'required': list(category_names),
+        },
+    }
+
+
+def _messages(prompt: str) -> list:
+    """
+    Returns the chat messages for a user prompt.
+    """
+    return [
+        {'role': 'system', 'content': SYSTEM_PROMPT},
+        {'role': 'user', 'content': prompt}
+    ]
+
+
+def complete(prompt: str) -> str:
+    """
+    Runs a chat completion and returns the whole response text.
+    """
+    response = _openai().ChatCompletion.create(
+        model=MODEL,
+        messages=_messages(prompt),
+        temperature=TEMPERATURE
+    )
+    return response.choices[0].message.content
+
+
+def complete_structured(prompt: str, schema: dict) -> str:
+    """
+    Runs a chat completion that must call the given function and returns its
+    JSON arguments (falling back to the message text if no call was made).
+    """
+    response = _openai().ChatCompletion.create(
+        model=MODEL,
+        messages=_messages(prompt),
+        temperature=TEMPERATURE,
+        functions=[schema],
+        function_call={'name': schema['name']}
+    )
+    message = response.choices[0].message
+    function_call = message.get('function_call')
+    if function_call:
+        return function_call['arguments']
+    return message.get('content') or ''
+
+
+def embed(texts: List[str], model: str) -> List[List[float]]:
+    """
+    Returns one embedding per text, in input order.
+    """
+    response = _openai().Embedding.create(model=model, input=texts)
+    return [item['embedding'] for item in sorted(response['data'], key=lambda item: item['index'])]
+
+
+def stream_completion(prompt: str) -> Iterator[str]:
+    """
+    Runs a streaming chat completion, yielding text fragments as they arrive.
+    """
+    chunks = _openai().ChatCompletion.create(
+        model=MODEL,
+        messages=_messages(prompt),
+        temperature=TEMPERATURE,
+        stream=True
+    )
+    for chunk in chunks:
+        text = chunk['choices'][0]['delta'].get('content')
+        if text:
+            yield text
+
+
+def iter_json_objects(fragments: Iterable[str]) -> Iterator[dict]:
+    """
+    Yields each top-level JSON object as soon as its closing brace arrives.
+
+    Brackets and text outside objects are ignored, so both a JSON array of objects
+    and a sequence of bare objects work. An object that fails to parse is skipped
+    without affecting the ones around it.
+    """
+    buffer = ''
+    depth = 0
+    in_string = False
+    escaped = False
+    start = None
+    scan_from = 0
+
+    for fragment in fragments:
+        buffer += fragment
+        for index in range(scan_from, len(buffer)):
+            char = buffer[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = depth > 0
+            elif char == '{':
+                if depth == 0:
+                    start = index
+                depth += 1
+            elif char == '}' and depth > 0:
+                depth -= 1
+                if depth == 0:
+                    raw = buffer[start:index + 1]
+                    start = None
+                    try:
+                        obj = json.loads(raw)
+                    except ValueError:
+                        logger.warning(f"Skipping malformed JSON object from LLM: {raw[:80]!r}")
+                        continue
+                    if isinstance(obj, dict):
+                        yield obj
+
+        # Keep only the unfinished object, if any.
+        if start is None:
+            buffer = ''
+            scan_from = 0
+        else:
+            buffer = buffer[start:]
+            start = 0
+            scan_from = len(buffer)
+
+
+def clean_note(obj: dict) -> Optional[Tuple[str, str]]:
+    """
+    Returns (title, content) if both are present and non-empty, else None.
+    """
+    title = str(obj.get('title', '')).strip()
+    content = str(obj.get('content', '')).strip()
+    if title and content:
+        return title, content
+    return None
+
+
+def validate_notes(section) -> Optional[List[Tuple[str, str]]]:
+    """
+    Validates one category's notes against the schema: a non-empty list of
+    objects with non-empty string title and content. Returns None if invalid.
+    """
+    if not isinstance(section, list) or not section:
+        return None
+    notes = []
+    for obj in section:
+        if not isinstance(obj, dict):
+            return None
+        if not isinstance(obj.get('title'), str) or not isinstance(obj.get('content'), str):
+            return None
+        cleaned = clean_note(obj)
+        if cleaned is None:
+            return None
+        notes.append(cleaned)
+    return notes
+
+
+def split_sections(
+    raw_text: str,
+    category_names: List[str]
+) -> Tuple[Dict[str, List[Tuple[str, str]]], List[str]]:
+    """
+    Parses a combined response and validates each category's section.
+    Returns ({name: notes} for valid sections, [names of invalid or missing sections]).
+    """
+    try:
+        data = json.loads(raw_text)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return {}, list(category_names)
+
+    valid = {}
+    invalid = []
+    for name in category_names:
+        notes = validate_notes(data.get(name))
+        if notes is None:
+            invalid.append(name)
+        else:
+            valid[name] = notes
+    return valid, invalid
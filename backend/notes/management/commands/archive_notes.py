@@ -0,0 +1,34 @@
+"""
+Management command that moves notes not updated for a while to the archive table.
+Meant to run periodically (see kubernetes/archive-notes-cronjob.yaml).
+
+    python manage.py archive_notes
+    python manage.py archive_notes --days 365 --batch-size 1000
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notes import sharding
+from notes.archival import archive_cutoff, archive_notes
+
+
+class Command(BaseCommand):
+    """
+    Archives cold notes in batches, each in its own short transaction.
+    """
+    help = 'Move notes not updated for --days days to the archive table.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--days', type=int, default=settings.NOTES_ARCHIVE_AFTER_DAYS,
+                            help='Archive notes not updated for this many days.')
+        parser.add_argument('--batch-size', type=int, default=settings.NOTES_ARCHIVE_BATCH_SIZE,
+                            help='Notes moved per transaction.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches.')
+
+    def handle(self, *args, **options) -> None:
+        cutoff = archive_cutoff(options['days'])
+        moved = 0
+        for _ in sharding.each_shard():
+            moved += archive_notes(cutoff, options['batch_size'], options['max_batches'])
+        self.stdout.write(f'Archived {moved} notes last updated before {cutoff:%Y-%m-%d}.')
@@ -0,0 +1,40 @@
+"""
+Management command that computes the semantic search embeddings of notes that have none
+or a stale one, e.g. after enabling search or switching NOTES_EMBEDDER.
+
+    python manage.py embed_notes
+    python manage.py embed_notes --user someone@example.com --force
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import sharding
+from notes.embeddings import get_embedder, refresh_embeddings
+
+
+class Command(BaseCommand):
+    """
+    Embeds missing or stale notes in batches with the configured embedder.
+    """
+    help = 'Compute missing or stale semantic search embeddings.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--user', help='Only embed the notes of this username (email).')
+        parser.add_argument('--batch-size', type=int, help='Notes embedded per batch.')
+        parser.add_argument('--force', action='store_true', help='Re-embed every note, not only stale ones.')
+
+    def handle(self, *args, **options) -> None:
+        user_id = None
+        if options['user']:
+            try:
+                user_id = User.objects.get(username=options['user']).id
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        shards = [sharding.shard_for_user(user_id)] if user_id else sharding.shards()
+        count = 0
+        for alias in shards:
+            with sharding.use_shard(alias):
+                count += refresh_embeddings(user_id, options['batch_size'], force=options['force'])
+        self.stdout.write(f'Embedded {count} notes with {get_embedder().name}.')
@@ -0,0 +1,26 @@
+"""
+Management command that builds the duplicate-detection fingerprints of notes
+created before fingerprinting was introduced (or after a bulk load that skipped it).
+
+    python manage.py fingerprint_notes
+    python manage.py fingerprint_notes --batch-size 5000
+"""
+
+from django.core.management.base import BaseCommand
+
+from notes import sharding
+from notes.fingerprints import index_missing
+
+
+class Command(BaseCommand):
+    """
+    Fingerprints every hot note that has none yet, in batches.
+    """
+    help = 'Build duplicate-detection fingerprints for notes that have none.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--batch-size', type=int, default=1000, help='Notes fingerprinted per query.')
+
+    def handle(self, *args, **options) -> None:
+        total = sum(index_missing(options['batch_size']) for _ in sharding.each_shard())
+        self.stdout.write(f'Fingerprinted {total} notes.')
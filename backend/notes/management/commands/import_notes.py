@@ -0,0 +1,107 @@
+"""
+Management command that bulk-imports notes for a user from an NDJSON, CSV or Markdown file.
+
+    python manage.py import_notes notes.ndjson --user someone@example.com
+    python manage.py import_notes notes.ndjson --user someone@example.com --resume
+    python manage.py import_notes notes.ndjson --user someone@example.com --skip-duplicates
+"""
+
+import json
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import sharding
+from notes.importers import (
+    DEFAULT_CHUNK_SIZE,
+    SUPPORTED_FORMATS,
+    ImportStats,
+    detect_format,
+    import_notes
+)
+
+
+class Command(BaseCommand):
+    """
+    Streams the input file and inserts notes in chunked transactions.
+    Progress is written to a checkpoint file after every committed chunk,
+    so a failed run can be continued with --resume.
+    """
+    help = 'Bulk-import notes for a user from an NDJSON, CSV or Markdown file.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('path', help='File to import.')
+        parser.add_argument('--user', required=True, help='Username (email) that will own the notes.')
+        parser.add_argument('--format', choices=SUPPORTED_FORMATS, help='Input format (default: from extension).')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per transaction.')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint).')
+        parser.add_argument('--resume', action='store_true', help='Skip rows already committed by a previous run.')
+        parser.add_argument(
+            '--skip-duplicates',
+            action='store_true',
+            help='Do not import notes duplicating an existing note or an earlier row.'
+        )
+
+    def handle(self, *args, **options) -> None:
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        if fmt is None:
+            raise CommandError(f'Cannot detect the format of "{path}", pass --format.')
+
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        skip = self.read_checkpoint(checkpoint) if options['resume'] else 0
+        if skip:
+            self.stdout.write(f'Resuming after row {skip}.')
+
+        def on_chunk(stats: ImportStats) -> None:
+            self.write_checkpoint(checkpoint, stats.rows)
+            self.stdout.write(
+                f'{stats.rows} rows, {stats.created} created, '
+                f'{stats.rows_per_second:.0f} rows/s'
+            )
+
+        with sharding.for_user(user.id), open(path, 'r', encoding='utf-8-sig', newline='') as stream:
+            stats = import_notes(
+                user,
+                stream,
+                fmt,
+                chunk_size=options['chunk_size'],
+                skip=skip,
+                on_chunk=on_chunk,
+                skip_duplicates=options['skip_duplicates']
+            )
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats.created} notes ({stats.skipped} skipped, {stats.duplicates} duplicates) '
+            f'in {stats.elapsed:.1f}s, {stats.rows_per_second:.0f} rows/s.'
+        ))
+
+    @staticmethod
+    def read_checkpoint(path: str) -> int:
+        """
+        Returns the number of rows committed by a previous run, or 0.
+        """
+        try:
+            with open(path) as fh:
+                return int(json.load(fh).get('rows', 0))
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def write_checkpoint(path: str, rows: int) -> None:
+        """
+        Atomically records the number of committed rows.
+        """
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump({'rows': rows}, fh)
+        os.replace(tmp_path, path)
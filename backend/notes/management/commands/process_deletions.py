@@ -0,0 +1,32 @@
+"""
+Management command that runs deferred deletion jobs left unfinished,
+e.g. after the process that scheduled them was restarted.
+
+    python manage.py process_deletions
+"""
+
+from django.core.management.base import BaseCommand
+
+from notes import sharding
+from notes.deletion import claimable, process_deletion_job
+from notes.models import DeletionJob
+
+
+class Command(BaseCommand):
+    """
+    Processes every unfinished deletion job no live runner holds (see notes/deletion.py),
+    in creation order.
+    """
+    help = 'Run unfinished deferred deletion jobs.'
+
+    def handle(self, *args, **options) -> None:
+        for _ in sharding.each_shard():
+            jobs = claimable().order_by('id')
+            for job_id in jobs.values_list('id', flat=True):
+                try:
+                    finished = process_deletion_job(job_id)
+                except Exception as ex:
+                    self.stderr.write(f'Deletion job {job_id} failed: {ex}')
+                    continue
+                if finished:
+                    self.stdout.write(f'Finished {DeletionJob.objects.get(id=job_id)}.')
@@ -0,0 +1,22 @@
+"""
+Management command that deletes stored Idempotency-Key responses past their TTL.
+Meant to run periodically (see kubernetes/purge-idempotency-keys-cronjob.yaml).
+
+    python manage.py purge_idempotency_keys
+"""
+
+from django.core.management.base import BaseCommand
+
+from notes import sharding
+from notes.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    """
+    Removes expired idempotency records; replays after the TTL run the request again.
+    """
+    help = 'Delete stored Idempotency-Key responses older than NOTES_IDEMPOTENCY_TTL.'
+
+    def handle(self, *args, **options) -> None:
+        deleted = sum(purge_expired() for _ in sharding.each_shard())
+        self.stdout.write(f'Purged {deleted} expired idempotency records.')
@@ -0,0 +1,65 @@
+"""
+Management command that moves users between shards while the API keeps serving them.
+
+    python manage.py rebalance_shards                     # print a plan evening out the shards
+    python manage.py rebalance_shards --apply             # and carry it out
+    python manage.py rebalance_shards --move 42 shard_2   # move one user
+    python manage.py rebalance_shards --prepare           # set the id ranges of every shard
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import sharding
+
+
+class Command(BaseCommand):
+    """
+    Plans and runs user moves between the shards listed in NOTES_SHARDS.
+    """
+    help = 'Move users between shards to even out their note counts.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--move', nargs=2, metavar=('USER_ID', 'SHARD'), help='Move one user to a shard.')
+        parser.add_argument('--apply', action='store_true', help='Carry out the balancing plan.')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Acceptable note count difference between shards, as a fraction of the average.')
+        parser.add_argument('--prepare', action='store_true',
+                            help='Set the id ranges of every shard (done by migrate too).')
+
+    def handle(self, *args, **options) -> None:
+        if options['prepare']:
+            for alias in sharding.shards():
+                sharding.prepare_shard(alias)
+            self.stdout.write(f'Prepared {len(sharding.shards())} shards.')
+            return
+
+        if options['move']:
+            user_id, target = options['move']
+            if not User.objects.filter(pk=user_id).exists():
+                raise CommandError(f'User {user_id} does not exist.')
+            self.move(int(user_id), target)
+            return
+
+        if not sharding.is_enabled():
+            raise CommandError('Only one shard is configured (NOTES_SHARDS).')
+        plan = sharding.rebalance_plan(options['tolerance'])
+        if not plan:
+            self.stdout.write('Shards are balanced.')
+            return
+        for user_id, source, target in plan:
+            self.stdout.write(f'User {user_id}: {source} -> {target}')
+            if options['apply']:
+                self.move(user_id, target)
+        if not options['apply']:
+            self.stdout.write(f'{len(plan)} moves planned; run with --apply to carry them out.')
+
+    def move(self, user_id: int, target: str) -> None:
+        """
+        Moves one user, reporting the rows copied.
+        """
+        try:
+            copied = sharding.move_user(user_id, target)
+        except sharding.ShardingError as ex:
+            raise CommandError(str(ex))
+        self.stdout.write(self.style.SUCCESS(f'Moved user {user_id} to {target} ({sum(copied.values())} rows).'))
@@ -0,0 +1,36 @@
+"""
+Management command that recomputes dashboard summaries from the notes, e.g. after
+changes made outside the API (bulk SQL, the admin) left them out of step.
+
+    python manage.py rebuild_dashboards
+    python manage.py rebuild_dashboards --user someone@example.com
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import dashboard, sharding
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the summaries of one user or of every user that has one.
+    """
+    help = 'Recompute dashboard summaries from the notes and categories.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--user', help='Only rebuild the summary of this username (email).')
+
+    def handle(self, *args, **options) -> None:
+        if options['user']:
+            try:
+                user_id = User.objects.get(username=options['user']).id
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["user"]}" does not exist.')
+            with sharding.for_user(user_id):
+                dashboard.build(user_id)
+            self.stdout.write('Rebuilt 1 dashboard summary.')
+            return
+
+        total = sum(dashboard.rebuild_all() for _ in sharding.each_shard())
+        self.stdout.write(f'Rebuilt {total} dashboard summaries.')
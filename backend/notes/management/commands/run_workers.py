@@ -0,0 +1,38 @@
+"""
+Management command that runs the task queue workers (see notes/tasks.py).
+
+    python manage.py run_workers                                 # one worker process per core
+    python manage.py run_workers --processes 4
+    python manage.py run_workers --enqueue archive_notes --burst  # e.g. from cron: queue, drain, exit
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import sharding, tasks
+
+
+class Command(BaseCommand):
+    """
+    Runs a pool of worker processes until interrupted (SIGINT or SIGTERM finish the
+    tasks in progress first).
+    """
+    help = 'Run queued maintenance tasks in a pool of worker processes.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes (default: one per core).')
+        parser.add_argument('--burst', action='store_true', help='Exit once no task is due.')
+        parser.add_argument('--enqueue', action='append', default=[], metavar='TASK',
+                            help=f'Queue a task on every shard first; one of {", ".join(sorted(tasks.registry))}.')
+
+    def handle(self, *args, **options) -> None:
+        for name in options['enqueue']:
+            if name not in tasks.registry:
+                raise CommandError(f'Unknown task "{name}".')
+            for _ in sharding.each_shard():
+                tasks.enqueue(name)
+            self.stdout.write(f'Queued {name} on {len(sharding.shards())} shard(s).')
+
+        if options['processes'] is not None and options['processes'] < 1:
+            raise CommandError('--processes must be at least 1.')
+        tasks.run_pool(options['processes'], burst=options['burst'])
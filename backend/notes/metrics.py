@@ -0,0 +1,72 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+Counters and gauges are keyed by name and a sorted tuple of label pairs.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[Tuple, float]] = defaultdict(lambda: defaultdict(float))
+_gauges: Dict[str, Dict[Tuple, float]] = defaultdict(lambda: defaultdict(float))
+_help: Dict[str, str] = {}
+
+
+def _labels(labels: dict) -> Tuple:
+    """
+    Returns a hashable, order-independent key for a label set.
+    """
+    return tuple(sorted(labels.items()))
+
+
+def describe(metric: str, text: str) -> None:
+    """
+    Registers the HELP text of a metric.
+    """
+    _help[metric] = text
+
+
+def inc(metric: str, amount: float = 1, **labels) -> None:
+    """
+    Increments a counter.
+    """
+    with _lock:
+        _counters[metric][_labels(labels)] += amount
+
+
+def set_gauge(metric: str, value: float, **labels) -> None:
+    """
+    Sets a gauge to an absolute value.
+    """
+    with _lock:
+        _gauges[metric][_labels(labels)] = value
+
+
+def get(metric: str, **labels) -> float:
+    """
+    Returns the current value of a counter or gauge (0 if unset).
+    """
+    key = _labels(labels)
+    with _lock:
+        if metric in _counters:
+            return _counters[metric].get(key, 0)
+        return _gauges.get(metric, {}).get(key, 0)
+
+
+def render() -> str:
+    """
+    Renders all metrics in the Prometheus text format.
+    """
+    lines = []
+    with _lock:
+        for kind, series in (('counter', _counters), ('gauge', _gauges)):
+            for name in sorted(series):
+                if name in _help:
+                    lines.append(f'# HELP {name} {_help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in sorted(series[name].items()):
+                    label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+                    suffix = f'{{{label_text}}}' if label_text else ''
+                    lines.append(f'{name}{suffix} {value:g}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:08
+
+import notes.fields
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_previews(apps, schema_editor):
+    """
+    Fills the new preview column and rewrites content, which compresses
+    values above the threshold.
+    """
+    for model_name in ('Note', 'ArchivedNote'):
+        model = apps.get_model('notes', model_name)
+        batch = []
+        for note in model.objects.only('id', 'content').iterator(chunk_size=BATCH_SIZE):
+            note.preview = notes.fields.make_preview(note.content, 200)
+            batch.append(note)
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_update(batch, ['preview', 'content'])
+                batch = []
+        model.objects.bulk_update(batch, ['preview', 'content'])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('notes', '0005_note_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivednote',
+            name='preview',
+            field=notes.fields.PreviewField(max_length=200, source_field='content'),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='preview',
+            field=notes.fields.PreviewField(max_length=200, source_field='content'),
+        ),
+        migrations.AlterField(
+            model_name='archivednote',
+            name='content',
+            field=notes.fields.CompressedTextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='note',
+            name='content',
+            field=notes.fields.CompressedTextField(blank=True),
+        ),
+        migrations.RunPython(backfill_previews, migrations.RunPython.noop),
+    ]
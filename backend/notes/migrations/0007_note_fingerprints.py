@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('notes', '0006_compressed_content'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteFingerprint',
+            fields=[
+                ('note', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                              related_name='fingerprint', serialize=False, to='notes.note')),
+                ('content_hash', models.CharField(max_length=40)),
+                ('minhash', models.BinaryField()),
+                ('band0', models.BigIntegerField()),
+                ('band1', models.BigIntegerField()),
+                ('band2', models.BigIntegerField()),
+                ('band3', models.BigIntegerField()),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE,
+                                           related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['user', 'content_hash'], name='notes_fp_user_hash_idx'),
+                    models.Index(fields=['user', 'band0'], name='notes_fp_user_band0_idx'),
+                    models.Index(fields=['user', 'band1'], name='notes_fp_user_band1_idx'),
+                    models.Index(fields=['user', 'band2'], name='notes_fp_user_band2_idx'),
+                    models.Index(fields=['user', 'band3'], name='notes_fp_user_band3_idx'),
+                ],
+            },
+        ),
+    ]
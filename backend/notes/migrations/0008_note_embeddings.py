@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('notes', '0007_note_fingerprints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteEmbedding',
+            fields=[
+                ('note', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                              related_name='embedding', serialize=False, to='notes.note')),
+                ('embedder', models.CharField(max_length=64)),
+                ('vector', models.BinaryField()),
+                ('scale', models.FloatField()),
+                ('source_updated_at', models.DateTimeField()),
+                ('embedded_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE,
+                                           related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['user', 'embedder', 'embedded_at'], name='notes_embedding_user_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-19 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0014_note_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deletionjob',
+            name='locked_by',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='deletionjob',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
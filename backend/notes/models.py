@@ -4,6 +4,13 @@ Data models for the 'notes' application.
 
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+from .fields import CompressedTextField, PreviewField
+
+# Characters of content kept in Note.preview / ArchivedNote.preview.
+PREVIEW_LENGTH = 200
 
 
 class Category(models.Model):
@@ -24,6 +31,28 @@ class Category(models.Model):
         max_length=50,
         default='#FFFFFF'
     )
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+    # Id chosen by the client (see ClientIdMixin in notes/views.py); unique per user when set.
+    client_id = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'name'], name='notes_category_user_name_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'client_id'],
+                condition=models.Q(client_id__isnull=False),
+                name='notes_category_user_client_id_uniq'
+            ),
+        ]
 
     def __str__(self) -> str:
         """
@@ -55,18 +84,559 @@ class Note(models.Model):
         max_length=200,
         blank=True
     )
-    content = models.TextField(
+    # Large values are stored compressed (see notes/fields.py).
+    content = CompressedTextField(
         blank=True
     )
+    preview = PreviewField(
+        max_length=PREVIEW_LENGTH,
+        source_field='content'
+    )
     created_at = models.DateTimeField(
         auto_now_add=True
     )
     updated_at = models.DateTimeField(
         auto_now=True
     )
+    # Id chosen by the client (see ClientIdMixin in notes/views.py); unique per user when set.
+    client_id = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-updated_at'], name='notes_note_user_updated_idx'),
+            models.Index(fields=['updated_at'], name='notes_note_updated_idx'),
+            # Serves case-insensitive exact title search (UPPER(title) = UPPER(%s)).
+            models.Index(Upper('title'), name='notes_note_title_upper_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'client_id'],
+                condition=models.Q(client_id__isnull=False),
+                name='notes_note_user_client_id_uniq'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Returns the title if present, otherwise 'Untitled Note'.
+        """
+        return self.title or 'Untitled Note'
+
+    def save(self, *args, **kwargs) -> None:
+        """
+        Keeps the preview in step with content when saving selected fields.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields and 'preview' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'preview']
+        super().save(*args, **kwargs)
+
+
+class ArchivedNote(models.Model):
+    """
+    Cold storage for notes not updated for NOTES_ARCHIVE_AFTER_DAYS (see notes/archival.py).
+    Rows keep the id of the note they were moved from, so API URLs stay valid.
+    Only the index needed to list a user's archive is kept.
+    """
+
+    id = models.BigIntegerField(
+        primary_key=True
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_notes',
+        db_index=False
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_notes'
+    )
+    title = models.CharField(
+        max_length=200,
+        blank=True
+    )
+    content = CompressedTextField(
+        blank=True
+    )
+    preview = PreviewField(
+        max_length=PREVIEW_LENGTH,
+        source_field='content'
+    )
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    client_id = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True
+    )
+    archived_at = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-updated_at'], name='notes_archive_user_updated_idx'),
+        ]
 
     def __str__(self) -> str:
         """
         Returns the title if present, otherwise 'Untitled Note'.
         """
         return self.title or 'Untitled Note'
+
+
+class NoteFingerprint(models.Model):
+    """
+    Duplicate-detection signatures of a hot note (see notes/fingerprints.py):
+    a hash of the normalized text for exact duplicates, and a MinHash signature
+    whose four LSH band hashes are indexed per user for near duplicates.
+    """
+
+    note = models.OneToOneField(
+        Note,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='fingerprint'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False
+    )
+    content_hash = models.CharField(
+        max_length=40
+    )
+    minhash = models.BinaryField()
+    band0 = models.BigIntegerField()
+    band1 = models.BigIntegerField()
+    band2 = models.BigIntegerField()
+    band3 = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'content_hash'], name='notes_fp_user_hash_idx'),
+            models.Index(fields=['user', 'band0'], name='notes_fp_user_band0_idx'),
+            models.Index(fields=['user', 'band1'], name='notes_fp_user_band1_idx'),
+            models.Index(fields=['user', 'band2'], name='notes_fp_user_band2_idx'),
+            models.Index(fields=['user', 'band3'], name='notes_fp_user_band3_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Returns e.g. "Note 4 fingerprint".
+        """
+        return f"Note {self.note_id} fingerprint"
+
+
+class NoteEmbedding(models.Model):
+    """
+    Semantic search vector of a hot note (see notes/embeddings.py): L2-normalized,
+    quantized to int8 with one scale per vector, tagged with the embedder that made
+    it and the note's updated_at at that time, so stale vectors can be found.
+    """
+
+    note = models.OneToOneField(
+        Note,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='embedding'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False
+    )
+    embedder = models.CharField(
+        max_length=64
+    )
+    vector = models.BinaryField()
+    scale = models.FloatField()
+    source_updated_at = models.DateTimeField()
+    embedded_at = models.DateTimeField(
+        auto_now=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'embedder', 'embedded_at'], name='notes_embedding_user_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Returns e.g. "Note 4 embedding (hashing-256)".
+        """
+        return f"Note {self.note_id} embedding ({self.embedder})"
+
+
+class NoteRevision(models.Model):
+    """
+    One stored version of a note's content.
+    Snapshots hold the full text; other revisions hold a delta against the previous
+    revision. Data is zlib-compressed either way.
+    """
+
+    note = models.ForeignKey(
+        Note,
+        on_delete=models.CASCADE,
+        related_name='revisions'
+    )
+    number = models.PositiveIntegerField()
+    is_snapshot = models.BooleanField(
+        default=False
+    )
+    data = models.BinaryField()
+    content_length = models.PositiveIntegerField(
+        default=0
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['note', 'number'], name='notes_revision_unique_number'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Returns e.g. "Note 4 r12".
+        """
+        return f"Note {self.note_id} r{self.number}"
+
+
+class DeletionJob(models.Model):
+    """
+    Tracks a deferred deletion of a user or category and its dependent notes.
+    The target is stored by id so the job outlives the row it deletes.
+    """
+
+    KIND_USER = 'user'
+    KIND_CATEGORY = 'category'
+    KIND_CHOICES = [
+        (KIND_USER, 'User'),
+        (KIND_CATEGORY, 'Category'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES
+    )
+    target_id = models.BigIntegerField()
+    owner_id = models.BigIntegerField(
+        db_index=True
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    total = models.PositiveIntegerField(
+        default=0
+    )
+    processed = models.PositiveIntegerField(
+        default=0
+    )
+    error = models.TextField(
+        blank=True
+    )
+    # The runner that claimed a running job, and until when; renewed after every batch.
+    locked_by = models.CharField(
+        max_length=100,
+        blank=True
+    )
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    def __str__(self) -> str:
+        """
+        Returns e.g. "category #3 (running 120/500)".
+        """
+        return f"{self.kind} #{self.target_id} ({self.status} {self.processed}/{self.total})"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    Outcome of a write request sent with an Idempotency-Key header (see notes/idempotency.py).
+    response_status is null while the first request with the key is still running.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False
+    )
+    key = models.CharField(
+        max_length=255
+    )
+    fingerprint = models.CharField(
+        max_length=64
+    )
+    response_status = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True
+    )
+    response_body = models.TextField(
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+    expires_at = models.DateTimeField(
+        db_index=True
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='notes_idempotency_unique_key'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Returns e.g. "Idempotency key abc123 (201)".
+        """
+        return f"Idempotency key {self.key} ({self.response_status or 'in flight'})"
+
+
+class ShardAssignment(models.Model):
+    """
+    The database shard holding a user's data (see notes/sharding.py).
+    Lives in the default database; 'moving' blocks the user's writes while the
+    data is copied to another shard.
+    """
+
+    STATE_ACTIVE = 'active'
+    STATE_MOVING = 'moving'
+    STATE_CHOICES = [
+        (STATE_ACTIVE, 'Active'),
+        (STATE_MOVING, 'Moving'),
+    ]
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+'
+    )
+    shard = models.CharField(
+        max_length=64,
+        db_index=True
+    )
+    state = models.CharField(
+        max_length=20,
+        choices=STATE_CHOICES,
+        default=STATE_ACTIVE
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True
+    )
+
+    def __str__(self) -> str:
+        """
+        Returns e.g. "User 4 on shard_1 (active)".
+        """
+        return f"User {self.user_id} on {self.shard} ({self.state})"
+
+
+class DashboardSummary(models.Model):
+    """
+    Precomputed dashboard data of a user (see notes/dashboard.py), kept current by
+    note and category writes so the dashboard is a single primary-key lookup.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+'
+    )
+    # [{'id', 'name', 'color', 'note_count'}] of the user's categories, by id.
+    categories = models.JSONField(
+        default=list
+    )
+    uncategorized_count = models.PositiveIntegerField(
+        default=0
+    )
+    note_count = models.PositiveIntegerField(
+        default=0
+    )
+    # [{'id', 'title', 'preview', 'category_id', 'updated_at'}], most recently updated first.
+    recent_notes = models.JSONField(
+        default=list
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True
+    )
+
+    def __str__(self) -> str:
+        """
+        Returns e.g. "Dashboard of user 4 (12 notes)".
+        """
+        return f"Dashboard of user {self.user_id} ({self.note_count} notes)"
+
+
+class Task(models.Model):
+    """
+    A unit of work in the database-backed task queue (see notes/tasks.py). Finished
+    tasks are deleted; failed ones are kept with their last error.
+    """
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(
+        max_length=100
+    )
+    args = models.JSONField(
+        default=list,
+        blank=True
+    )
+    kwargs = models.JSONField(
+        default=dict,
+        blank=True
+    )
+    # Higher runs first.
+    priority = models.SmallIntegerField(
+        default=0
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3
+    )
+    run_after = models.DateTimeField(
+        default=timezone.now
+    )
+    # Worker holding a running task, and when its claim expires (the visibility timeout).
+    locked_by = models.CharField(
+        max_length=100,
+        blank=True
+    )
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+    last_error = models.TextField(
+        blank=True
+    )
+    # User the task works for, if any; their tasks move with them between shards.
+    owner_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        db_index=True
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='notes_task_claim_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Returns e.g. "archive_notes #7 (queued, attempt 0/3)".
+        """
+        return f"{self.name} #{self.id} ({self.status}, attempt {self.attempts}/{self.max_attempts})"
+
+
+class Tag(models.Model):
+    """
+    A label a user puts on any number of notes (see notes/tagging.py). note_count is
+    kept current by tag writes, archived notes included.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='tags'
+    )
+    # Lowercase, see tagging.normalize().
+    name = models.CharField(
+        max_length=50
+    )
+    note_count = models.PositiveIntegerField(
+        default=0
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='notes_tag_user_name_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Returns e.g. "work (12 notes)".
+        """
+        return f"{self.name} ({self.note_count} notes)"
+
+
+class NoteTag(models.Model):
+    """
+    Posting of the per-user inverted index from tags to notes. The note is stored by
+    id, like archival keeps it, so a note's tags survive its archival.
+    """
+
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='postings'
+    )
+    note_id = models.BigIntegerField(
+        db_index=True
+    )
+
+    class Meta:
+        constraints = [
+            # Also the index a tag's notes are read from, in note id order.
+            models.UniqueConstraint(fields=['tag', 'note_id'], name='notes_notetag_tag_note_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Returns e.g. "Note 4 #7".
+        """
+        return f"Note {self.note_id} #{self.tag_id}"
@@ -0,0 +1,59 @@
+"""
+Pagination helpers for large tables.
+"""
+
+from typing import Optional
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimate_row_count(model, using: str = 'default') -> Optional[int]:
+    """
+    Returns the database's cheap row estimate for a model's table,
+    or None when the backend has no usable estimate.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    vendor = connection.vendor
+
+    if vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+        params = [connection.ops.quote_name(table)]
+    elif vendor == 'mysql':
+        sql = ('SELECT table_rows FROM information_schema.tables '
+               'WHERE table_schema = DATABASE() AND table_name = %s')
+        params = [table]
+    elif vendor == 'sqlite':
+        # Max rowid is read from the end of the b-tree; exact unless rows were deleted.
+        sql = f'SELECT MAX(_ROWID_) FROM {connection.ops.quote_name(table)}'
+        params = []
+    else:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs an unbounded COUNT(*).
+    Unfiltered querysets use the table estimate; filtered ones (or small tables)
+    are counted up to count_cap rows.
+    """
+    count_cap = 10000
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, using=queryset.db)
+            if estimate is not None and estimate >= self.count_cap:
+                return estimate
+        return queryset[:self.count_cap].count()
@@ -0,0 +1,365 @@
+"""
+On-demand request profiling.
+
+ProfilingMiddleware profiles a request when
+
+    a staff user sends X-Profile: cprofile (or sampling, or 1 for the default mode), or
+    the request falls in the NOTES_PROFILING_SAMPLE_RATE fraction of all requests.
+
+Two profilers are available:
+
+    cprofile  deterministic, every call of the request thread; saved as a .pstats
+              file (python -m pstats, snakeviz). Slows the request down noticeably.
+    sampling  a background thread records the request thread's stack every
+              NOTES_PROFILING_INTERVAL seconds; saved as speedscope JSON
+              (https://www.speedscope.app). Low overhead, the NOTES_PROFILING_MODE default.
+
+Both also time every SQL query and split the request's time by layer (ORM,
+serializers, app code, framework) from the innermost frame of each call or sample.
+Profiles are kept in a ring of NOTES_PROFILING_MAX_FILES in NOTES_PROFILING_DIR,
+each with a JSON summary, and are listed and downloaded by staff through
+/api/v1/profiling/. A response profiled on request carries its id in X-Profile-Id.
+
+Streamed responses are profiled until the view returns, not while streaming.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from . import metrics
+from .sharding import ShardedTokenAuthentication
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'X-Profile'
+ID_HEADER = 'X-Profile-Id'
+MODES = ('cprofile', 'sampling')
+EXTENSIONS = {'cprofile': '.pstats', 'sampling': '.speedscope.json'}
+PROFILE_ID = re.compile(r'^\d{13}-[0-9a-f]{8}$')
+# Layers time is attributed to, by the file of the innermost frame; the first match wins.
+LAYERS = [
+    ('orm', ('/django/db/',)),
+    ('serializer', ('/rest_framework/serializers.py', '/rest_framework/fields.py',
+                    '/rest_framework/relations.py', '/notes/serializers.py')),
+    ('app', ('/notes/',)),
+]
+
+metrics.describe('notes_profiles_total', 'Profiled requests by mode and trigger.')
+
+
+def layer_of(filename: str) -> str:
+    """
+    Returns the layer a source file belongs to ('framework' if none matches).
+    """
+    filename = filename.replace(os.sep, '/')
+    for layer, markers in LAYERS:
+        if any(marker in filename for marker in markers):
+            return layer
+    return 'framework'
+
+
+class SqlTimer:
+    """
+    Database execute wrapper counting queries and their total time.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class CProfiler:
+    """
+    Runs cProfile over the request thread.
+    """
+    mode = 'cprofile'
+
+    def __init__(self) -> None:
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+    def breakdown(self) -> dict:
+        """
+        Returns milliseconds of own time per layer.
+        """
+        stats = pstats.Stats(self.profile)
+        layers = Counter()
+        for (filename, _, _), (_, _, own_time, _, _) in stats.stats.items():
+            layers[layer_of(filename)] += own_time * 1000
+        return {layer: round(ms, 3) for layer, ms in layers.items()}
+
+    def write(self, path: str, name: str) -> None:
+        self.profile.dump_stats(path)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the thread that started it from a background thread.
+    """
+    mode = 'sampling'
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.samples = Counter()
+        self.elapsed = 0.0
+        self._done = threading.Event()
+
+    def start(self) -> None:
+        self._target = threading.get_ident()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._done.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self._started
+
+    def _run(self) -> None:
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, frame.f_lineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def breakdown(self) -> dict:
+        """
+        Returns estimated milliseconds per layer, from the innermost frame of each sample.
+        """
+        layers = Counter()
+        for stack, count in self.samples.items():
+            layers[layer_of(stack[-1][1])] += count * self.interval * 1000
+        return {layer: round(ms, 3) for layer, ms in layers.items()}
+
+    def speedscope(self, name: str) -> dict:
+        """
+        Returns the samples as a speedscope 'sampled' profile.
+        """
+        frames = {}
+        samples = []
+        weights = []
+        for stack, count in self.samples.items():
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+            weights.append(count * self.interval * 1000)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'turbo_ai',
+            'shared': {'frames': [{'name': func, 'file': file, 'line': line} for func, file, line in frames]},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': self.elapsed * 1000,
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+
+    def write(self, path: str, name: str) -> None:
+        with open(path, 'w') as fh:
+            json.dump(self.speedscope(name), fh)
+
+
+def make_profiler(mode: str):
+    """
+    Returns a profiler for a mode.
+    """
+    if mode == 'cprofile':
+        return CProfiler()
+    return SamplingProfiler(settings.NOTES_PROFILING_INTERVAL)
+
+
+def profile_dir() -> str:
+    """
+    Returns the ring directory, creating it if needed.
+    """
+    os.makedirs(settings.NOTES_PROFILING_DIR, exist_ok=True)
+    return settings.NOTES_PROFILING_DIR
+
+
+def new_profile_id() -> str:
+    """
+    Returns an id that sorts by creation time.
+    """
+    return f'{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}'
+
+
+def save_profile(profiler, summary: dict) -> str:
+    """
+    Writes a profile and its summary to the ring, dropping the oldest beyond
+    NOTES_PROFILING_MAX_FILES. Returns the profile id.
+    """
+    directory = profile_dir()
+    profile_id = new_profile_id()
+    filename = profile_id + EXTENSIONS[profiler.mode]
+    profiler.write(os.path.join(directory, filename), f"{summary['method']} {summary['path']}")
+
+    summary = {'id': profile_id, 'file': filename, **summary}
+    tmp_path = os.path.join(directory, f'{profile_id}.json.tmp')
+    with open(tmp_path, 'w') as fh:
+        json.dump(summary, fh)
+    os.replace(tmp_path, os.path.join(directory, f'{profile_id}.json'))
+    prune(settings.NOTES_PROFILING_MAX_FILES)
+    return profile_id
+
+
+def _profile_ids() -> List[str]:
+    """
+    Returns the ids in the ring, oldest first.
+    """
+    names = os.listdir(profile_dir())
+    return sorted(name[:-5] for name in names if name.endswith('.json') and PROFILE_ID.match(name[:-5]))
+
+
+def prune(keep: int) -> None:
+    """
+    Deletes all but the newest keep profiles.
+    """
+    for profile_id in _profile_ids()[:-keep or None]:
+        for extension in ('.json', *EXTENSIONS.values()):
+            try:
+                os.remove(os.path.join(profile_dir(), profile_id + extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> List[dict]:
+    """
+    Returns the summaries of the stored profiles, newest first.
+    """
+    summaries = []
+    for profile_id in reversed(_profile_ids()):
+        try:
+            with open(os.path.join(profile_dir(), f'{profile_id}.json')) as fh:
+                summaries.append(json.load(fh))
+        except (OSError, ValueError):
+            # Pruned by another process meanwhile.
+            continue
+    return summaries
+
+
+def profile_file(profile_id: str) -> Optional[str]:
+    """
+    Returns the path of a stored profile's data file, or None.
+    """
+    if not PROFILE_ID.match(profile_id):
+        return None
+    for extension in EXTENSIONS.values():
+        path = os.path.join(profile_dir(), profile_id + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def is_staff(request) -> bool:
+    """
+    Whether the request comes from a staff user, by session or API token.
+    DRF authenticates later, in the view, so the token is checked here.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        result = ShardedTokenAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return result is not None and result[0].is_staff
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests asked for by staff (X-Profile) or sampled (see module docstring).
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = request.headers.get(HEADER)
+        if requested and is_staff(request):
+            mode = requested if requested in MODES else settings.NOTES_PROFILING_MODE
+            trigger = 'header'
+        elif settings.NOTES_PROFILING_SAMPLE_RATE and random.random() < settings.NOTES_PROFILING_SAMPLE_RATE:
+            mode = settings.NOTES_PROFILING_MODE
+            trigger = 'sample'
+        else:
+            return self.get_response(request)
+
+        profiler = make_profiler(mode)
+        sql = SqlTimer()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sql))
+            started = time.perf_counter()
+            try:
+                profiler.start()
+            except ValueError as ex:
+                # cProfile refuses to run while another profiler is active (Python 3.12+).
+                logger.warning(f"Profiling skipped for {request.path}: {ex}")
+                return self.get_response(request)
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+            wall = time.perf_counter() - started
+
+        user = getattr(request, 'user', None)
+        summary = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'user_id': user.pk if user is not None and user.is_authenticated else None,
+            'mode': mode,
+            'trigger': trigger,
+            'created_at': timezone.now().isoformat(),
+            'wall_ms': round(wall * 1000, 3),
+            'sql_ms': round(sql.seconds * 1000, 3),
+            'sql_count': sql.count,
+            'layers_ms': profiler.breakdown(),
+        }
+        try:
+            profile_id = save_profile(profiler, summary)
+        except OSError as ex:
+            logger.error(f"Could not store profile of {request.path}: {ex}")
+            return response
+        metrics.inc('notes_profiles_total', mode=mode, trigger=trigger)
+        logger.info(f"Profiled {request.method} {request.path} ({mode}, {summary['wall_ms']:.0f}ms): {profile_id}")
+        if trigger == 'header':
+            response[ID_HEADER] = profile_id
+        return response
@@ -0,0 +1,175 @@
+"""
+ASGI endpoints that push a user's note and category changes as they happen,
+so clients do not have to poll the notes list.
+
+    /ws/notes/        WebSocket, one JSON text frame per event
+    /api/v1/events/   server-sent events (text/event-stream) with keep-alive comments
+
+Both authenticate with a DRF token, sent as `Authorization: Token <key>` or, since
+browsers cannot set headers on WebSocket/EventSource requests, as `?token=<key>`.
+A connection is a coroutine plus a small queue (no thread is held), so a pod can
+keep tens of thousands open. These routes exist only under the ASGI application
+(turbo_ai/asgi.py), e.g. `uvicorn turbo_ai.asgi:application`.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Optional
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .broker import get_broker
+from .sharding import find_token
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_PATH = '/ws/notes/'
+EVENTS_PATH = '/api/v1/events/'
+
+# Close code sent when the token is missing or invalid.
+WS_UNAUTHORIZED = 4401
+
+
+def token_from_scope(scope: dict) -> Optional[str]:
+    """
+    Returns the token key from the Authorization header or the token query parameter.
+    """
+    headers = dict(scope.get('headers', []))
+    authorization = headers.get(b'authorization', b'').decode('latin-1')
+    if authorization.startswith('Token '):
+        return authorization[len('Token '):].strip()
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return query.get('token', [None])[0]
+
+
+@sync_to_async
+def authenticate(key: Optional[str]) -> Optional[int]:
+    """
+    Returns the id of the active user owning the token, or None.
+    """
+    if not key:
+        return None
+    token = find_token(key)
+    if token is None or not token.user.is_active:
+        return None
+    return token.user_id
+
+
+def encode(event: dict) -> str:
+    """
+    Serializes an event to JSON.
+    """
+    return json.dumps(event, cls=DjangoJSONEncoder)
+
+
+async def websocket_events(scope: dict, receive, send) -> None:
+    """
+    Accepts an authenticated WebSocket and forwards the user's events until it closes.
+    Messages from the client are ignored.
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    user_id = await authenticate(token_from_scope(scope))
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': WS_UNAUTHORIZED})
+        return
+
+    subscription = get_broker().subscribe(user_id)
+    await send({'type': 'websocket.accept'})
+
+    async def forward() -> None:
+        while True:
+            event = await subscription.get()
+            await send({'type': 'websocket.send', 'text': encode(event)})
+
+    forwarder = asyncio.create_task(forward())
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+    finally:
+        forwarder.cancel()
+        subscription.close()
+
+
+async def _wait_for_disconnect(receive) -> None:
+    """
+    Returns once the client has disconnected.
+    """
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def sse_events(scope: dict, receive, send) -> None:
+    """
+    Streams the user's events as server-sent events until the client disconnects,
+    sending a keep-alive comment every NOTES_REALTIME_HEARTBEAT seconds of silence.
+    """
+    user_id = await authenticate(token_from_scope(scope))
+    if user_id is None:
+        body = json.dumps({'detail': 'Authentication credentials were not provided.'}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 401,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+        return
+
+    subscription = get_broker().subscribe(user_id)
+    disconnected = asyncio.create_task(_wait_for_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+        while not disconnected.done():
+            next_event = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnected},
+                timeout=settings.NOTES_REALTIME_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if next_event in done:
+                event = next_event.result()
+                body = f'event: {event["type"]}\ndata: {encode(event)}\n\n'.encode()
+            else:
+                next_event.cancel()
+                if disconnected.done():
+                    break
+                body = b': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        disconnected.cancel()
+        subscription.close()
+
+
+class RealtimeRouter:
+    """
+    ASGI router: serves the realtime endpoints and hands everything else to Django.
+    """
+
+    def __init__(self, application) -> None:
+        self.application = application
+
+    async def __call__(self, scope: dict, receive, send) -> None:
+        if scope['type'] == 'websocket':
+            if scope['path'] == WEBSOCKET_PATH:
+                return await websocket_events(scope, receive, send)
+            await receive()
+            return await send({'type': 'websocket.close'})
+        if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+            return await sse_events(scope, receive, send)
+        return await self.application(scope, receive, send)
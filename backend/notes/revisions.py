@@ -0,0 +1,166 @@
+"""
+Revision history for note content.
+
+Every content change is stored as a compressed delta against the previous revision,
+with a full snapshot every NOTES_REVISION_SNAPSHOT_INTERVAL revisions. Rebuilding any
+version therefore applies at most that many deltas. Only the newest
+NOTES_REVISION_RETENTION revisions are kept; compaction turns the oldest kept
+revision into a snapshot before older ones are dropped.
+"""
+
+import json
+import logging
+import zlib
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError
+
+from . import sharding
+from .models import Note, NoteRevision
+from .textdiff import apply_delta, make_delta
+
+logger = logging.getLogger(__name__)
+
+# Tries at recording a revision when concurrent saves of the note take its number first.
+RECORD_ATTEMPTS = 3
+
+
+def _compress_text(text: str) -> bytes:
+    """
+    Encodes and zlib-compresses text.
+    """
+    return zlib.compress(text.encode('utf-8'))
+
+
+def _decompress_text(data) -> str:
+    """
+    Inverse of _compress_text; accepts bytes or memoryview.
+    """
+    return zlib.decompress(bytes(data)).decode('utf-8')
+
+
+def _create(note: Note, number: int, content: str, previous: Optional[str]) -> NoteRevision:
+    """
+    Stores a revision as a delta against previous, or as a snapshot when there is no
+    previous content or the delta would not be smaller than the full text.
+    """
+    data = None
+    if previous is not None:
+        delta = _compress_text(json.dumps(make_delta(previous, content), separators=(',', ':')))
+        snapshot = _compress_text(content)
+        data = delta if len(delta) < len(snapshot) else None
+    return NoteRevision.objects.create(
+        note=note,
+        number=number,
+        is_snapshot=data is None,
+        data=data if data is not None else _compress_text(content),
+        content_length=len(content)
+    )
+
+
+def _latest(note: Note) -> Optional[NoteRevision]:
+    """
+    Returns the note's newest revision (only its number loaded), or None.
+    """
+    return note.revisions.order_by('-number').only('number').first()
+
+
+def record_revision(note: Note, previous_content: Optional[str] = None) -> NoteRevision:
+    """
+    Records note.content as the next revision of the note.
+    For notes without history, previous_content (if given) is stored first,
+    so the version before the first tracked edit is kept too.
+
+    A concurrent save of the same note may record the next number first; the
+    unique number constraint then rejects this one, and it is recorded again after
+    it, diffed against the stored history since previous_content is no longer the
+    revision before.
+    """
+    for attempt in range(1, RECORD_ATTEMPTS + 1):
+        try:
+            with sharding.atomic():
+                return _record(note, previous_content)
+        except IntegrityError:
+            if attempt == RECORD_ATTEMPTS:
+                raise
+            logger.info(f"Revision number of note {note.pk} taken by a concurrent save, retrying")
+            previous_content = None
+
+
+def _record(note: Note, previous_content: Optional[str]) -> NoteRevision:
+    interval = settings.NOTES_REVISION_SNAPSHOT_INTERVAL
+
+    latest = _latest(note)
+    if latest is None:
+        if previous_content is None or previous_content == note.content:
+            return _create(note, 1, note.content, None)
+        _create(note, 1, previous_content, None)
+        return _create(note, 2, note.content, previous_content)
+
+    number = latest.number + 1
+    snapshots = note.revisions.filter(is_snapshot=True).order_by('-number')
+    last_snapshot = snapshots.values_list('number', flat=True).first()
+    if previous_content is None:
+        previous_content = rebuild_content(note, latest.number)
+
+    if last_snapshot is None or number - last_snapshot >= interval:
+        revision = _create(note, number, note.content, None)
+    else:
+        revision = _create(note, number, note.content, previous_content)
+
+    compact_revisions(note, newest=number, slack=interval)
+    return revision
+
+
+def rebuild_content(note: Note, number: int) -> Optional[str]:
+    """
+    Reconstructs the note content at a revision number, or None if it is not stored.
+    Reads the closest snapshot at or before the revision plus the deltas after it.
+    """
+    snapshot_number = note.revisions.filter(
+        is_snapshot=True,
+        number__lte=number
+    ).order_by('-number').values_list('number', flat=True).first()
+    if snapshot_number is None:
+        return None
+
+    revisions = list(
+        note.revisions.filter(number__gte=snapshot_number, number__lte=number).order_by('number')
+    )
+    if not revisions or revisions[-1].number != number:
+        return None
+
+    content = _decompress_text(revisions[0].data)
+    for revision in revisions[1:]:
+        content = apply_delta(content, json.loads(_decompress_text(revision.data)))
+    return content
+
+
+def compact_revisions(note: Note, newest: Optional[int] = None, slack: int = 0) -> int:
+    """
+    Drops revisions beyond NOTES_REVISION_RETENTION, first rewriting the oldest
+    kept revision as a snapshot so that later deltas still apply.
+    With slack, nothing happens until the history exceeds retention by that many
+    revisions, which amortizes compaction over several edits.
+    Returns the number of deleted revisions.
+    """
+    retention = settings.NOTES_REVISION_RETENTION
+    if newest is None:
+        newest = note.revisions.order_by('-number').values_list('number', flat=True).first() or 0
+    oldest = note.revisions.order_by('number').values_list('number', flat=True).first() or newest
+    if newest - oldest + 1 <= retention + slack:
+        return 0
+    cutoff = newest - retention + 1
+
+    with sharding.atomic():
+        oldest_kept = note.revisions.get(number=cutoff)
+        if not oldest_kept.is_snapshot:
+            content = rebuild_content(note, cutoff)
+            oldest_kept.data = _compress_text(content)
+            oldest_kept.is_snapshot = True
+            oldest_kept.save(update_fields=['data', 'is_snapshot'])
+        deleted, _ = note.revisions.filter(number__lt=cutoff).delete()
+
+    logger.debug(f"Compacted {deleted} revisions of note {note.id}")
+    return deleted
@@ -2,10 +2,26 @@
 Serializers define how model instances are converted to and from JSON representations.
 """
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from rest_framework import serializers
+from django.utils import timezone
+from rest_framework import exceptions, serializers, status
 
-from .models import Category, Note
+from . import autosave, tagging
+from .fields import make_preview
+from .fingerprints import index_note
+from .models import PREVIEW_LENGTH, Category, DashboardSummary, DeletionJob, Note, NoteRevision, Tag
+from .revisions import record_revision
+from .textdiff import DeltaError, apply_delta, content_hash
+
+
+class PatchConflict(exceptions.APIException):
+    """
+    A content_patch was made against content the note no longer has.
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The note changed since this patch was made; reload it and patch the new content.'
+    default_code = 'patch_conflict'
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -19,25 +35,48 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'first_name', 'last_name']
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class ClientIdSerializerMixin:
+    """
+    client_id is optional and set once, when the object is created.
+    """
+    client_id_kwargs = {'required': False, 'allow_blank': False}
+
+    def validate_client_id(self, value):
+        if self.instance is not None and value != self.instance.client_id:
+            raise serializers.ValidationError('The client id of an existing object cannot be changed.')
+        return value
+
+
+class CategorySerializer(ClientIdSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Category model.
     """
 
     class Meta:
         model = Category
-        fields = ['id', 'name', 'color', 'user']
+        fields = ['id', 'name', 'color', 'user', 'client_id']
         read_only_fields = ['user']
+        extra_kwargs = {'client_id': ClientIdSerializerMixin.client_id_kwargs}
 
 
-class NoteSerializer(serializers.ModelSerializer):
+class NoteSerializer(ClientIdSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Note model.
     Exposes category in read-only form and category_id in write-only form.
+    Updates may send content_patch (a text delta, see notes.textdiff) instead of content,
+    with base_content_hash, the content_hash() of the content it was made against.
+    tags is the full list of the note's tag names (see notes/tagging.py).
     """
 
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True, required=False)
+    content_patch = serializers.JSONField(write_only=True, required=False)
+    base_content_hash = serializers.CharField(write_only=True, required=False)
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=tagging.TAG_NAME_MAX_LENGTH),
+        source='tag_names',
+        required=False
+    )
 
     class Meta:
         model = Note
@@ -45,21 +84,218 @@ class NoteSerializer(serializers.ModelSerializer):
             'id',
             'title',
             'content',
+            'content_patch',
+            'base_content_hash',
             'category',
             'category_id',
+            'tags',
             'created_at',
-            'updated_at'
+            'updated_at',
+            'client_id'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        extra_kwargs = {'client_id': ClientIdSerializerMixin.client_id_kwargs}
+
+    # updated_at of the note whose content a content_patch was checked against; the
+    # patched note is only written while it is still that version (see update()).
+    patch_version = None
+
+    def validate(self, attrs):
+        """
+        Applies content_patch, which is only accepted on updates, not together with
+        content, and with the hash of the content it was made against. A patch made
+        against other content (a stale tab, a retried request) is refused with 409.
+        """
+        base_hash = attrs.pop('base_content_hash', None)
+        self.patch_version = None
+        if 'content_patch' not in attrs:
+            return attrs
+        if self.instance is None:
+            raise serializers.ValidationError({'content_patch': 'Only allowed when updating a note.'})
+        if 'content' in attrs:
+            raise serializers.ValidationError({'content_patch': 'Send either content or content_patch.'})
+        if not base_hash:
+            raise serializers.ValidationError({'base_content_hash': 'Required with content_patch.'})
+        if base_hash != content_hash(self.instance.content):
+            raise PatchConflict()
+        try:
+            attrs['content'] = apply_delta(self.instance.content, attrs.pop('content_patch'))
+        except DeltaError as ex:
+            raise serializers.ValidationError({'content_patch': str(ex)})
+        self.patch_version = self.instance.updated_at
+        return attrs
+
+    def validate_tags(self, value):
+        """
+        Normalizes tag names, dropping blanks and repeats.
+        """
+        names = list(dict.fromkeys(name for name in map(tagging.normalize, value) if name))
+        if len(names) > settings.NOTES_MAX_TAGS_PER_NOTE:
+            raise serializers.ValidationError(f'A note can have at most {settings.NOTES_MAX_TAGS_PER_NOTE} tags.')
+        return names
+
+    def create(self, validated_data):
+        """
+        Creates the note and tags it.
+        """
+        tag_names = validated_data.pop('tag_names', [])
+        note = super().create(validated_data)
+        tagging.set_tags(note, tag_names, created=True)
+        return note
 
     def update(self, instance, validated_data):
+        """
+        Writes only the columns whose values changed, and skips the write entirely
+        when nothing did. Saved with coalesce=True, title and content edits are
+        buffered instead (see notes/autosave.py). Tags are stored apart from the
+        note's row and written after it, so a patch refused with 409 changes none.
+        """
+        coalesce = validated_data.pop('coalesce', False)
         category_id = validated_data.pop('category_id', None)
+        tag_names = validated_data.pop('tag_names', None)
+        previous_content = instance.content
 
+        changed_fields = []
         if category_id is not None:
-            try:
-                category = Category.objects.get(id=category_id, user=instance.user)
+            category = Category.objects.filter(
+                id=category_id,
+                user=instance.user,
+                deleted_at__isnull=True
+            ).first()
+            if instance.category_id != (category.id if category else None):
                 instance.category = category
-            except Category.DoesNotExist:
-                instance.category = None
+                changed_fields.append('category')
+
+        for field, value in validated_data.items():
+            if getattr(instance, field) != value:
+                setattr(instance, field, value)
+                changed_fields.append(field)
+
+        if changed_fields:
+            self.write(instance, changed_fields, previous_content, coalesce)
+        if tag_names is not None:
+            tagging.set_tags(instance, tag_names)
+        return instance
+
+    def write(self, instance, changed_fields: list, previous_content: str, coalesce: bool) -> None:
+        """
+        Writes (or buffers) the changed fields of a note. A patched note is only
+        written if it is still the version the patch was checked against: two
+        patches made against the same content cannot both be applied.
+        """
+        if coalesce:
+            if set(changed_fields) <= set(autosave.FIELDS):
+                try:
+                    autosave.buffer(instance, previous_content, expected_version=self.patch_version)
+                except autosave.StaleEdit:
+                    raise PatchConflict()
+                return
+            # Other fields are written at once, after the edits buffered so far.
+            autosave.flush(instance.pk)
+
+        if self.patch_version is None:
+            instance.save(update_fields=changed_fields + ['updated_at'])
+        else:
+            values = {field: getattr(instance, field) for field in changed_fields}
+            values['preview'] = make_preview(instance.content, PREVIEW_LENGTH)
+            now = timezone.now()
+            if not Note.objects.filter(pk=instance.pk, updated_at=self.patch_version).update(updated_at=now, **values):
+                raise PatchConflict()
+            instance.preview, instance.updated_at = values['preview'], now
+        if instance.content != previous_content:
+            record_revision(instance, previous_content=previous_content)
+        if 'title' in changed_fields or 'content' in changed_fields:
+            index_note(instance)
+
+    def to_representation(self, instance):
+        """
+        Hides categories that are pending deferred deletion. Lists load the tags of
+        all their notes beforehand (tagging.attach()); a single note loads its own.
+        """
+        if not hasattr(instance, 'tag_names'):
+            tagging.attach([instance])
+        data = super().to_representation(instance)
+        if instance.category is not None and instance.category.deleted_at is not None:
+            data['category'] = None
+        return data
+
+
+class NotePreviewSerializer(serializers.ModelSerializer):
+    """
+    Read-only list representation of a Note with a truncated preview instead of content.
+    """
+
+    category = CategorySerializer(read_only=True)
+    tags = serializers.ListField(child=serializers.CharField(), source='tag_names', read_only=True)
+
+    class Meta:
+        model = Note
+        fields = ['id', 'title', 'preview', 'category', 'tags', 'created_at', 'updated_at', 'client_id']
+        read_only_fields = fields
+
+    def to_representation(self, instance):
+        """
+        Hides categories that are pending deferred deletion.
+        """
+        if not hasattr(instance, 'tag_names'):
+            tagging.attach([instance])
+        data = super().to_representation(instance)
+        if instance.category is not None and instance.category.deleted_at is not None:
+            data['category'] = None
+        return data
+
+
+class DeletionJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for DeletionJob progress reporting (read-only).
+    """
+
+    class Meta:
+        model = DeletionJob
+        fields = ['id', 'kind', 'target_id', 'status', 'total', 'processed', 'created_at', 'finished_at']
+        read_only_fields = fields
+
+
+class TagSerializer(serializers.ModelSerializer):
+    """
+    Serializer for Tag model. Tags are created by tagging notes; only the name can be changed.
+    """
+
+    class Meta:
+        model = Tag
+        fields = ['id', 'name', 'note_count']
+        read_only_fields = ['note_count']
+
+    def validate_name(self, value):
+        """
+        Normalizes the name, which must stay unique among the user's tags.
+        """
+        name = tagging.normalize(value)
+        if not name:
+            raise serializers.ValidationError('This field may not be blank.')
+        user_id = self.instance.user_id if self.instance else self.context['request'].user.id
+        if Tag.objects.filter(user_id=user_id, name=name).exclude(pk=getattr(self.instance, 'pk', None)).exists():
+            raise serializers.ValidationError('You already have a tag with this name.')
+        return name
 
-        return super().update(instance, validated_data)
+
+class DashboardSummarySerializer(serializers.ModelSerializer):
+    """
+    Serializer for the precomputed dashboard summary (read-only).
+    """
+
+    class Meta:
+        model = DashboardSummary
+        fields = ['categories', 'uncategorized_count', 'note_count', 'recent_notes', 'updated_at']
+        read_only_fields = fields
+
+
+class NoteRevisionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for NoteRevision metadata (read-only, without content).
+    """
+
+    class Meta:
+        model = NoteRevision
+        fields = ['number', 'is_snapshot', 'content_length', 'created_at']
+        read_only_fields = fields
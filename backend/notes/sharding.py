@@ -0,0 +1,761 @@
+"""
+Sharding of user data across databases by user id.
+
+A user's notes, categories, API tokens and the other rows of the notes app live in
+one shard: a database alias from NOTES_SHARDS. The user table and the shard map
+(ShardAssignment) stay in the default database. Each shard keeps a mirror of its
+users' rows, so foreign keys to the user hold there too.
+
+Routing. ShardRouter sends queries for sharded models to the first of these:
+
+    the shard of the user an instance belongs to (saves, related managers),
+    the shard activated for the current request or job,
+    the first shard.
+
+Requests activate the shard of the user that authenticated them
+(ShardedTokenAuthentication; ShardMiddleware for session users and for resetting
+between requests). Code outside a request runs under `with use_shard(alias)`,
+`with for_user(user_id)` or `for alias in each_shard()`, and background.submit()
+carries the active shard over to its job. Transactions and on-commit callbacks
+must target the shard too, so use atomic() and on_commit() from this module instead
+of the django.db.transaction defaults. Writes spanning the default database and a
+shard (e.g. a user row and its categories) are not atomic together.
+
+Placement. A user is assigned a shard by hashing the id when the user is created.
+ShardAssignment records the choice, so users can be moved later. Each shard hands
+out ids from its own range, NOTES_SHARD_ID_SPACING apart by position in NOTES_SHARDS
+(so append new shards at the end), which lets moved rows keep their ids and URLs.
+prepare_shard() sets the ranges and runs after every migrate. SQLite would give new
+rows ids past the largest in the table, which after a move may be a row from a
+shard with a higher range, so there new rows take their ids from the table's
+sequence instead (next_id()), and inserts of rows with their own ids keep that
+sequence in the shard's range (keep_sequence()).
+
+Moving. move_user() moves a user while the API stays up. First the user is marked
+'moving': writes get 503 with Retry-After, and reads are still served from the old
+shard. Then the rows are copied, the map is flipped, and the old rows are deleted.
+Before the copy and before the delete it waits out the shard map cache
+(NOTES_SHARD_MAP_CACHE_SECONDS), so every process has seen the change. Code
+writing for a user outside a request (for_user(), background jobs) is refused by
+atomic() meanwhile, and jobs covering a whole shard skip moving_users(). Writes
+that still reach the old shard are caught by comparing its rows before and after
+the copy: the move is then called off, or, after the flip, the old rows are kept.
+`python manage.py rebalance_shards` moves single users or evens out the shards.
+
+With a single shard (NOTES_SHARDS = ['default'], the default) none of this
+costs a query.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import Case, Count, Max, Value, When
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions, status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import SAFE_METHODS
+
+from .models import ShardAssignment
+
+logger = logging.getLogger(__name__)
+
+SHARDED_APPS = ('notes', 'authtoken')
+# Seconds a client is asked to wait while its data moves between shards.
+MOVE_RETRY_AFTER = 5
+# Most users whose shard is remembered per process.
+MAP_CACHE_SIZE = 10000
+TOKEN_CACHE_TIMEOUT = 3600
+
+_current: ContextVar[Optional[str]] = ContextVar('notes_shard', default=None)
+# The user the active block writes for, if one (see atomic()).
+_owner: ContextVar[Optional[int]] = ContextVar('notes_shard_owner', default=None)
+_map_cache: Dict[int, Tuple[str, str, float]] = {}
+_map_lock = threading.Lock()
+
+
+class ShardingError(RuntimeError):
+    """
+    Raised when a shard operation cannot be carried out.
+    """
+
+
+class ShardMoving(exceptions.APIException):
+    """
+    The user's data is being moved to another shard; writes are refused meanwhile.
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Your data is being moved, please retry shortly.')
+    default_code = 'shard_moving'
+    # DRF's exception handler sends this as Retry-After.
+    wait = MOVE_RETRY_AFTER
+
+
+def shards() -> List[str]:
+    """
+    Returns the shard aliases.
+    """
+    return settings.NOTES_SHARDS
+
+
+def is_enabled() -> bool:
+    """
+    Whether user data is spread over more than one database.
+    """
+    return len(settings.NOTES_SHARDS) > 1
+
+
+def is_sharded(model) -> bool:
+    """
+    Whether a model's rows live in their owner's shard.
+    """
+    return model._meta.app_label in SHARDED_APPS and model is not ShardAssignment
+
+
+def current() -> str:
+    """
+    Returns the shard active for the current request or job (the first shard if none).
+    """
+    return _current.get() or settings.NOTES_SHARDS[0]
+
+
+def activate(alias: str) -> None:
+    """
+    Makes alias the active shard for the rest of the request (ShardMiddleware resets it).
+    """
+    _current.set(alias)
+
+
+def activate_user(user_id: int) -> str:
+    """
+    Activates the shard of a user and returns it.
+    """
+    alias = shard_for_user(user_id)
+    activate(alias)
+    return alias
+
+
+def current_owner() -> Optional[int]:
+    """
+    Returns the user the active request or job writes for, if it is one user's.
+    """
+    return _owner.get()
+
+
+@contextmanager
+def use_shard(alias: str, owner: Optional[int] = None) -> Iterator[str]:
+    """
+    Runs the block with alias as the active shard, writing for owner if given.
+    """
+    token = _current.set(alias)
+    owner_token = _owner.set(owner)
+    try:
+        yield alias
+    finally:
+        _owner.reset(owner_token)
+        _current.reset(token)
+
+
+def for_user(user_id: int):
+    """
+    Runs the block with the user's shard active.
+    """
+    return use_shard(shard_for_user(user_id), user_id)
+
+
+def each_shard() -> Iterator[str]:
+    """
+    Yields every shard alias with that shard active, for jobs covering all users.
+    """
+    for alias in shards():
+        with use_shard(alias):
+            yield alias
+
+
+def assert_writable() -> None:
+    """
+    Raises ShardMoving if the user the active block writes for is being moved.
+    """
+    user_id = _owner.get()
+    if user_id is not None and is_enabled() and lookup(user_id)[1] == ShardAssignment.STATE_MOVING:
+        raise ShardMoving()
+
+
+def atomic(**kwargs):
+    """
+    transaction.atomic() on the active shard, refused while the user it writes for is being moved.
+    """
+    assert_writable()
+    return transaction.atomic(using=current(), **kwargs)
+
+
+def on_commit(func) -> None:
+    """
+    transaction.on_commit() on the active shard.
+    """
+    transaction.on_commit(func, using=current())
+
+
+# Shard map
+
+def placement(user_id: int) -> str:
+    """
+    Returns the shard a new user is assigned to.
+    """
+    return shards()[zlib.crc32(str(user_id).encode()) % len(shards())]
+
+
+def lookup(user_id: int) -> Tuple[str, str]:
+    """
+    Returns (shard, state) of a user, assigning a shard on first use. Entries are
+    cached per process for NOTES_SHARD_MAP_CACHE_SECONDS.
+    """
+    now = time.monotonic()
+    cached = _map_cache.get(user_id)
+    if cached is not None and now - cached[2] < settings.NOTES_SHARD_MAP_CACHE_SECONDS:
+        return cached[0], cached[1]
+
+    row = ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('shard', 'state').first()
+    if row is None:
+        row = (assign(user_id), ShardAssignment.STATE_ACTIVE)
+    with _map_lock:
+        if len(_map_cache) >= MAP_CACHE_SIZE:
+            _map_cache.clear()
+        _map_cache[user_id] = (row[0], row[1], now)
+    return row
+
+
+def shard_for_user(user_id: int) -> str:
+    """
+    Returns the shard holding a user's data.
+    """
+    if not is_enabled():
+        return settings.NOTES_SHARDS[0]
+    return lookup(user_id)[0]
+
+
+def assign(user_id: int) -> str:
+    """
+    Records the shard of a user that has none yet and mirrors the user row there.
+    """
+    user = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).first()
+    alias = placement(user_id)
+    if user is None:
+        return alias
+    mirror_user(user, alias)
+    assignment, _ = ShardAssignment.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+        user_id=user_id,
+        defaults={'shard': alias}
+    )
+    return assignment.shard
+
+
+def forget(user_id: Optional[int] = None) -> None:
+    """
+    Drops cached shard map entries (all of them without user_id).
+    """
+    with _map_lock:
+        if user_id is None:
+            _map_cache.clear()
+        else:
+            _map_cache.pop(user_id, None)
+
+
+def mirror_user(user: User, alias: str) -> None:
+    """
+    Creates or refreshes the copy of a user row in a shard.
+    """
+    if alias == DEFAULT_DB_ALIAS:
+        return
+    values = {field.attname: getattr(user, field.attname) for field in User._meta.concrete_fields}
+    values.pop('id')
+    if not User.objects.using(alias).filter(pk=user.pk).update(**values):
+        User.objects.using(alias).bulk_create([User(pk=user.pk, **values)])
+
+
+def user_saved(sender, instance: User, created: bool, raw: bool = False, **kwargs) -> None:
+    """
+    post_save handler assigning new users a shard and keeping mirrors current.
+    """
+    if raw or not is_enabled() or kwargs.get('using', DEFAULT_DB_ALIAS) != DEFAULT_DB_ALIAS:
+        return
+    if created:
+        assign(instance.pk)
+    else:
+        mirror_user(instance, lookup(instance.pk)[0])
+
+
+def user_deleted(sender, instance: User, **kwargs) -> None:
+    """
+    pre_delete handler removing the user's mirror, and with it its rows, from its shard.
+    """
+    if not is_enabled() or kwargs.get('using', DEFAULT_DB_ALIAS) != DEFAULT_DB_ALIAS:
+        return
+    alias = ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=instance.pk).values_list(
+        'shard', flat=True
+    ).first()
+    if alias is not None and alias != DEFAULT_DB_ALIAS:
+        User.objects.using(alias).filter(pk=instance.pk).delete()
+    forget(instance.pk)
+
+
+def id_range(alias: str) -> Tuple[int, int]:
+    """
+    Returns the first id of a shard's range and the first id past it.
+    """
+    offset = shards().index(alias) * settings.NOTES_SHARD_ID_SPACING
+    return offset, offset + settings.NOTES_SHARD_ID_SPACING
+
+
+def prepare_shard(alias: str) -> None:
+    """
+    Moves the id sequences of the sharded tables in a shard to the shard's range.
+    """
+    offset, end = id_range(alias)
+    if not offset:
+        return
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in sharded_models():
+            pk = model._meta.pk
+            if pk.get_internal_type() not in ('AutoField', 'BigAutoField'):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, offset])
+                elif row[0] < offset:
+                    cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [offset, table])
+            elif connection.vendor == 'postgresql':
+                quoted = connection.ops.quote_name(table)
+                column = connection.ops.quote_name(pk.column)
+                # Rows moved in from shards with higher ranges do not count.
+                cursor.execute(
+                    f'SELECT setval(pg_get_serial_sequence(%s, %s), '
+                    f'GREATEST(%s, (SELECT COALESCE(MAX({column}), 0) FROM {quoted} WHERE {column} < %s)))',
+                    [quoted, pk.column, offset, end]
+                )
+            else:
+                raise ShardingError(f'Cannot set id ranges on {connection.vendor} databases.')
+
+
+def next_id(instance) -> Optional[int]:
+    """
+    Returns the id of a new row of a sharded model, or None to let the database
+    pick it. On SQLite shards other than the last, ids come from the table's
+    sequence, as rows moved in may hold ids past the shard's range.
+    """
+    if not is_enabled() or not is_sharded(type(instance)):
+        return None
+    alias = router.db_for_write(type(instance), instance=instance)
+    connection = connections[alias]
+    if connection.vendor != 'sqlite' or alias == shards()[-1]:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = %s RETURNING seq',
+            [instance._meta.db_table]
+        )
+        row = cursor.fetchone()
+    # Without a sequence row nothing was inserted yet, so the table holds no ids past the range.
+    return row[0] if row else None
+
+
+@contextmanager
+def keep_sequence(model, alias: str) -> Iterator[None]:
+    """
+    Runs a block inserting rows of model with their own ids (copied or restored
+    rows) in one transaction, putting the table's SQLite sequence back in the
+    shard's range if the ids advanced it past. PostgreSQL sequences ignore given ids.
+    """
+    connection = connections[alias]
+    if not is_enabled() or connection.vendor != 'sqlite':
+        yield
+        return
+    start, end = id_range(alias)
+    table = model._meta.db_table
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+        row = cursor.fetchone()
+        yield
+        cursor.execute(
+            'UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq >= %s',
+            [row[0] if row else start, table, end]
+        )
+
+
+def prepare_after_migrate(sender, using: str = DEFAULT_DB_ALIAS, **kwargs) -> None:
+    """
+    post_migrate handler preparing the id ranges of a migrated shard.
+    """
+    if using in shards():
+        prepare_shard(using)
+
+
+# Routing
+
+def _instance_shard(instance) -> Optional[str]:
+    """
+    Returns the shard an instance hint points to, if it tells.
+    """
+    if isinstance(instance, User):
+        return shard_for_user(instance.pk) if instance.pk else None
+    if not is_sharded(type(instance)):
+        return None
+    if instance._state.db is not None:
+        return instance._state.db
+    for attname in ('user_id', 'owner_id'):
+        owner = getattr(instance, attname, None)
+        if owner is not None:
+            return shard_for_user(owner)
+    for field in instance._meta.concrete_fields:
+        if field.is_relation:
+            related = field.get_cached_value(instance, None)
+            if related is not None and related._state.db is not None and is_sharded(type(related)):
+                return related._state.db
+    return None
+
+
+class ShardRouter:
+    """
+    Database router sending sharded models to their user's shard and everything
+    else to the default database.
+    """
+
+    def db_for_read(self, model, **hints) -> str:
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        if not is_enabled():
+            return settings.NOTES_SHARDS[0]
+        instance = hints.get('instance')
+        alias = _instance_shard(instance) if instance is not None else None
+        return alias or current()
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints) -> Optional[bool]:
+        """
+        Users live in the default database and, mirrored, in every shard.
+        """
+        if isinstance(obj1, User) or isinstance(obj2, User):
+            return True
+        return None
+
+
+# Authentication
+
+def _token_cache_key(key: str) -> str:
+    return f'notes:shard:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def find_token(key: str) -> Optional[Token]:
+    """
+    Returns the token with its user, looking in the shard remembered for the key first.
+    """
+    if not is_enabled():
+        return Token.objects.select_related('user').filter(key=key).first()
+    cache = caches['default']
+    remembered = cache.get(_token_cache_key(key))
+    aliases = sorted(shards(), key=lambda alias: alias != remembered)
+    for alias in aliases:
+        token = Token.objects.using(alias).select_related('user').filter(key=key).first()
+        if token is not None:
+            if alias != remembered:
+                cache.set(_token_cache_key(key), alias, timeout=TOKEN_CACHE_TIMEOUT)
+            return token
+    return None
+
+
+def check_writable(user_id: int, method: str) -> None:
+    """
+    Activates the user's shard, refusing writes while the user is being moved.
+    """
+    alias, state = lookup(user_id)
+    if state == ShardAssignment.STATE_MOVING and method not in SAFE_METHODS:
+        raise ShardMoving()
+    activate(alias)
+    _owner.set(user_id)
+
+
+class ShardedTokenAuthentication(TokenAuthentication):
+    """
+    DRF token authentication that finds the token in its user's shard and activates that shard.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None and is_enabled():
+            check_writable(result[0].pk, request.method)
+        return result
+
+    def authenticate_credentials(self, key):
+        token = find_token(key)
+        if token is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return token.user, token
+
+
+class ShardMiddleware:
+    """
+    Starts every request without an active shard and activates the shard of a
+    session-authenticated user before the view runs.
+    """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current.set(None)
+        owner_token = _owner.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _owner.reset(owner_token)
+            _current.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        user = getattr(request, 'user', None)
+        if not is_enabled() or user is None or not user.is_authenticated:
+            return None
+        try:
+            check_writable(user.pk, request.method)
+        except ShardMoving as ex:
+            return JsonResponse(
+                {'error': str(ex.detail)},
+                status=ex.status_code,
+                headers={'Retry-After': str(MOVE_RETRY_AFTER)}
+            )
+        return None
+
+
+# Moving users
+
+def sharded_models() -> list:
+    """
+    Returns the concrete sharded models, each after the models it references.
+    """
+    candidates = [
+        model for model in apps.get_models()
+        if is_sharded(model) and not model._meta.proxy and model._meta.managed
+    ]
+    ordered = []
+    while candidates:
+        for model in candidates:
+            references = {
+                field.related_model for field in model._meta.concrete_fields
+                if field.is_relation and field.related_model in candidates and field.related_model is not model
+            }
+            if not references:
+                ordered.append(model)
+                candidates.remove(model)
+                break
+        else:
+            raise ShardingError('Sharded models reference each other in a cycle.')
+    return ordered
+
+
+def owner_filter(model, user_id: int) -> dict:
+    """
+    Returns the queryset filter selecting a user's rows of a sharded model.
+    """
+    names = {field.attname for field in model._meta.concrete_fields}
+    for attname in ('user_id', 'owner_id'):
+        if attname in names:
+            return {attname: user_id}
+    for field in model._meta.concrete_fields:
+        if field.is_relation and is_sharded(field.related_model):
+            return {f'{field.name}__{key}': value for key, value in owner_filter(field.related_model, user_id).items()}
+    raise ShardingError(f'{model.__name__} rows have no owner.')
+
+
+def _timestamp_fields(model) -> list:
+    return [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+
+
+def _snapshot(user_id: int, alias: str) -> Dict[str, dict]:
+    """
+    Returns, per model, the number of a user's rows in a shard, the largest id and
+    the latest timestamps, which change with every insert, delete and timestamped update.
+    """
+    snapshot = {}
+    for model in sharded_models():
+        aggregates = {'row_count': Count('pk'), 'max_pk': Max('pk')}
+        aggregates.update({f'max_{field.attname}': Max(field.attname) for field in _timestamp_fields(model)})
+        queryset = model._base_manager.using(alias).filter(**owner_filter(model, user_id))
+        snapshot[model._meta.label] = queryset.aggregate(**aggregates)
+    return snapshot
+
+
+def _copy_rows(model, user_id: int, source: str, target: str, batch_size: int) -> int:
+    """
+    Copies a user's rows of one model, keeping ids and timestamps. Returns the number copied.
+    """
+    queryset = model._base_manager.using(source).filter(**owner_filter(model, user_id)).order_by('pk')
+    timestamps = _timestamp_fields(model)
+    copied = 0
+    last = None
+    while True:
+        rows = list((queryset if last is None else queryset.filter(pk__gt=last))[:batch_size])
+        if not rows:
+            return copied
+        original = {row.pk: {field.attname: getattr(row, field.attname) for field in timestamps} for row in rows}
+        with keep_sequence(model, target):
+            model._base_manager.using(target).bulk_create(rows)
+            # bulk_create stamped auto_now fields with the current time; put the originals back.
+            for field in timestamps:
+                model._base_manager.using(target).filter(pk__in=list(original)).update(**{field.attname: Case(
+                    *[When(pk=pk, then=Value(values[field.attname])) for pk, values in original.items()],
+                    output_field=field
+                )})
+        copied += len(rows)
+        last = rows[-1].pk
+
+
+def _delete_rows(user_id: int, alias: str, batch_size: int) -> None:
+    """
+    Deletes a user's rows from a shard, batch by batch, and the user's mirror there.
+    """
+    for model in reversed(sharded_models()):
+        queryset = model._base_manager.using(alias).filter(**owner_filter(model, user_id))
+        while True:
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            model._base_manager.using(alias).filter(pk__in=ids).delete()
+    if alias != DEFAULT_DB_ALIAS:
+        User.objects.using(alias).filter(pk=user_id).delete()
+
+
+def _wait_for_map_caches() -> None:
+    """
+    Waits until every process has re-read the shard map.
+    """
+    if settings.NOTES_SHARD_MAP_CACHE_SECONDS:
+        time.sleep(settings.NOTES_SHARD_MAP_CACHE_SECONDS)
+
+
+def _set_state(user_id: int, **fields) -> None:
+    ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).update(
+        updated_at=timezone.now(),
+        **fields
+    )
+    forget(user_id)
+
+
+def moving_users() -> List[int]:
+    """
+    Returns the ids of the users being moved, whose rows jobs covering a whole shard leave alone.
+    """
+    if not is_enabled():
+        return []
+    return list(
+        ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(state=ShardAssignment.STATE_MOVING)
+        .values_list('user_id', flat=True)
+    )
+
+
+def move_user(user_id: int, target: str, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Moves a user's data to the target shard (see module docstring) and returns the
+    number of rows copied per model. An interrupted move can simply be run again.
+    Raises ShardingError if the user's rows in the source shard changed meanwhile.
+    """
+    if target not in shards():
+        raise ShardingError(f'Unknown shard "{target}".')
+    source = lookup(user_id)[0]
+    if source == target:
+        return {}
+
+    _set_state(user_id, state=ShardAssignment.STATE_MOVING)
+    _wait_for_map_caches()
+    try:
+        _delete_rows(user_id, target, batch_size)
+        mirror_user(User.objects.using(DEFAULT_DB_ALIAS).get(pk=user_id), target)
+        copied_from = _snapshot(user_id, source)
+        copied = {
+            model._meta.label: _copy_rows(model, user_id, source, target, batch_size)
+            for model in sharded_models()
+        }
+        if _snapshot(user_id, source) != copied_from:
+            _delete_rows(user_id, target, batch_size)
+            raise ShardingError(f'User {user_id} was written to on {source} during the copy; run the move again.')
+    except Exception:
+        # The source still holds everything; let the user write again.
+        _set_state(user_id, state=ShardAssignment.STATE_ACTIVE)
+        raise
+
+    _set_state(user_id, shard=target, state=ShardAssignment.STATE_ACTIVE)
+    _wait_for_map_caches()
+    if _snapshot(user_id, source) != copied_from:
+        raise ShardingError(
+            f'User {user_id} was written to on {source} after the copy to {target}; '
+            f'its rows on {source} were kept for inspection.'
+        )
+    _delete_rows(user_id, source, batch_size)
+    logger.info(f"Moved user {user_id} from {source} to {target}: {sum(copied.values())} rows")
+    return copied
+
+
+def shard_loads() -> Dict[str, Counter]:
+    """
+    Returns, per shard, the number of notes (hot and archived) of each user.
+    """
+    from .models import ArchivedNote, Note
+
+    loads = {}
+    for alias in shards():
+        load = Counter()
+        for model in (Note, ArchivedNote):
+            for row in model.objects.using(alias).values('user_id').annotate(count=Count('pk')):
+                load[row['user_id']] += row['count']
+        loads[alias] = load
+    return loads
+
+
+def rebalance_plan(tolerance: float = 0.1) -> List[Tuple[int, str, str]]:
+    """
+    Returns (user_id, source, target) moves bringing every shard's note count to
+    within tolerance of the average, chosen greedily from the heaviest to the lightest shard.
+    """
+    loads = shard_loads()
+    totals = {alias: sum(load.values()) for alias, load in loads.items()}
+    average = sum(totals.values()) / len(totals)
+    moves = []
+    while True:
+        heaviest = max(totals, key=totals.get)
+        lightest = min(totals, key=totals.get)
+        gap = totals[heaviest] - totals[lightest]
+        if gap <= tolerance * average:
+            return moves
+        # The user whose move comes closest to halving the gap.
+        movable = [(abs(gap / 2 - count), user_id) for user_id, count in loads[heaviest].items() if 0 < count < gap]
+        if not movable:
+            return moves
+        user_id = min(movable)[1]
+        count = loads[heaviest][user_id]
+        moves.append((user_id, heaviest, lightest))
+        del loads[heaviest][user_id]
+        loads[lightest][user_id] = count
+        totals[heaviest] -= count
+        totals[lightest] += count
@@ -0,0 +1,149 @@
+"""
+Note tags and the per-user inverted index used to filter notes by tag.
+
+A note has any number of tags, set by sending its full list of tag names. Every
+(tag, note) pair is a NoteTag posting, and the unique (tag, note_id) index makes a
+tag's postings one index range. Tags are per user, named in lowercase, and carry
+the number of notes they are on, updated by every tag write rather than counted.
+
+The notes list filters with ?tags=a,b (notes with all of them) and ?tags_any=a,b
+(notes with at least one). An all-of filter reads the postings of its rarest tag
+and probes the index for each of the others, so it costs in proportion to the
+rarest tag, not to the number of notes or tags. Postings name notes by id, so they
+serve the hot and archive tables alike.
+"""
+
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from django.db.models import Exists, F, OuterRef, Q
+
+from .models import NoteTag, Tag
+
+logger = logging.getLogger(__name__)
+
+TAG_NAME_MAX_LENGTH = Tag._meta.get_field('name').max_length
+
+
+def normalize(name: str) -> str:
+    """
+    Returns the stored form of a tag name: trimmed, lowercase, without a leading '#'.
+    """
+    return name.strip().lstrip('#').strip().lower()
+
+
+def parse_names(value: Optional[str]) -> List[str]:
+    """
+    Parses a comma-separated list of tag names (a query parameter), dropping blanks and repeats.
+    """
+    names = (normalize(name) for name in (value or '').split(','))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def tags_by_note(note_ids: Iterable[int]) -> Dict[int, List[str]]:
+    """
+    Returns the tag names of each note, sorted, with one query.
+    """
+    names = defaultdict(list)
+    postings = NoteTag.objects.filter(note_id__in=list(note_ids)).values_list('note_id', 'tag__name')
+    for note_id, name in postings:
+        names[note_id].append(name)
+    return {note_id: sorted(values) for note_id, values in names.items()}
+
+
+def attach(notes: Sequence) -> None:
+    """
+    Sets tag_names, read by the note serializers, on every note (hot or archived).
+    """
+    names = tags_by_note(note.id for note in notes) if notes else {}
+    for note in notes:
+        note.tag_names = names.get(note.id, [])
+
+
+def set_tags(note, names: Sequence[str], created: bool = False) -> bool:
+    """
+    Makes names (normalized) the note's tags, creating missing tags and updating
+    the counts of those added and removed. A just created note has no tags to
+    look up. Returns whether anything changed.
+    """
+    wanted = set(names)
+    current = {} if created else {
+        posting.tag.name: posting.tag_id
+        for posting in NoteTag.objects.filter(note_id=note.id).select_related('tag')
+    }
+    added = wanted - set(current)
+    removed = [tag_id for name, tag_id in current.items() if name not in wanted]
+    note.tag_names = sorted(wanted)
+    if not added and not removed:
+        return False
+
+    if removed:
+        NoteTag.objects.filter(note_id=note.id, tag_id__in=removed).delete()
+        Tag.objects.filter(id__in=removed).update(note_count=F('note_count') - 1)
+    if added:
+        tags = Tag.objects.filter(user_id=note.user_id, name__in=added)
+        existing = dict(tags.values_list('name', 'id'))
+        tag_ids = list(existing.values())
+        if len(existing) < len(added):
+            # A concurrent write may create the same tag; either row does.
+            Tag.objects.bulk_create(
+                [Tag(user_id=note.user_id, name=name) for name in added if name not in existing],
+                ignore_conflicts=True
+            )
+            tag_ids = list(tags.values_list('id', flat=True))
+        NoteTag.objects.bulk_create([NoteTag(tag_id=tag_id, note_id=note.id) for tag_id in tag_ids])
+        Tag.objects.filter(id__in=tag_ids).update(note_count=F('note_count') + 1)
+    logger.debug(f"Note {note.id} tags: {len(added)} added, {len(removed)} removed")
+    return True
+
+
+def notes_removed(note_ids: Sequence[int]) -> None:
+    """
+    Drops the postings of deleted notes (hot or archived) and uncounts them.
+    """
+    postings = NoteTag.objects.filter(note_id__in=list(note_ids))
+    removed = Counter(postings.values_list('tag_id', flat=True))
+    if not removed:
+        return
+    postings.delete()
+    # One update per distinct decrement; deleting one note takes a single one.
+    by_count = defaultdict(list)
+    for tag_id, count in removed.items():
+        by_count[count].append(tag_id)
+    for count, tag_ids in by_count.items():
+        Tag.objects.filter(id__in=tag_ids).update(note_count=F('note_count') - count)
+
+
+def note_filter(user_id: int, all_of: Sequence[str] = (), any_of: Sequence[str] = ()) -> Q:
+    """
+    Returns a Note or ArchivedNote filter selecting the user's notes tagged with all
+    of all_of and at least one of any_of (see module docstring). Unknown tags in
+    all_of match nothing; in any_of they are skipped.
+    """
+    tags = {
+        name: (tag_id, count)
+        for name, tag_id, count in Tag.objects.filter(user_id=user_id, name__in=[*all_of, *any_of])
+        .values_list('name', 'id', 'note_count')
+    }
+    if any(name not in tags for name in all_of):
+        return Q(pk__in=[])
+    required = sorted((tags[name] for name in all_of), key=lambda tag: tag[1])
+    optional = [tags[name][0] for name in any_of if name in tags]
+    if any_of and not optional:
+        return Q(pk__in=[])
+
+    def postings(**lookup):
+        return NoteTag.objects.filter(**lookup).values('note_id')
+
+    if required:
+        # Drive the query from the rarest tag's postings and probe the index for the rest.
+        condition = Q(pk__in=postings(tag_id=required[0][0]))
+        for tag_id, _ in required[1:]:
+            condition &= Q(Exists(postings(tag_id=tag_id, note_id=OuterRef('pk'))))
+        if optional:
+            condition &= Q(Exists(postings(tag_id__in=optional, note_id=OuterRef('pk'))))
+        return condition
+    if optional:
+        return Q(pk__in=postings(tag_id__in=optional))
+    return Q()
@@ -0,0 +1,351 @@
+"""
+Database-backed task queue for maintenance work that must not run on the request path.
+
+Tasks are functions registered by name with @task and queued with enqueue(), which
+writes a Task row to the active shard inside the caller's transaction, so a task
+is queued if and only if the write that queued it commits. `python manage.py
+run_workers` starts a pool of worker processes (one per core by default) that
+claim due tasks from every shard, highest priority first, and run them with that
+shard active. No broker is needed.
+
+A claimed task is hidden from other workers for its visibility timeout, which the
+worker extends every third of it while the task runs. A worker that dies mid-task
+leaves it to be claimed again once that timeout passes, so tasks run at least once
+and must be safe to repeat. A task that raises is retried
+with exponential backoff until it has been attempted max_attempts times; then it
+is kept as failed, with the error, for inspection in the admin. Finished tasks
+are deleted.
+
+Claims are a conditional UPDATE (the attempt count acts as a version), which works
+the same on SQLite and PostgreSQL without row locks.
+"""
+
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import Q
+from django.utils import timezone
+
+from . import archival, dashboard, deletion, embeddings, fingerprints, idempotency, metrics, sharding
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Due tasks read at a time when claiming; the next is tried when a concurrent worker wins one.
+CLAIM_CANDIDATES = 5
+
+metrics.describe('notes_tasks_total', 'Queued tasks run by the workers, by name and outcome.')
+
+
+@dataclass(frozen=True)
+class TaskSpec:
+    """
+    A registered task: the function and its queueing defaults.
+    """
+    func: Callable
+    priority: int
+    max_attempts: Optional[int]
+    timeout: Optional[int]
+
+
+registry: Dict[str, TaskSpec] = {}
+
+
+def task(name: Optional[str] = None, priority: int = 0, max_attempts: Optional[int] = None,
+         timeout: Optional[int] = None) -> Callable:
+    """
+    Registers a function as a task under name (its own name by default). timeout
+    overrides NOTES_TASK_VISIBILITY_TIMEOUT for tasks known to run long.
+    """
+    def register(func: Callable) -> Callable:
+        registry[name or func.__name__] = TaskSpec(func, priority, max_attempts, timeout)
+        return func
+    return register
+
+
+def enqueue(name: str, *args, priority: Optional[int] = None, delay: float = 0,
+            owner_id: Optional[int] = None, **kwargs) -> Task:
+    """
+    Queues task name with JSON-serializable arguments on the active shard, to run
+    after delay seconds. owner_id names the user the task works for, if any.
+    """
+    if name not in registry:
+        raise KeyError(f'Unknown task: {name}')
+    spec = registry[name]
+    queued = Task.objects.create(
+        name=name,
+        args=list(args),
+        kwargs=kwargs,
+        priority=spec.priority if priority is None else priority,
+        max_attempts=spec.max_attempts or settings.NOTES_TASK_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay),
+        owner_id=owner_id
+    )
+    logger.debug(f"Queued {queued}")
+    return queued
+
+
+def _visibility_timeout(name: str) -> int:
+    spec = registry.get(name)
+    return (spec and spec.timeout) or settings.NOTES_TASK_VISIBILITY_TIMEOUT
+
+
+def claim(worker: str) -> Optional[Task]:
+    """
+    Claims the next due task of the active shard for worker: queued tasks whose
+    run_after has passed and running tasks whose visibility timeout expired (those
+    past their last attempt are marked failed instead). Returns None when none is due.
+    """
+    now = timezone.now()
+    due = (
+        Q(status=Task.STATUS_QUEUED, run_after__lte=now)
+        | Q(status=Task.STATUS_RUNNING, locked_until__lte=now)
+    )
+    while True:
+        candidates = list(Task.objects.filter(due).order_by('-priority', 'run_after', 'id')[:CLAIM_CANDIDATES])
+        if not candidates:
+            return None
+        # Candidates other workers claim first are skipped; the next ones are read after these.
+        for candidate in candidates:
+            unchanged = Task.objects.filter(due, pk=candidate.pk, attempts=candidate.attempts)
+            if candidate.attempts >= candidate.max_attempts:
+                unchanged.update(status=Task.STATUS_FAILED, locked_by='', last_error='Visibility timeout expired.')
+                continue
+            changes = {
+                'status': Task.STATUS_RUNNING,
+                'attempts': candidate.attempts + 1,
+                'locked_by': worker,
+                'locked_until': now + timedelta(seconds=_visibility_timeout(candidate.name)),
+            }
+            if unchanged.update(**changes):
+                for field, value in changes.items():
+                    setattr(candidate, field, value)
+                return candidate
+
+
+def _mine(claimed: Task):
+    """
+    Returns the claimed task's row, as long as the claim is still the worker's.
+    """
+    return Task.objects.filter(pk=claimed.pk, locked_by=claimed.locked_by, attempts=claimed.attempts)
+
+
+def _keep_claimed(claimed: Task, stop: threading.Event) -> None:
+    """
+    Extends the claim's visibility timeout every third of it until stop is set, so
+    a task running longer than the timeout is not claimed by another worker.
+    """
+    timeout = _visibility_timeout(claimed.name)
+    while not stop.wait(timeout / 3):
+        _mine(claimed).update(locked_until=timezone.now() + timedelta(seconds=timeout))
+
+
+def _heartbeat(claimed: Task, shard: str, stop: threading.Event) -> None:
+    """
+    Runs _keep_claimed() in a thread of its own, on the task's shard.
+    """
+    try:
+        with sharding.use_shard(shard):
+            _keep_claimed(claimed, stop)
+    except Exception:
+        logger.exception(f"Could not extend the claim of task {claimed.name} #{claimed.pk}.")
+    finally:
+        connections.close_all()
+
+
+def run(claimed: Task) -> bool:
+    """
+    Runs a claimed task for its owner, then deletes it, or schedules its retry or
+    marks it failed. Returns whether it succeeded. The outcome is only recorded while
+    the claim is still the worker's, so a task reclaimed after a timeout is left to
+    the new claim.
+    """
+    mine = _mine(claimed)
+    shard = sharding.current()
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(claimed, shard, stop), name='notes-task-heartbeat', daemon=True).start()
+    try:
+        spec = registry.get(claimed.name)
+        if spec is None:
+            raise KeyError(f'Unknown task: {claimed.name}')
+        with sharding.use_shard(shard, claimed.owner_id):
+            spec.func(*claimed.args, **claimed.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if claimed.attempts >= claimed.max_attempts:
+            mine.update(status=Task.STATUS_FAILED, locked_by='', locked_until=None, last_error=error)
+            logger.error(f"Task {claimed.name} #{claimed.pk} failed after {claimed.attempts} attempts:\n{error}")
+        else:
+            retry_in = settings.NOTES_TASK_RETRY_DELAY * 2 ** (claimed.attempts - 1)
+            mine.update(status=Task.STATUS_QUEUED, locked_by='', locked_until=None, last_error=error,
+                        run_after=timezone.now() + timedelta(seconds=retry_in))
+            logger.warning(f"Task {claimed.name} #{claimed.pk} failed, retrying in {retry_in}s:\n{error}")
+        metrics.inc('notes_tasks_total', name=claimed.name, result='error')
+        return False
+    finally:
+        stop.set()
+    mine.delete()
+    metrics.inc('notes_tasks_total', name=claimed.name, result='ok')
+    return True
+
+
+def run_next(worker: str) -> bool:
+    """
+    Claims and runs one due task, trying the shards in order. Returns whether one ran.
+    """
+    for _ in sharding.each_shard():
+        claimed = claim(worker)
+        if claimed is not None:
+            run(claimed)
+            return True
+    return False
+
+
+def work(worker: Optional[str] = None, stop=None, burst: bool = False) -> int:
+    """
+    Runs due tasks until stop (an Event) is set or, with burst, until none is due,
+    waiting NOTES_TASK_POLL_INTERVAL whenever the queue is empty. Returns how many ran.
+    """
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+    count = 0
+    while stop is None or not stop.is_set():
+        # Like a request: connections past CONN_MAX_AGE or broken are reopened.
+        close_old_connections()
+        ran = run_next(worker)
+        count += ran
+        if not ran:
+            if burst:
+                break
+            if stop is not None:
+                stop.wait(settings.NOTES_TASK_POLL_INTERVAL)
+            else:
+                time.sleep(settings.NOTES_TASK_POLL_INTERVAL)
+    return count
+
+
+def _worker_process(stop, burst: bool) -> None:
+    """
+    Entry point of a pool process. Interrupts go to the parent, which sets stop,
+    so a task in progress is finished before the process exits.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    count = work(stop=stop, burst=burst)
+    logger.info(f"Worker {os.getpid()} ran {count} tasks")
+
+
+def _start_worker(context, stop, burst: bool):
+    process = context.Process(target=_worker_process, args=(stop, burst), name='notes-task-worker')
+    process.start()
+    return process
+
+
+def run_pool(processes: Optional[int] = None, burst: bool = False) -> None:
+    """
+    Runs work() in a pool of processes (one per core by default) until SIGINT or
+    SIGTERM, or with burst until the queue is drained. Workers that die are replaced.
+    Workers are forked (POSIX only), so they inherit the configured Django process.
+    """
+    processes = processes or os.cpu_count() or 1
+    context = multiprocessing.get_context('fork')
+    stop = context.Event()
+
+    def request_stop(signum, frame) -> None:
+        logger.info("Stopping task workers after their current tasks")
+        stop.set()
+
+    previous = {signum: signal.signal(signum, request_stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+    # Forked workers must not share the parent's database connections.
+    connections.close_all()
+    workers = []
+    try:
+        workers = [_start_worker(context, stop, burst) for _ in range(processes)]
+        logger.info(f"Started {processes} task workers")
+        while any(process.is_alive() for process in workers):
+            alive = [process.sentinel for process in workers if process.is_alive()]
+            multiprocessing.connection.wait(alive, timeout=1)
+            if burst or stop.is_set():
+                continue
+            for index, process in enumerate(workers):
+                if not process.is_alive():
+                    logger.error(f"Task worker {process.pid} exited with {process.exitcode}; starting another")
+                    workers[index] = _start_worker(context, stop, burst)
+    finally:
+        stop.set()
+        for process in workers:
+            process.join()
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+# Maintenance tasks. Each works on the shard it was queued on; `run_workers --enqueue NAME`
+# queues one on every shard.
+
+
+@task(priority=10)
+def process_deletion_job(job_id: int) -> None:
+    """
+    Runs a deferred deletion job (see notes/deletion.py); queued when it is scheduled.
+    """
+    deletion.process_deletion_job(job_id)
+
+
+@task(priority=10)
+def process_deletions() -> None:
+    """
+    Resumes the unfinished deferred deletions no runner holds (see notes/deletion.py).
+    """
+    for job_id in deletion.claimable().order_by('id').values_list('id', flat=True):
+        deletion.process_deletion_job(job_id)
+
+
+@task()
+def rebuild_dashboards() -> None:
+    """
+    Recomputes the dashboard summaries (see notes/dashboard.py).
+    """
+    dashboard.rebuild_all()
+
+
+@task(timeout=3600)
+def refresh_embeddings(user_id: Optional[int] = None, force: bool = False) -> None:
+    """
+    Re-embeds stale notes for semantic search (see notes/embeddings.py).
+    """
+    embeddings.refresh_embeddings(user_id, force=force)
+
+
+@task(timeout=3600)
+def fingerprint_notes() -> None:
+    """
+    Fingerprints notes that have no duplicate-detection fingerprint yet.
+    """
+    fingerprints.index_missing()
+
+
+@task(priority=-10, timeout=3600)
+def archive_notes() -> None:
+    """
+    Moves cold notes to the archive table (see notes/archival.py).
+    """
+    archival.archive_notes()
+
+
+@task(priority=-10)
+def purge_idempotency_keys() -> None:
+    """
+    Deletes expired Idempotency-Key records.
+    """
+    idempotency.purge_expired()
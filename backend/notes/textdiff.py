@@ -0,0 +1,91 @@
+"""
+Compact text deltas used for note revisions and partial content updates.
+
+A delta is a JSON-friendly list of operations applied left to right to a base text:
+    positive int  -> keep that many characters
+    negative int  -> drop that many characters
+    string        -> insert the string
+Any text left after the last operation is kept, so [5, 'x'] inserts 'x' at offset 5.
+"""
+
+import hashlib
+from difflib import SequenceMatcher
+from typing import List, Union
+
+Delta = List[Union[int, str]]
+
+
+class DeltaError(ValueError):
+    """
+    Raised when a delta is malformed or does not fit the base text.
+    """
+
+
+def _push(ops: Delta, op: Union[int, str]) -> None:
+    """
+    Appends an operation, merging it with the previous one when they are of the same kind.
+    """
+    if not op:
+        return
+    if ops:
+        last = ops[-1]
+        if isinstance(op, str) and isinstance(last, str):
+            ops[-1] = last + op
+            return
+        if isinstance(op, int) and isinstance(last, int) and (op > 0) == (last > 0):
+            ops[-1] = last + op
+            return
+    ops.append(op)
+
+
+def content_hash(text: str) -> str:
+    """
+    Returns the SHA-256 hex digest of the text's UTF-8 encoding, naming the base text of a delta.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def make_delta(old: str, new: str) -> Delta:
+    """
+    Computes a line-based delta turning old into new.
+    A trailing keep operation is omitted.
+    """
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    ops: Delta = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b).get_opcodes():
+        if tag == 'equal':
+            _push(ops, sum(len(line) for line in a[i1:i2]))
+            continue
+        if i2 > i1:
+            _push(ops, -sum(len(line) for line in a[i1:i2]))
+        if j2 > j1:
+            _push(ops, ''.join(b[j1:j2]))
+    if ops and isinstance(ops[-1], int) and ops[-1] > 0:
+        ops.pop()
+    return ops
+
+
+def apply_delta(base: str, ops: Delta) -> str:
+    """
+    Applies a delta to base, raising DeltaError if it does not fit.
+    """
+    if not isinstance(ops, list):
+        raise DeltaError('A delta must be a list of operations.')
+
+    out = []
+    pos = 0
+    for op in ops:
+        if isinstance(op, bool) or not isinstance(op, (int, str)):
+            raise DeltaError(f'Invalid delta operation: {op!r}')
+        if isinstance(op, str):
+            out.append(op)
+            continue
+        end = pos + abs(op)
+        if end > len(base):
+            raise DeltaError('Delta runs past the end of the base text.')
+        if op > 0:
+            out.append(base[pos:end])
+        pos = end
+    out.append(base[pos:])
+    return ''.join(out)
@@ -0,0 +1,298 @@
+"""
+Token-bucket request throttles and a concurrency limiter for expensive endpoints.
+
+Bucket state lives in the cache named by NOTES_THROTTLE_CACHE, so with a shared
+cache backend (Redis, the 'shared' cache when NOTES_CACHE_REDIS_URL is set) the
+limits apply across processes and pods; the notes.W002 system check warns when it
+is kept per process. Taking a token is atomic: a Lua script on Redis, a lock in
+this process on other backends. Rates are configured per route through the view's
+throttle_scope:
+
+    NOTES_THROTTLE_RATES         per-user rates by scope ('user' is the fallback)
+    NOTES_GLOBAL_THROTTLE_RATES  rates shared by all users, by scope ('global' is the fallback)
+    NOTES_CONCURRENCY_LIMITS     maximum in-flight requests by name
+
+Rates use the DRF 'N/period' syntax; N is also the bucket size (burst).
+"""
+
+import functools
+import threading
+import time
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+REDIS_BACKEND = 'django.core.cache.backends.redis.RedisCache'
+
+# consume() on the Redis server: KEYS[1] is the bucket, ARGV capacity, refill per second,
+# now and TTL. Returns {allowed, tokens left}; tokens as a string, Lua numbers become integers.
+CONSUME_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local capacity, refill, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * refill)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {allowed, tostring(tokens)}
+"""
+
+_local_lock = threading.Lock()
+_script = None
+
+metrics.describe('notes_throttle_requests_total', 'Throttle decisions by scope, bucket kind and result.')
+metrics.describe('notes_concurrency_in_use', 'In-flight requests per concurrency-limited endpoint.')
+metrics.describe('notes_concurrency_rejected_total', 'Requests rejected by a concurrency limiter.')
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """
+    Parses 'N/period' (period: s, m, h, d or a word starting with one) into
+    (bucket capacity, tokens refilled per second).
+    """
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def _cache():
+    """
+    Returns the cache that stores buckets and concurrency counters.
+    """
+    return caches[settings.NOTES_THROTTLE_CACHE]
+
+
+def _redis_script():
+    """
+    Returns CONSUME_SCRIPT registered with the Redis server of the throttle cache,
+    or None if that cache is not a Redis cache. The redis package is only needed then.
+    """
+    global _script
+    config = settings.CACHES[settings.NOTES_THROTTLE_CACHE]
+    if config['BACKEND'] != REDIS_BACKEND:
+        return None
+    with _local_lock:
+        if _script is None:
+            import redis
+
+            location = config['LOCATION']
+            # Like RedisCache, write to the first server listed.
+            url = (location.split(',') if isinstance(location, str) else location)[0]
+            _script = redis.Redis.from_url(url).register_script(CONSUME_SCRIPT)
+    return _script
+
+
+def _take_local(key: str, capacity: int, refill: float, now: float, timeout: int) -> Tuple[bool, float]:
+    """
+    consume() on any cache backend, under a lock of this process: atomic for
+    process-local caches, but not across processes sharing another kind of cache.
+    """
+    cache = _cache()
+    with _local_lock:
+        state = cache.get(key)
+        tokens, updated = state if state else (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        cache.set(key, (tokens, now), timeout=timeout)
+    return allowed, tokens
+
+
+def consume(key: str, rate: str, now: Optional[float] = None) -> Tuple[bool, float]:
+    """
+    Takes one token from the bucket at key, atomically (see module docstring).
+    Returns (allowed, seconds until a token is available).
+    """
+    capacity, refill = parse_rate(rate)
+    now = time.time() if now is None else now
+    timeout = int(capacity / refill) + 1
+
+    script = _redis_script()
+    if script is None:
+        allowed, tokens = _take_local(key, capacity, refill, now, timeout)
+    else:
+        allowed, tokens = script(keys=[_cache().make_key(key)], args=[capacity, refill, now, timeout])
+        allowed, tokens = bool(allowed), float(tokens)
+    return allowed, 0.0 if allowed else (1 - tokens) / refill
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base token-bucket throttle. Subclasses choose the rate table and the bucket key.
+    """
+    kind = ''
+    rates_setting = ''
+    default_scope = ''
+
+    def __init__(self) -> None:
+        self.retry_after = None
+
+    def get_scope(self, view) -> str:
+        """
+        Returns the view's throttle_scope, or this throttle's default scope.
+        """
+        return getattr(view, 'throttle_scope', None) or self.default_scope
+
+    def get_rate(self, scope: str) -> Optional[str]:
+        """
+        Returns the configured rate for the scope, falling back to the default scope.
+        """
+        rates = getattr(settings, self.rates_setting)
+        return rates.get(scope) or rates.get(self.default_scope)
+
+    def get_key(self, request, scope: str) -> str:
+        """
+        Returns the cache key of the bucket charged for this request.
+        """
+        raise NotImplementedError
+
+    def allow_request(self, request, view) -> bool:
+        if not settings.NOTES_THROTTLE_ENABLED:
+            return True
+        scope = self.get_scope(view)
+        rate = self.get_rate(scope)
+        if rate is None:
+            return True
+
+        allowed, wait = consume(self.get_key(request, scope), rate)
+        metrics.inc(
+            'notes_throttle_requests_total',
+            scope=scope,
+            kind=self.kind,
+            result='allowed' if allowed else 'throttled'
+        )
+        if not allowed:
+            self.retry_after = wait
+        return allowed
+
+    def wait(self) -> Optional[float]:
+        return self.retry_after
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Per-user bucket (per client IP for anonymous requests).
+    """
+    kind = 'user'
+    rates_setting = 'NOTES_THROTTLE_RATES'
+    default_scope = 'user'
+
+    def get_key(self, request, scope: str) -> str:
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return f'throttle:user:{scope}:{ident}'
+
+
+class GlobalTokenBucketThrottle(TokenBucketThrottle):
+    """
+    One bucket per scope shared by all users.
+    """
+    kind = 'global'
+    rates_setting = 'NOTES_GLOBAL_THROTTLE_RATES'
+    default_scope = 'global'
+
+    def get_key(self, request, scope: str) -> str:
+        return f'throttle:global:{scope}'
+
+
+class ConcurrencyLimiter:
+    """
+    Counts in-flight requests for a name in the throttle cache.
+    The counter expires after NOTES_CONCURRENCY_SLOT_TIMEOUT seconds so a crashed
+    worker cannot leak slots forever.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.limit = settings.NOTES_CONCURRENCY_LIMITS.get(name)
+        self.key = f'concurrency:{name}'
+        self.acquired = False
+
+    def acquire(self) -> bool:
+        """
+        Takes a slot, returning False if the limit is already reached.
+        """
+        if not settings.NOTES_THROTTLE_ENABLED or self.limit is None:
+            return True
+        cache = _cache()
+        cache.add(self.key, 0, timeout=settings.NOTES_CONCURRENCY_SLOT_TIMEOUT)
+        try:
+            in_use = cache.incr(self.key)
+        except ValueError:
+            # Counter expired between add() and incr(); start over.
+            cache.set(self.key, 1, timeout=settings.NOTES_CONCURRENCY_SLOT_TIMEOUT)
+            in_use = 1
+        if in_use > self.limit:
+            cache.decr(self.key)
+            metrics.inc('notes_concurrency_rejected_total', name=self.name)
+            return False
+        self.acquired = True
+        metrics.set_gauge('notes_concurrency_in_use', in_use, name=self.name)
+        return True
+
+    def release(self) -> None:
+        """
+        Returns the slot taken by acquire(); safe to call more than once.
+        """
+        if not self.acquired:
+            return
+        self.acquired = False
+        try:
+            in_use = _cache().decr(self.key)
+        except ValueError:
+            in_use = 0
+        metrics.set_gauge('notes_concurrency_in_use', max(in_use, 0), name=self.name)
+
+
+def concurrency_limited(name: str):
+    """
+    View method decorator that rejects the request with 429 and Retry-After when
+    NOTES_CONCURRENCY_LIMITS[name] requests are already in flight, instead of queueing.
+    The slot is released when the response is closed, so streamed responses
+    hold it until the stream ends.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            limiter = ConcurrencyLimiter(name)
+            if not limiter.acquire():
+                return Response(
+                    {'error': 'Too many concurrent requests, please retry later.'},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={'Retry-After': str(settings.NOTES_CONCURRENCY_RETRY_AFTER)}
+                )
+            try:
+                response = method(view, request, *args, **kwargs)
+            except Exception:
+                limiter.release()
+                raise
+            close = response.close
+
+            def close_and_release() -> None:
+                try:
+                    close()
+                finally:
+                    limiter.release()
+
+            response.close = close_and_release
+            return response
+
+        return wrapper
+
+    return decorator
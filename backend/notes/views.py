@@ -1,31 +1,87 @@
 """
 View classes for handling CRUD operations related to Notes
 and user authentication (Register, Login, Logout).
-Also includes a Profile endpoint and a 'populate_llm' utility endpoint.
+Also includes a Profile endpoint, a 'populate_llm' utility endpoint,
+a bulk note import endpoint, a batch endpoint and staff endpoints for metrics and request profiles.
 """
 
 import json
 import logging
 import os
+from typing import Iterator
 
-import openai
+from django.conf import settings
 from django.contrib.auth import logout, authenticate
 from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import User
-from rest_framework import viewsets, status
+from django.db import IntegrityError
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from rest_framework import mixins, viewsets, status
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import AllowAny
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAdminUser
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Note, Category
-from .serializers import NoteSerializer, CategorySerializer, UserSerializer
+from . import autosave, batch, dashboard, embeddings, llm, metrics, profiling, sharding, tagging
+from .archival import merge_by_updated, rehydrate, search_filter
+from .broker import publish_change
+from .caching import get_cached_list, invalidate_notes_list, list_cache_key, store_list
+from .deletion import schedule_category_deletion, should_defer_category_deletion
+from .fingerprints import (
+    check_duplicates,
+    duplicate_clusters,
+    find_duplicates,
+    index_note,
+    index_notes,
+    signature
+)
+from .idempotency import idempotent
+from .importers import SUPPORTED_FORMATS, detect_format, import_notes
+from .models import ArchivedNote, Note, Category, DeletionJob, Tag
+from .revisions import rebuild_content, record_revision
+from .serializers import (
+    NoteSerializer,
+    NotePreviewSerializer,
+    CategorySerializer,
+    UserSerializer,
+    DashboardSummarySerializer,
+    DeletionJobSerializer,
+    NoteRevisionSerializer,
+    TagSerializer
+)
+from .throttling import concurrency_limited
 
 # Create a logger for this module
 logger = logging.getLogger(__name__)
 
 
+def is_truthy(value) -> bool:
+    """
+    Interprets a query parameter or request field as a boolean flag.
+    """
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def int_param(value, default: int, maximum: int) -> int:
+    """
+    Interprets a query parameter as a positive integer, clamped to maximum.
+    """
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        return default
+
+
+def sse_event(event: str, data: dict) -> str:
+    """
+    Formats one server-sent event.
+    """
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
 class RegisterView(APIView):
     """
     Allows new users to register with an email, password, first name, and last name.
@@ -65,6 +121,7 @@ class RegisterView(APIView):
             first_name=first_name,
             last_name=last_name
         )
+        sharding.activate_user(user.id)
 
         # Create default categories for the new user
         Category.objects.create(user=user, name='Random Thoughts', color='#FFCBCB')
@@ -114,6 +171,7 @@ class LoginView(APIView):
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
+        sharding.activate_user(user.id)
         token, _ = Token.objects.get_or_create(user=user)
 
         logger.info(f"User logged in: {email}")
@@ -137,7 +195,9 @@ class LogoutView(APIView):
         """
         user = request.user
         Token.objects.filter(user=user).delete()
-        logout(request)
+        if hasattr(request, 'session'):
+            # Sessions are not installed under the API-only settings profile.
+            logout(request)
         logger.info(f"User logged out: {user.username}")
         return Response(
             {'message': 'Logged out successfully.'},
@@ -145,45 +205,416 @@ class LogoutView(APIView):
         )
 
 
-class NoteViewSet(viewsets.ModelViewSet):
+class ChangeEventsMixin:
+    """
+    Publishes a realtime change event (see notes/realtime.py) for every object
+    created, updated or deleted through the viewset, once the transaction commits,
+    and invalidates the user's cached notes lists (see notes/caching.py).
+    Viewsets call _notify_change('created', ...) from their own perform_create.
+    """
+    change_model = ''
+
+    def _notify_change(self, action: str, pk, data=None) -> None:
+        invalidate_notes_list(self.request.user.id)
+        publish_change(self.request.user.id, self.change_model, action, pk, data)
+
+    def perform_update(self, serializer) -> None:
+        super().perform_update(serializer)
+        self._notify_change('updated', serializer.instance.pk, serializer.data)
+
+    def perform_destroy(self, instance) -> None:
+        pk = instance.pk
+        super().perform_destroy(instance)
+        self._notify_change('deleted', pk)
+
+
+class ClientIdMixin:
+    """
+    Lets clients choose ids (client_id, unique per user) for the objects they create,
+    so offline changes can be replayed safely: a create whose client_id already exists
+    returns the existing object (200) instead of adding another one, and detail routes
+    accept client:<client_id> in place of the id.
+    """
+    client_id_prefix = 'client:'
+
+    def lookup_filter(self) -> dict:
+        """
+        Returns the queryset filter selecting the object named in the URL.
+        """
+        value = str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if value.startswith(self.client_id_prefix):
+            return {'client_id': value[len(self.client_id_prefix):]}
+        return {'pk': value}
+
+    def get_object(self):
+        obj = get_object_or_404(self.filter_queryset(self.get_queryset()), **self.lookup_filter())
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    def get_by_client_id(self, client_id: str):
+        """
+        Returns the user's object with the given client_id, or None.
+        """
+        return self.get_queryset().filter(client_id=client_id).first()
+
+    def create(self, request: Request, *args, **kwargs) -> Response:
+        client_id = request.data.get('client_id') if isinstance(request.data, dict) else None
+        if client_id:
+            existing = self.get_by_client_id(client_id)
+            if existing is not None:
+                return Response(self.get_serializer(existing).data, status=status.HTTP_200_OK)
+        try:
+            with sharding.atomic():
+                return super().create(request, *args, **kwargs)
+        except IntegrityError:
+            if not client_id:
+                raise
+            # A concurrent replay won the race, or the id belongs to an object pending deletion.
+            existing = self.get_by_client_id(client_id)
+            if existing is None:
+                return Response({'error': 'This client_id is already in use.'}, status=status.HTTP_409_CONFLICT)
+            return Response(self.get_serializer(existing).data, status=status.HTTP_200_OK)
+
+
+class NoteViewSet(ClientIdMixin, ChangeEventsMixin, viewsets.ModelViewSet):
     """
     Provides CRUD operations for Note objects. Requires authentication.
     """
     serializer_class = NoteSerializer
+    throttle_scope = 'notes'
+    change_model = 'note'
 
     def get_queryset(self):
         """
-        Returns only notes belonging to the authenticated user.
-        Orders results by most recently updated.
+        Returns only notes belonging to the authenticated user, with their category
+        (serialized for every note). Orders results by most recently updated.
+        """
+        return Note.objects.filter(user=self.request.user).select_related('category').order_by('-updated_at')
+
+    def _notify_change(self, action: str, pk, data=None) -> None:
+        """
+        Also refreshes the user's semantic search embeddings (see notes/embeddings.py).
+        """
+        super()._notify_change(action, pk, data)
+        if action != 'deleted':
+            embeddings.schedule_refresh(self.request.user.id)
+
+    def get_by_client_id(self, client_id: str):
+        """
+        Also finds archived notes, so replaying the create of a note archived since
+        returns it rather than adding a copy.
         """
-        return Note.objects.filter(user=self.request.user).order_by('-updated_at')
+        return super().get_by_client_id(client_id) or ArchivedNote.objects.select_related('category').filter(
+            user=self.request.user,
+            client_id=client_id
+        ).first()
+
+    def get_object(self):
+        """
+        Returns the note with its buffered autosave edits (see notes/autosave.py), falling
+        back to the archive (see notes/archival.py). An archived note is moved back to the
+        hot table before any write other than a delete.
+        """
+        try:
+            return autosave.overlay(super().get_object())
+        except Http404:
+            archived = get_object_or_404(
+                ArchivedNote.objects.select_related('category'),
+                user=self.request.user,
+                **self.lookup_filter()
+            )
+            if self.request.method in SAFE_METHODS or self.request.method == 'DELETE':
+                return archived
+            return rehydrate(archived)
+
+    def list(self, request: Request, *args, **kwargs):
+        """
+        Lists the user's notes, hot and archived, most recently updated first.
+        ?search= filters on title and content; ?tags=a,b keeps notes with all of the tags
+        and ?tags_any=a,b notes with any of them (see notes/tagging.py); ?archived=false
+        skips the archive; ?view=preview returns a truncated preview without loading the full content.
+        JSON responses are cached per user and query string (see notes/caching.py);
+        a cache hit is served without the ORM or the serializer.
+        """
+        if not settings.NOTES_LIST_CACHE_ENABLED or request.accepted_renderer.format != 'json':
+            return self.list_notes(request)
+
+        key = list_cache_key(request.user.id, f"{request.accepted_media_type}?{request.META.get('QUERY_STRING', '')}")
+        body = get_cached_list(key)
+        if body is not None:
+            return HttpResponse(body, content_type='application/json')
+
+        response = self.list_notes(request)
+        if response.status_code == status.HTTP_200_OK:
+            response.add_post_render_callback(lambda rendered: store_list(key, rendered.content))
+        return response
+
+    def list_notes(self, request: Request) -> Response:
+        """
+        Builds the list response from the hot and archive tables.
+        """
+        hot = self.filter_queryset(self.get_queryset())
+        archived = ArchivedNote.objects.none()
+        if is_truthy(request.query_params.get('archived', 'true')):
+            archived = ArchivedNote.objects.filter(user=request.user).select_related('category').order_by('-updated_at')
+
+        term = request.query_params.get('search', '').strip()
+        if term:
+            hot = search_filter(hot, term)
+            archived = search_filter(archived, term)
+
+        all_tags = tagging.parse_names(request.query_params.get('tags'))
+        any_tags = tagging.parse_names(request.query_params.get('tags_any'))
+        if all_tags or any_tags:
+            condition = tagging.note_filter(request.user.id, all_tags, any_tags)
+            hot = hot.filter(condition)
+            archived = archived.filter(condition)
+
+        if request.query_params.get('view') == 'preview':
+            notes = merge_by_updated(autosave.overlay_many(hot.defer('content')), archived.defer('content'))
+            tagging.attach(notes)
+            return Response(NotePreviewSerializer(notes, many=True).data)
+
+        notes = merge_by_updated(autosave.overlay_many(hot), archived)
+        tagging.attach(notes)
+        return Response(self.get_serializer(notes, many=True).data)
+
+    def perform_update(self, serializer: NoteSerializer) -> None:
+        """
+        Coalesces autosave bursts: title and content edits arriving soon after the note
+        was written are buffered (see notes/autosave.py).
+        """
+        coalesce = self.action in ('update', 'partial_update') and autosave.should_coalesce(serializer.instance)
+        previous_category_id = serializer.instance.category_id
+        serializer.save(coalesce=coalesce)
+        dashboard.note_updated(serializer.instance, previous_category_id)
+        self._notify_change('updated', serializer.instance.pk, serializer.data)
+
+    def perform_destroy(self, instance) -> None:
+        """
+        Also drops the note's buffered autosave edits and tags, and uncounts it on the dashboard.
+        """
+        pk, category_id = instance.pk, instance.category_id
+        autosave.discard(pk)
+        tagging.notes_removed([pk])
+        super().perform_destroy(instance)
+        dashboard.note_deleted(self.request.user.id, pk, category_id)
+
+    @idempotent
+    def create(self, request: Request, *args, **kwargs) -> Response:
+        """
+        Creates a note. The response lists the ids of the user's notes it duplicates
+        (see notes/fingerprints.py), most similar first.
+        """
+        self.duplicate_ids = []
+        response = super().create(request, *args, **kwargs)
+        if status.is_success(response.status_code):
+            response.data['duplicates'] = self.duplicate_ids
+        return response
 
     def perform_create(self, serializer: NoteSerializer) -> None:
         """
         Associates the newly created note with the authenticated user.
         """
         user = self.request.user
-        serializer.save(user=user)
+        note = serializer.save(user=user)
+        record_revision(note)
+        sig = signature(note.title, note.content)
+        self.duplicate_ids = [match.note_id for match in find_duplicates(note, sig)]
+        index_note(note, sig)
+        dashboard.note_created(note)
+        self._notify_change('created', note.pk, serializer.data)
         logger.info(f"Note created for user {user.username}")
 
+    @action(detail=False, methods=['get'])
+    def duplicates(self, request: Request) -> Response:
+        """
+        Lists clusters of duplicate and near-duplicate notes, largest first.
+        Archived notes are not included.
+        """
+        return Response(duplicate_clusters(request.user.id))
 
-class CategoryViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def semantic_search(self, request: Request) -> Response:
+        """
+        Returns the notes closest in meaning to ?q= (see notes/embeddings.py), best first,
+        as previews with a similarity score. ?limit= caps the results (default 10, max 100).
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'A query (q) is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            results = embeddings.search(request.user.id, query, int_param(request.query_params.get('limit'), 10, 100))
+        except embeddings.EmbeddingError as ex:
+            logger.error(f"Semantic search failed: {ex}")
+            return Response({'error': 'Semantic search is unavailable.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(self.scored_previews(results))
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request: Request, pk=None) -> Response:
+        """
+        Returns the notes most similar to this one, best first, as previews with a similarity score.
+        """
+        note = self.get_object()
+        try:
+            results = embeddings.similar(note, int_param(request.query_params.get('limit'), 10, 100))
+        except embeddings.EmbeddingError as ex:
+            logger.error(f"Similar notes lookup failed: {ex}")
+            return Response({'error': 'Semantic search is unavailable.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(self.scored_previews(results))
+
+    def scored_previews(self, results: list) -> list:
+        """
+        Serializes (note id, score) pairs as note previews in the same order,
+        skipping notes deleted since they were indexed.
+        """
+        notes = self.get_queryset().select_related('category').defer('content').in_bulk([pk for pk, _ in results])
+        tagging.attach(list(notes.values()))
+        return [
+            {**NotePreviewSerializer(notes[pk]).data, 'score': round(score, 4)}
+            for pk, score in results if pk in notes
+        ]
+
+    @action(detail=True, methods=['get'])
+    def revisions(self, request: Request, pk=None) -> Response:
+        """
+        Lists the stored revisions of a note, newest first.
+        """
+        note = self.get_object()
+        if isinstance(note, ArchivedNote):
+            # Revisions are dropped on archival.
+            return Response([])
+        revisions = note.revisions.order_by('-number')
+        return Response(NoteRevisionSerializer(revisions, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path=r'revisions/(?P<number>\d+)')
+    def revision(self, request: Request, pk=None, number=None) -> Response:
+        """
+        Returns the note content as it was at a given revision.
+        """
+        note = self.get_object()
+        revision = None if isinstance(note, ArchivedNote) else note.revisions.filter(number=number).first()
+        if revision is None:
+            return Response({'error': 'Revision not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        data = NoteRevisionSerializer(revision).data
+        data['content'] = rebuild_content(note, revision.number)
+        return Response(data)
+
+    @action(detail=True, methods=['post'], url_path=r'revisions/(?P<number>\d+)/restore')
+    def restore_revision(self, request: Request, pk=None, number=None) -> Response:
+        """
+        Restores the note content from a revision, recording it as a new revision.
+        """
+        note = self.get_object()
+        content = rebuild_content(note, int(number))
+        if content is None:
+            return Response({'error': 'Revision not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = self.get_serializer(note, data={'content': content}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        logger.info(f"Note {note.id} restored to revision {number}")
+        return Response(serializer.data)
+
+
+class CategoryViewSet(ClientIdMixin, ChangeEventsMixin, viewsets.ModelViewSet):
     """
     Provides CRUD operations for Category objects. Requires authentication.
     """
     serializer_class = CategorySerializer
+    change_model = 'category'
 
     def get_queryset(self):
         """
-        Returns only categories belonging to the authenticated user.
+        Returns only categories belonging to the authenticated user,
+        excluding those pending deferred deletion.
         """
-        return Category.objects.filter(user=self.request.user)
+        return Category.objects.filter(user=self.request.user, deleted_at__isnull=True)
+
+    def _notify_change(self, action: str, pk, data=None) -> None:
+        """
+        Also updates the category on the user's dashboard summary (see notes/dashboard.py).
+        """
+        super()._notify_change(action, pk, data)
+        if action == 'deleted':
+            dashboard.category_removed(self.request.user.id, pk)
+        else:
+            dashboard.category_saved(self.request.user.id, data)
+
+    @idempotent
+    def create(self, request: Request, *args, **kwargs) -> Response:
+        """
+        Creates a category.
+        """
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """
         Associates the newly created category with the authenticated user.
         """
         serializer.save(user=self.request.user)
+        self._notify_change('created', serializer.instance.pk, serializer.data)
+
+    def destroy(self, request: Request, *args, **kwargs) -> Response:
+        """
+        Deletes the category. Large categories (or ?deferred=true) are hidden at once
+        and their notes detached in the background; the response is 202 with the job.
+        """
+        category = self.get_object()
+        deferred = is_truthy(request.query_params.get('deferred'))
+        if not deferred and not should_defer_category_deletion(category):
+            return super().destroy(request, *args, **kwargs)
+
+        job = schedule_category_deletion(category)
+        self._notify_change('deleted', category.pk)
+        return Response(DeletionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class TagViewSet(ChangeEventsMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin,
+                 mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Lists the user's tags with their note counts, and renames or deletes them.
+    Tags are created by tagging notes (see notes/tagging.py).
+    """
+    serializer_class = TagSerializer
+    change_model = 'tag'
+
+    def get_queryset(self):
+        """
+        Returns only tags belonging to the authenticated user, by name.
+        """
+        return Tag.objects.filter(user=self.request.user).order_by('name')
+
+
+class DeletionJobView(APIView):
+    """
+    Reports the progress of a deferred deletion owned by the current user.
+    """
+
+    def get(self, request: Request, pk: int) -> Response:
+        """
+        Returns the job's status and processed/total note counts.
+        """
+        try:
+            job = DeletionJob.objects.get(pk=pk, owner_id=request.user.id)
+        except DeletionJob.DoesNotExist:
+            return Response({'error': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(DeletionJobSerializer(job).data)
+
+
+class DashboardView(APIView):
+    """
+    Returns what the dashboard shows in one response: the profile, the categories with
+    their colors and note counts, and the most recent notes.
+    """
+
+    def get(self, request: Request) -> Response:
+        """
+        Returns the user's precomputed summary (see notes/dashboard.py) with the profile.
+        """
+        summary = dashboard.get_summary(request.user.id)
+        return Response({'profile': UserSerializer(request.user).data, **DashboardSummarySerializer(summary).data})
 
 
 class ProfileView(APIView):
@@ -251,15 +682,25 @@ class PopulateLLMView(APIView):
     """
     Uses OpenAI to generate short notes for each category (Random Thoughts, School, Personal)
     based on a user-provided subject. Creates them for the current user.
+    With stream=true the completions are streamed and each note is saved and sent
+    to the client as a server-sent event as soon as its JSON object is complete.
+    With mode=combined all categories are requested in one structured call; only
+    sections that fail validation are retried with a per-category request.
+    The response reports how many generated notes duplicate an existing note or each
+    other; with skip_duplicates=true those are not saved.
+    Non-streamed requests honour Idempotency-Key (see notes/idempotency.py), so a
+    retried request returns the notes already generated instead of calling OpenAI again.
     """
+    throttle_scope = 'populate_llm'
 
+    @idempotent
+    @concurrency_limited('populate_llm')
     def post(self, request: Request) -> Response:
         """
         Calls OpenAI ChatCompletion to generate 3 short notes per category,
         then saves them to the database.
         """
-        openai.api_key = os.environ.get('NEXT_PUBLIC_OPENAI_API_KEY', '')
-        if not openai.api_key:
+        if not llm.configure():
             logger.error("OpenAI API key not found in environment variables.")
             return Response(
                 {'error': 'OpenAI API key not found in environment variables.'},
@@ -269,56 +710,275 @@ class PopulateLLMView(APIView):
         subject = request.data.get('subject', '').strip()
         categories = Category.objects.filter(
             user=request.user,
-            name__in=["Random Thoughts", "School", "Personal"]
+            deleted_at__isnull=True,
+            name__in=llm.DEFAULT_CATEGORIES
         )
 
-        all_created = []
-        for cat in categories:
-            prompt = (
-                f'Create 3 short notes with a Title and Content for category: "{cat.name}". '
-                f'They should be inspired by the subject: "{subject}". '
-                f'Return them as valid JSON array of objects, e.g.:\n'
-                f'[\n'
-                f'  {{"title":"Title A","content":"Content A"}},\n'
-                f'  {{"title":"Title B","content":"Content B"}},\n'
-                f'  {{"title":"Title C","content":"Content C"}}\n'
-                f']\n'
-                f'Keep them brief but meaningful.'
+        self.skip_duplicates = is_truthy(
+            request.query_params.get('skip_duplicates') or request.data.get('skip_duplicates', 'false')
+        )
+
+        if is_truthy(request.query_params.get('stream') or request.data.get('stream')):
+            response = StreamingHttpResponse(
+                self.stream_events(request.user, list(categories), subject),
+                content_type='text/event-stream'
             )
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        if request.data.get('mode') == 'combined':
+            return self.populate_combined(request.user, list(categories), subject)
 
+        all_created = []
+        duplicates = 0
+        for cat in categories:
             try:
-                response = openai.ChatCompletion.create(
-                    model='gpt-4',
-                    messages=[
-                        {'role': 'system', 'content': 'You are a helpful assistant that creates short note data.'},
-                        {'role': 'user', 'content': prompt}
-                    ],
-                    temperature=0.7
-                )
-                raw_text = response.choices[0].message.content
+                raw_text = llm.complete(llm.build_prompt(cat.name, subject))
                 notes_data = json.loads(raw_text)
             except Exception as ex:
                 logger.error(f"Error during OpenAI request: {ex}")
                 continue
 
             if isinstance(notes_data, list):
-                for note_obj in notes_data:
-                    title = note_obj.get('title', '').strip()
-                    content = note_obj.get('content', '').strip()
-                    if title and content:
-                        note = Note.objects.create(
-                            user=request.user,
-                            category=cat,
-                            title=title,
-                            content=content
-                        )
-                        all_created.append(note.id)
-
-        logger.info(f'LLM notes created. Subject="{subject}", Count={len(all_created)}')
+                cleaned_notes = [llm.clean_note(obj) for obj in notes_data if isinstance(obj, dict)]
+                items = [(cat, *cleaned) for cleaned in cleaned_notes if cleaned]
+                notes, found = self.save_notes(request.user, items)
+                all_created.extend(note.id for note in notes)
+                duplicates += found
+
+        invalidate_notes_list(request.user.id)
+        logger.info(f'LLM notes created. Subject="{subject}", Count={len(all_created)}, Duplicates={duplicates}')
         return Response(
             {
                 'message': f'Successfully created notes inspired by "{subject}" (total {len(all_created)}).',
-                'count': len(all_created)
+                'count': len(all_created),
+                'duplicates': duplicates
             },
             status=status.HTTP_200_OK
         )
+
+    def save_notes(self, user: User, items: list) -> tuple:
+        """
+        Creates notes from (category, title, content) items and indexes them for
+        duplicate detection. Returns the created notes and the number of duplicates
+        (left out when skip_duplicates is set).
+        """
+        checked = check_duplicates(user.id, [(title, content) for _, title, content in items])
+        duplicates = sum(match is not None for _, match in checked)
+        kept = [
+            (item, sig) for item, (sig, match) in zip(items, checked)
+            if match is None or not self.skip_duplicates
+        ]
+        notes = Note.objects.bulk_create([
+            Note(user=user, category=cat, title=title, content=content) for (cat, title, content), _ in kept
+        ])
+        index_notes(notes, [sig for _, sig in kept])
+        dashboard.notes_created(user.id, notes)
+        embeddings.schedule_refresh(user.id)
+        return notes, duplicates
+
+    def populate_combined(self, user: User, categories: list, subject: str) -> Response:
+        """
+        Requests notes for all categories in one structured completion, routes them to
+        categories by name, and retries only the sections that failed validation.
+        """
+        by_name = {cat.name: cat for cat in categories}
+        names = list(by_name)
+
+        try:
+            raw_text = llm.complete_structured(
+                llm.build_combined_prompt(names, subject),
+                llm.notes_function_schema(names)
+            )
+            sections, invalid = llm.split_sections(raw_text, names)
+        except Exception as ex:
+            logger.error(f"Error during combined OpenAI request: {ex}")
+            sections, invalid = {}, names
+
+        for name in invalid:
+            try:
+                notes = llm.validate_notes(json.loads(llm.complete(llm.build_prompt(name, subject))))
+            except Exception as ex:
+                logger.error(f"Error during OpenAI retry for category {name}: {ex}")
+                continue
+            if notes is not None:
+                sections[name] = notes
+
+        created, duplicates = self.save_notes(user, [
+            (by_name[name], title, content)
+            for name, notes in sections.items()
+            for title, content in notes
+        ])
+        invalidate_notes_list(user.id)
+
+        logger.info(
+            f'LLM notes created (combined). Subject="{subject}", Count={len(created)}, '
+            f'Duplicates={duplicates}, Retried={invalid}'
+        )
+        return Response(
+            {
+                'message': f'Successfully created notes inspired by "{subject}" (total {len(created)}).',
+                'count': len(created),
+                'duplicates': duplicates,
+                'retried': invalid
+            },
+            status=status.HTTP_200_OK
+        )
+
+    def stream_events(self, user: User, categories: list, subject: str) -> Iterator[str]:
+        """
+        Streams each category's completion, persisting notes as their objects close.
+        Yields 'note' events, an 'error' event per failed category and a final 'done' event.
+        """
+        # Runs after the view returned, outside the request's shard.
+        with sharding.for_user(user.id):
+            count = 0
+            duplicates = 0
+            for cat in categories:
+                try:
+                    fragments = llm.stream_completion(llm.build_prompt(cat.name, subject))
+                    for note_obj in llm.iter_json_objects(fragments):
+                        cleaned = llm.clean_note(note_obj)
+                        if not cleaned:
+                            continue
+                        notes, duplicate = self.save_notes(user, [(cat, *cleaned)])
+                        duplicates += duplicate
+                        if not notes:
+                            continue
+                        note = notes[0]
+                        invalidate_notes_list(user.id)
+                        count += 1
+                        yield sse_event('note', {
+                            'id': note.id,
+                            'title': note.title,
+                            'content': note.content,
+                            'category_id': cat.id
+                        })
+                except Exception as ex:
+                    logger.error(f"Error during OpenAI stream for category {cat.name}: {ex}")
+                    yield sse_event('error', {'category_id': cat.id, 'error': 'Generation failed.'})
+
+            logger.info(f'LLM notes streamed. Subject="{subject}", Count={count}, Duplicates={duplicates}')
+            yield sse_event('done', {'count': count})
+
+
+class ImportNotesView(APIView):
+    """
+    Bulk-imports notes for the current user from an uploaded NDJSON, CSV or Markdown file.
+    Very large archives should be loaded with the 'import_notes' management command instead.
+    """
+    throttle_scope = 'import_notes'
+
+    @idempotent
+    def post(self, request: Request) -> Response:
+        """
+        Streams the uploaded 'file' into chunked bulk inserts.
+        The format is taken from the 'format' field or the file extension.
+        With skip_duplicates=true, notes duplicating existing ones are not imported.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            logger.warning("Import failed - no file uploaded.")
+            return Response(
+                {'error': 'A file is required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fmt = request.data.get('format') or detect_format(upload.name)
+        if fmt not in SUPPORTED_FORMATS:
+            logger.warning(f"Import failed - unsupported format for {upload.name}.")
+            return Response(
+                {'error': f'Unsupported format. Use one of: {", ".join(SUPPORTED_FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        stats = import_notes(
+            request.user,
+            upload,
+            fmt,
+            skip_duplicates=is_truthy(request.data.get('skip_duplicates', 'false'))
+        )
+        return Response(stats.as_dict(), status=status.HTTP_201_CREATED)
+
+
+class BatchView(APIView):
+    """
+    Runs several note, category and profile calls in one request and one transaction
+    (see notes/batch.py), e.g. loading the dashboard in a single round trip or
+    replaying changes made offline.
+    """
+
+    def post(self, request: Request) -> Response:
+        """
+        Returns the result of every operation in order. If one fails, nothing is saved
+        and the response carries that operation's status and its index in 'failed'.
+        """
+        try:
+            operations = batch.parse_operations(
+                request.data,
+                allowed=(NoteViewSet, CategoryViewSet, ProfileView),
+                max_operations=settings.NOTES_BATCH_MAX_OPERATIONS
+            )
+        except batch.BatchError as ex:
+            logger.warning(f"Batch rejected - {ex}")
+            return Response({'error': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        results, failed = batch.run_batch(request, operations)
+        if failed is not None:
+            logger.info(f"Batch of {len(operations)} rolled back at operation {failed}")
+            return Response(
+                {
+                    'error': f'Operation {failed} failed; no changes were saved.',
+                    'failed': failed,
+                    'results': results
+                },
+                status=results[failed]['status']
+            )
+        return Response({'results': results})
+
+
+class MetricsView(APIView):
+    """
+    Exposes process metrics (throttling, concurrency) in the Prometheus text format.
+    Restricted to staff users.
+    """
+    permission_classes = [IsAdminUser]
+    throttle_classes = []
+
+    def get(self, request: Request) -> HttpResponse:
+        """
+        Returns all registered metrics.
+        """
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4')
+
+
+class ProfilingListView(APIView):
+    """
+    Lists the stored request profiles (see notes/profiling.py), newest first.
+    Restricted to staff users.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request: Request) -> Response:
+        """
+        Returns the summary of every profile in the ring.
+        """
+        return Response(profiling.list_profiles())
+
+
+class ProfilingDownloadView(APIView):
+    """
+    Downloads one stored request profile: a .pstats file or speedscope JSON.
+    Restricted to staff users.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request: Request, profile_id: str) -> FileResponse:
+        """
+        Returns the profile data as an attachment.
+        """
+        path = profiling.profile_file(profile_id)
+        if path is None:
+            raise Http404
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path))
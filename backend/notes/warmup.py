@@ -0,0 +1,90 @@
+"""
+Startup warm-up: imports the heavy request-path modules, builds the URL resolver,
+connects to every database and opens the caches in a background thread, so the
+first real requests do not pay for it.
+
+Readiness (/readyz) reports not-ready until the warm-up has finished. A failed
+warm-up is retried NOTES_WARMUP_ATTEMPTS times; after that the process is marked
+warm anyway, as degraded, since warming only saves time and the database and
+migration checks still guard readiness.
+"""
+
+import importlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+_warm = threading.Event()
+_degraded = False
+_started = False
+_start_lock = threading.Lock()
+
+
+def is_warm() -> bool:
+    """
+    Returns True once warm_up() has completed.
+    """
+    return _warm.is_set()
+
+
+def is_degraded() -> bool:
+    """
+    Returns True if the process was marked warm after every warm-up attempt failed.
+    """
+    return _degraded
+
+
+def warm_up() -> None:
+    """
+    Imports NOTES_WARMUP_MODULES, populates the URL resolver, connects to every
+    database (creating the connection pool of backends configured with one) and
+    opens the caches.
+    """
+    started = time.monotonic()
+    for module in settings.NOTES_WARMUP_MODULES:
+        importlib.import_module(module)
+    get_resolver().url_patterns
+    for alias in settings.DATABASES:
+        connections[alias].ensure_connection()
+    for alias in settings.CACHES:
+        caches[alias].get('warmup')
+    _warm.set()
+    logger.info(f"Warm-up finished in {time.monotonic() - started:.2f}s")
+
+
+def start() -> None:
+    """
+    Starts warm_up() in a daemon thread (once per process).
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    def run() -> None:
+        global _degraded
+        try:
+            for attempt in range(1, settings.NOTES_WARMUP_ATTEMPTS + 1):
+                try:
+                    warm_up()
+                    return
+                except Exception:
+                    logger.exception(f"Warm-up attempt {attempt} failed.")
+                    if attempt < settings.NOTES_WARMUP_ATTEMPTS:
+                        time.sleep(settings.NOTES_WARMUP_RETRY_DELAY * attempt)
+            _degraded = True
+            _warm.set()
+            logger.error("Warm-up gave up; serving requests without it.")
+        finally:
+            # This thread's connections are not used by requests.
+            connections.close_all()
+
+    threading.Thread(target=run, name='notes-warmup', daemon=True).start()
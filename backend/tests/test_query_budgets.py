@@ -0,0 +1,307 @@
+"""
+Query and time budgets for every API route in turbo_ai/urls.py.
+
+Each route and method declares the most SQL queries and milliseconds one request
+may take. Every route is called against seeded data of increasing size (notes,
+archived notes, categories, tags, revisions, fingerprints and embeddings of the calling
+user); the test fails when a request exceeds its budget or when its query count
+grows with the amount of data, which is how N+1 queries show up.
+
+A route added to turbo_ai/urls.py without a budget here fails test_every_route_has_a_budget.
+"""
+
+import json
+import os
+import time
+from collections import namedtuple
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from notes import embeddings, fingerprints
+from notes.models import ArchivedNote, Category, DeletionJob, Note, NoteTag, Tag
+from notes.revisions import record_revision
+
+# Notes seeded for the calling user before each measurement; archived notes are a fifth of that.
+SIZES = (5, 50, 200)
+# Offset keeping seeded archive ids clear of hot note ids.
+ARCHIVE_ID_OFFSET = 10 ** 6
+
+Budget = namedtuple('Budget', ['queries', 'ms'])
+# What a route call sends: path, optional body, body format and a user other than the seeded one.
+Call = namedtuple('Call', ['path', 'data', 'format', 'user'], defaults=[None, 'json', None])
+
+# Query counts are exact for today's code, so any new query is a deliberate budget change.
+# Time budgets are coarse ceilings, several times the usual timing, to stay reliable on slow
+# machines; login and register are dominated by password hashing.
+BUDGETS = {
+    ('api-root', 'GET'): Budget(1, 100),
+    ('register', 'POST'): Budget(10, 2000),
+    ('login', 'POST'): Budget(3, 2000),
+    ('logout', 'POST'): Budget(2, 100),
+    ('profile', 'GET'): Budget(1, 100),
+    ('profile', 'PUT'): Budget(2, 100),
+    ('dashboard', 'GET'): Budget(2, 100),
+    ('note-list', 'GET'): Budget(4, 250),
+    ('note-list', 'POST'): Budget(23, 150),
+    ('note-detail', 'GET'): Budget(3, 100),
+    ('note-detail', 'PUT'): Budget(17, 150),
+    ('note-detail', 'PATCH'): Budget(17, 150),
+    ('note-detail', 'DELETE'): Budget(9, 100),
+    ('note-duplicates', 'GET'): Budget(7, 250),
+    ('note-semantic-search', 'GET'): Budget(6, 250),
+    ('note-similar', 'GET'): Budget(7, 250),
+    ('note-revisions', 'GET'): Budget(3, 100),
+    ('note-revision', 'GET'): Budget(5, 100),
+    ('note-restore-revision', 'POST'): Budget(19, 150),
+    ('category-list', 'GET'): Budget(2, 100),
+    ('category-list', 'POST'): Budget(6, 100),
+    ('category-detail', 'GET'): Budget(2, 100),
+    ('category-detail', 'PUT'): Budget(5, 100),
+    ('category-detail', 'PATCH'): Budget(5, 100),
+    ('category-detail', 'DELETE'): Budget(9, 100),
+    ('tag-list', 'GET'): Budget(2, 100),
+    ('tag-detail', 'GET'): Budget(2, 100),
+    ('tag-detail', 'PUT'): Budget(4, 100),
+    ('tag-detail', 'PATCH'): Budget(4, 100),
+    ('tag-detail', 'DELETE'): Budget(4, 100),
+    ('deletion-job', 'GET'): Budget(2, 100),
+    ('populate-llm', 'POST'): Budget(12, 250),
+    ('import-notes', 'POST'): Budget(9, 250),
+    ('batch', 'POST'): Budget(20, 250),
+    ('metrics', 'GET'): Budget(1, 100),
+    ('profiling-list', 'GET'): Budget(1, 100),
+    ('profiling-download', 'GET'): Budget(1, 100),
+}
+
+
+def api_routes():
+    """
+    Yields (route name, HTTP method) for every method served under api/v1/.
+    """
+    def walk(patterns, prefix=''):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from walk(pattern.url_patterns, prefix + str(pattern.pattern))
+            elif (prefix + str(pattern.pattern)).startswith('api/v1/'):
+                yield pattern
+
+    for pattern in walk(get_resolver().url_patterns):
+        view = pattern.callback.cls
+        methods = getattr(pattern.callback, 'actions', None) or [
+            method for method in view.http_method_names if hasattr(view, method)
+        ]
+        # HEAD and OPTIONS are answered by the GET handler and by DRF's metadata.
+        for method in methods:
+            if method not in ('head', 'options'):
+                yield pattern.name, method.upper()
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    Checks every API route against its query and time budget as the data grows.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a staff user with a token, categories, tags and a note with revision history.
+        """
+        self.user = User.objects.create_user(username='budget@example.com', password='password123',
+                                             is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.categories = [
+            Category.objects.create(user=self.user, name=name)
+            for name in ('Random Thoughts', 'School', 'Personal')
+        ]
+        self.tags = [Tag.objects.create(user=self.user, name=name) for name in ('work', 'ideas', 'later')]
+        self.note = Note.objects.create(user=self.user, category=self.categories[0], title='Target', content='v1')
+        record_revision(self.note)
+        self.counter = 0
+
+    def seed(self, size: int) -> None:
+        """
+        Tops the user's notes up to size, with fingerprints, embeddings and a tag
+        each, and a fifth of that in the archive.
+        """
+        existing = Note.objects.filter(user=self.user).count()
+        notes = Note.objects.bulk_create([
+            Note(
+                user=self.user,
+                category=self.categories[index % len(self.categories)],
+                title=f'Seeded note {index}',
+                content=' '.join(f'word{(index * 7919 + part * 104729) % 5000}' for part in range(12))
+            )
+            for index in range(existing, size)
+        ])
+        fingerprints.index_notes(notes)
+        embeddings.refresh_embeddings(self.user.id)
+        NoteTag.objects.bulk_create([
+            NoteTag(tag=self.tags[note.id % len(self.tags)], note_id=note.id) for note in notes
+        ])
+
+        archived = ArchivedNote.objects.filter(user=self.user).count()
+        ArchivedNote.objects.bulk_create([
+            ArchivedNote(
+                id=ARCHIVE_ID_OFFSET + index,
+                user=self.user,
+                category=self.categories[index % len(self.categories)],
+                title=f'Archived note {index}',
+                content=f'Archived content {index}.',
+                created_at=self.note.created_at,
+                updated_at=self.note.created_at
+            )
+            for index in range(archived, size // 5)
+        ])
+
+    def unique(self, prefix: str) -> str:
+        """
+        Returns a value not used by an earlier call.
+        """
+        self.counter += 1
+        return f'{prefix}-{self.counter}'
+
+    def make_user(self) -> User:
+        """
+        Creates a user whose token a call may consume (e.g. logout).
+        """
+        return User.objects.create_user(username=f'{self.unique("user")}@example.com', password='password123')
+
+    def call_for(self, name: str, method: str) -> Call:
+        """
+        Returns the request exercising one route and method, creating the objects it needs.
+        """
+        note = self.note
+        if (name, method) == ('note-detail', 'DELETE'):
+            note = Note.objects.create(user=self.user, category=self.categories[1], title='Doomed', content='x')
+        category = self.categories[2]
+        tag = self.tags[2]
+        if (name, method) == ('tag-detail', 'DELETE'):
+            tag = Tag.objects.create(user=self.user, name=self.unique('doomed'))
+        if (name, method) == ('category-detail', 'DELETE'):
+            category = Category.objects.create(user=self.user, name=self.unique('Doomed'))
+            Note.objects.create(user=self.user, category=category, title='In doomed', content='x')
+
+        calls = {
+            'api-root': lambda: Call('/api/v1/'),
+            'register': lambda: Call('/api/v1/register/', {
+                'username': f'{self.unique("new")}@example.com',
+                'password': 'password123'
+            }),
+            'login': lambda: Call('/api/v1/login/', {'username': 'budget@example.com', 'password': 'password123'}),
+            'logout': lambda: Call('/api/v1/logout/', user=self.make_user()),
+            'profile': lambda: Call('/api/v1/profile/', {'first_name': self.unique('Ann')}),
+            'dashboard': lambda: Call('/api/v1/dashboard/'),
+            'note-list': lambda: Call('/api/v1/notes/', {
+                'title': self.unique('New'),
+                'content': 'Fresh body',
+                'category_id': self.categories[0].id,
+                'tags': ['work', self.unique('topic')]
+            }),
+            'note-detail': lambda: Call(f'/api/v1/notes/{note.id}/', {
+                'title': 'Target',
+                'content': self.unique('Edited body')
+            }),
+            'note-duplicates': lambda: Call('/api/v1/notes/duplicates/'),
+            'note-semantic-search': lambda: Call('/api/v1/notes/semantic_search/?q=topic+subject'),
+            'note-similar': lambda: Call(f'/api/v1/notes/{note.id}/similar/'),
+            'note-revisions': lambda: Call(f'/api/v1/notes/{note.id}/revisions/'),
+            'note-revision': lambda: Call(f'/api/v1/notes/{note.id}/revisions/1/'),
+            'note-restore-revision': lambda: Call(f'/api/v1/notes/{note.id}/revisions/1/restore/'),
+            'category-list': lambda: Call('/api/v1/categories/', {'name': self.unique('Category')}),
+            'category-detail': lambda: Call(f'/api/v1/categories/{category.id}/', {
+                'name': self.unique('Renamed'),
+                'color': '#FFFFFF'
+            }),
+            'tag-list': lambda: Call('/api/v1/tags/'),
+            'tag-detail': lambda: Call(f'/api/v1/tags/{tag.id}/', {'name': self.unique('renamed')}),
+            'deletion-job': lambda: Call(f'/api/v1/deletions/{self.deletion_job().id}/'),
+            'populate-llm': lambda: Call('/api/v1/populate_llm/', {'subject': 'Budgets'}),
+            'import-notes': lambda: Call('/api/v1/import_notes/', {'file': SimpleUploadedFile(
+                'notes.jsonl',
+                b'{"title": "One", "content": "a"}\n{"title": "Two", "content": "b"}\n'
+            )}, 'multipart'),
+            'batch': lambda: Call('/api/v1/batch/', {'operations': [
+                {'method': 'GET', 'path': '/api/v1/categories/'},
+                {'method': 'GET', 'path': '/api/v1/profile/'},
+                {'method': 'POST', 'path': '/api/v1/notes/', 'body': {'title': self.unique('Batched')}},
+            ]}),
+            'metrics': lambda: Call('/api/v1/metrics/'),
+            'profiling-list': lambda: Call('/api/v1/profiling/'),
+            'profiling-download': lambda: Call(f'/api/v1/profiling/{self.stored_profile()}/'),
+        }
+        return calls[name]()
+
+    def deletion_job(self) -> DeletionJob:
+        """
+        Creates a finished category deletion job owned by the user.
+        """
+        return DeletionJob.objects.create(kind=DeletionJob.KIND_CATEGORY, target_id=0, owner_id=self.user.id,
+                                          status=DeletionJob.STATUS_DONE)
+
+    def stored_profile(self) -> str:
+        """
+        Profiles a request and returns the id of the stored profile.
+        """
+        return self.client.get('/api/v1/categories/', HTTP_X_PROFILE='sampling')['X-Profile-Id']
+
+    def measure(self, name: str, method: str) -> Budget:
+        """
+        Sends one request for the route and returns the queries and milliseconds it took.
+        """
+        call = self.call_for(name, method)
+        if call.user is not None:
+            self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=call.user).key)
+        send = getattr(self.client, method.lower())
+        data = call.data if method != 'GET' else None
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = send(call.path, data, format=call.format)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        if call.user is not None:
+            self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=self.user).key)
+        self.assertLess(response.status_code, 400, f'{method} {call.path}: {getattr(response, "data", "")}')
+        return Budget(len(queries), elapsed_ms)
+
+    def test_every_route_has_a_budget(self) -> None:
+        """
+        New routes must declare a budget.
+        """
+        missing = sorted(set(api_routes()) - set(BUDGETS))
+        self.assertEqual(missing, [], 'Add these routes to BUDGETS in tests/test_query_budgets.py')
+
+    @patch.dict(os.environ, {'NEXT_PUBLIC_OPENAI_API_KEY': 'dummy_key'}, clear=True)
+    @patch('openai.ChatCompletion.create')
+    def test_routes_stay_within_budget(self, mock_create: MagicMock) -> None:
+        """
+        Query counts do not grow with the data and stay, like timings, within budget.
+        """
+        mock_create.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content=json.dumps([
+            {'title': 'Generated', 'content': 'Generated content'}
+        ])))])
+        routes = sorted(set(api_routes()))
+
+        # One unmeasured round keeps lazy imports and first-use set-up out of the timings.
+        self.seed(SIZES[0])
+        for name, method in routes:
+            self.measure(name, method)
+
+        measured = {route: [] for route in routes}
+        for size in SIZES:
+            self.seed(size)
+            for route in routes:
+                measured[route].append(self.measure(*route))
+
+        for route, results in measured.items():
+            budget = BUDGETS[route]
+            counts = [result.queries for result in results]
+            with self.subTest(route=route, queries=counts):
+                self.assertLessEqual(counts[-1], counts[0], f'{route} queries grow with data size: {counts}')
+                self.assertLessEqual(max(counts), budget.queries, f'{route} exceeds {budget.queries} queries')
+                slowest = max(result.ms for result in results)
+                self.assertLessEqual(slowest, budget.ms, f'{route} took {slowest:.0f}ms (budget {budget.ms}ms)')
@@ -2,16 +2,76 @@
 Unit tests for the 'notes' application and related functionalities.
 """
 
+import asyncio
+import io
 import json
 import os
+import pstats
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
 from unittest.mock import patch, MagicMock
 
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 
-from notes.models import Category, Note
+from notes import (
+    archival,
+    autosave,
+    broker,
+    dashboard,
+    deletion,
+    embeddings,
+    fingerprints,
+    health,
+    idempotency,
+    metrics,
+    revisions,
+    sharding,
+    tasks,
+    warmup
+)
+from notes.broker import RESYNC_EVENT, InProcessBroker, LocalPubSub, PubSubBroker, make_event
+from notes.checks import check_autosave_cache, check_list_cache, check_throttle_cache
+from notes.deletion import schedule_category_deletion, schedule_user_deletion
+from notes.fields import MARKER
+from notes.importers import import_notes
+from notes.llm import iter_json_objects, split_sections
+from notes.models import (
+    ArchivedNote,
+    Category,
+    DashboardSummary,
+    DeletionJob,
+    IdempotencyRecord,
+    Note,
+    NoteEmbedding,
+    NoteFingerprint,
+    NoteRevision,
+    ShardAssignment,
+    Tag,
+    Task
+)
+from notes.pagination import EstimatedCountPaginator, estimate_row_count
+from notes.realtime import RealtimeRouter
+from notes.revisions import compact_revisions, rebuild_content, record_revision
+from notes.textdiff import DeltaError, apply_delta, content_hash, make_delta
+from notes.throttling import ConcurrencyLimiter, consume
 
 
 class ModelTests(TestCase):
@@ -488,3 +548,2442 @@ class PopulateLLMViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 0)
         self.assertIn('Successfully created notes inspired by "Weird JSON"', response.data['message'])
+
+
+class ImportNotesTests(APITestCase):
+    """
+    Tests for the bulk importers, the 'import_notes' command and the upload endpoint.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with one existing category and authenticates with a token.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.school = Category.objects.create(user=self.user, name='School', color='#FFF176')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_import_ndjson_maps_and_creates_categories(self) -> None:
+        """
+        Existing categories are reused by name, unknown ones are created, bad lines skipped.
+        """
+        stream = io.StringIO(
+            '{"title": "A", "content": "a", "category": "School"}\n'
+            '{"title": "B", "content": "b", "category": "Work"}\n'
+            'not json\n'
+            '{"title": "C", "content": "c"}\n'
+        )
+        stats = import_notes(self.user, stream, 'ndjson', chunk_size=2)
+        self.assertEqual(stats.created, 3)
+        self.assertEqual(stats.skipped, 1)
+        self.assertEqual(stats.rows, 4)
+        self.assertEqual(Note.objects.get(title='A').category, self.school)
+        self.assertEqual(Note.objects.get(title='B').category.name, 'Work')
+        self.assertIsNone(Note.objects.get(title='C').category)
+
+    def test_import_ndjson_non_string_category(self) -> None:
+        """
+        Categories given as other JSON values are used as text; overlong names are truncated.
+        """
+        stream = io.StringIO(
+            '{"title": "A", "category": 5}\n'
+            '{"title": "B", "category": true}\n'
+            '{"title": "C", "category": "%s"}\n' % ('x' * 150)
+        )
+        stats = import_notes(self.user, stream, 'ndjson')
+        self.assertEqual(stats.created, 3)
+        self.assertEqual(Note.objects.get(title='A').category.name, '5')
+        self.assertEqual(Note.objects.get(title='B').category.name, 'True')
+        self.assertEqual(Note.objects.get(title='C').category.name, 'x' * 100)
+
+    def test_import_csv_and_markdown(self) -> None:
+        """
+        CSV rows and Markdown headings are parsed into notes.
+        """
+        csv_stream = io.BytesIO(b'title,content,category\nX,"multi\nline",School\n')
+        import_notes(self.user, csv_stream, 'csv')
+        self.assertEqual(Note.objects.get(title='X').content, 'multi\nline')
+
+        md_stream = io.StringIO('# First\nCategory: School\nBody one\n\n# Second\nBody two\n')
+        stats = import_notes(self.user, md_stream, 'markdown')
+        self.assertEqual(stats.created, 2)
+        first = Note.objects.get(title='First')
+        self.assertEqual(first.content, 'Body one')
+        self.assertEqual(first.category, self.school)
+        self.assertEqual(Note.objects.get(title='Second').content, 'Body two')
+
+    def test_command_resumes_from_checkpoint(self) -> None:
+        """
+        With --resume, rows recorded in the checkpoint are not imported again.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.ndjson')
+            with open(path, 'w') as fh:
+                for i in range(5):
+                    fh.write(json.dumps({'title': f'N{i}', 'content': 'c'}) + '\n')
+            with open(f'{path}.checkpoint', 'w') as fh:
+                json.dump({'rows': 3}, fh)
+
+            call_command('import_notes', path, user=self.user.username, resume=True, stdout=io.StringIO())
+
+            self.assertEqual(
+                sorted(Note.objects.filter(user=self.user).values_list('title', flat=True)),
+                ['N3', 'N4']
+            )
+            self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_upload_endpoint(self) -> None:
+        """
+        Uploading a file imports its notes for the authenticated user.
+        """
+        upload = SimpleUploadedFile('notes.jsonl', b'{"title": "Up", "content": "loaded"}\n')
+        response = self.client.post('/api/v1/import_notes/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertTrue(Note.objects.filter(user=self.user, title='Up').exists())
+
+    def test_upload_endpoint_unknown_format(self) -> None:
+        """
+        Should return 400 when the format cannot be determined.
+        """
+        upload = SimpleUploadedFile('notes.bin', b'data')
+        response = self.client.post('/api/v1/import_notes/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
+
+
+@override_settings(NOTES_BACKGROUND_EAGER=True, NOTES_DELETION_BATCH_SIZE=2)
+class DeferredDeletionTests(APITestCase):
+    """
+    Tests for deferred category and user deletion.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a category holding five notes.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.category = Category.objects.create(user=self.user, name='Big', color='#FF0000')
+        for i in range(5):
+            Note.objects.create(user=self.user, category=self.category, title=f'N{i}', content='c')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def run_tasks(self) -> None:
+        """
+        Runs the queued tasks, as a task worker would.
+        """
+        while tasks.run_next('w1'):
+            pass
+
+    def test_small_category_deleted_inline(self) -> None:
+        """
+        Categories under the threshold are deleted synchronously.
+        """
+        response = self.client.delete(f'/api/v1/categories/{self.category.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Category.objects.filter(id=self.category.id).exists())
+
+    def test_deferred_category_deletion(self) -> None:
+        """
+        ?deferred=true returns 202, hides the category and detaches notes in batches.
+        """
+        response = self.client.delete(f'/api/v1/categories/{self.category.id}/?deferred=true')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['total'], 5)
+        self.assertEqual(response.data['status'], DeletionJob.STATUS_PENDING)
+
+        # Hidden before the background job has run
+        categories = self.client.get('/api/v1/categories/')
+        self.assertEqual(len(categories.data), 0)
+        notes = self.client.get('/api/v1/notes/')
+        self.assertTrue(all(note['category'] is None for note in notes.data))
+
+        self.run_tasks()
+
+        self.assertFalse(Category.objects.filter(id=self.category.id).exists())
+        self.assertEqual(Note.objects.filter(user=self.user, category__isnull=True).count(), 5)
+
+        progress = self.client.get(f'/api/v1/deletions/{response.data["id"]}/')
+        self.assertEqual(progress.status_code, status.HTTP_200_OK)
+        self.assertEqual(progress.data['status'], DeletionJob.STATUS_DONE)
+        self.assertEqual(progress.data['processed'], 5)
+
+    @override_settings(NOTES_DEFERRED_DELETE_THRESHOLD=3)
+    def test_threshold_triggers_deferred_deletion(self) -> None:
+        """
+        Categories above NOTES_DEFERRED_DELETE_THRESHOLD are deleted in the background.
+        """
+        response = self.client.delete(f'/api/v1/categories/{self.category.id}/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.run_tasks()
+        self.assertFalse(Category.objects.filter(id=self.category.id).exists())
+
+    def test_deferred_user_deletion(self) -> None:
+        """
+        The user is deactivated at once, then removed with all notes and categories.
+        """
+        job = schedule_user_deletion(self.user)
+        self.assertEqual(self.client.get('/api/v1/notes/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.run_tasks()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.STATUS_DONE)
+        self.assertEqual(job.processed, 5)
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+        self.assertFalse(Note.objects.filter(user_id=self.user.id).exists())
+        self.assertFalse(Category.objects.filter(user_id=self.user.id).exists())
+
+
+    def test_leased_job_left_to_its_runner(self) -> None:
+        """
+        A job another runner holds a live lease on is skipped by process_deletions,
+        and taken over once the lease has expired.
+        """
+        job = schedule_category_deletion(self.category)
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status=DeletionJob.STATUS_RUNNING,
+            locked_by='other',
+            locked_until=timezone.now() + timedelta(minutes=1)
+        )
+        call_command('process_deletions', stdout=io.StringIO())
+        self.assertTrue(Category.objects.filter(id=self.category.id).exists())
+
+        DeletionJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        call_command('process_deletions', stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.locked_by), (DeletionJob.STATUS_DONE, 5, ''))
+        self.assertFalse(Category.objects.filter(id=self.category.id).exists())
+
+    @override_settings(NOTES_DELETION_BATCH_SIZE=2)
+    def test_runner_stops_when_its_lease_is_taken(self) -> None:
+        """
+        A runner whose job was taken over stops after its current batch, leaving
+        progress to the new runner instead of counting the job twice.
+        """
+        job = schedule_category_deletion(self.category)
+        advance = deletion._advance
+
+        def taken_over(job, count):
+            advance(job, count)
+            DeletionJob.objects.filter(pk=job.pk).update(locked_by='other')
+
+        with patch.object(deletion, '_advance', side_effect=taken_over):
+            self.assertFalse(deletion.process_deletion_job(job.id))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.locked_by), (DeletionJob.STATUS_RUNNING, 2, 'other'))
+
+class AdminScalingTests(TestCase):
+    """
+    Tests that admin changelists do a constant number of queries and bounded counts.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a superuser and logs into the admin.
+        """
+        self.admin = User.objects.create_superuser(username='admin@example.com', password='password123')
+        self.client.force_login(self.admin)
+
+    def create_notes(self, count: int) -> None:
+        """
+        Creates notes, each with its own user and category.
+        """
+        for i in range(count):
+            user = User.objects.create_user(username=f'user{i}-{Note.objects.count()}@example.com')
+            category = Category.objects.create(user=user, name=f'Cat{i}')
+            Note.objects.create(user=user, category=category, title=f'Note{i}', content='c')
+
+    def changelist_queries(self, url: str) -> int:
+        """
+        Returns the number of queries needed to render a changelist.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_note_changelist_queries_constant(self) -> None:
+        """
+        Adding rows must not add queries to the note changelist.
+        """
+        self.create_notes(2)
+        small = self.changelist_queries('/admin/notes/note/')
+        self.create_notes(8)
+        self.assertEqual(self.changelist_queries('/admin/notes/note/'), small)
+
+    def test_category_changelist_queries_constant(self) -> None:
+        """
+        Adding rows must not add queries to the category changelist.
+        """
+        self.create_notes(2)
+        small = self.changelist_queries('/admin/notes/category/')
+        self.create_notes(8)
+        self.assertEqual(self.changelist_queries('/admin/notes/category/'), small)
+
+    def test_paginator_uses_estimate_above_cap(self) -> None:
+        """
+        Unfiltered counts above the cap come from the table estimate, filtered ones are capped.
+        """
+        self.create_notes(5)
+        paginator = EstimatedCountPaginator(Note.objects.order_by('id'), 2)
+        paginator.count_cap = 3
+        self.assertEqual(paginator.count, estimate_row_count(Note))
+
+        filtered = EstimatedCountPaginator(Note.objects.filter(title__startswith='Note').order_by('id'), 2)
+        filtered.count_cap = 3
+        self.assertEqual(filtered.count, 3)
+
+
+class TextDeltaTests(TestCase):
+    """
+    Tests for the compact text delta format.
+    """
+
+    def test_round_trip(self) -> None:
+        """
+        Applying make_delta(old, new) to old yields new.
+        """
+        old = 'line one\nline two\nline three\n'
+        new = 'line one\nline 2\nline three\nline four\n'
+        delta = make_delta(old, new)
+        self.assertEqual(apply_delta(old, delta), new)
+        self.assertEqual(make_delta(old, old), [])
+
+    def test_invalid_delta(self) -> None:
+        """
+        Deltas that run past the base or contain bad operations are rejected.
+        """
+        with self.assertRaises(DeltaError):
+            apply_delta('abc', [5])
+        with self.assertRaises(DeltaError):
+            apply_delta('abc', [{'insert': 'x'}])
+
+
+@override_settings(NOTES_REVISION_SNAPSHOT_INTERVAL=3, NOTES_REVISION_RETENTION=4)
+class NoteRevisionTests(APITestCase):
+    """
+    Tests for note revision history and its endpoints.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user and authenticates with a token.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_edits_create_revisions(self) -> None:
+        """
+        Creating and editing a note records revisions that rebuild every version.
+        """
+        response = self.client.post('/api/v1/notes/', {'title': 'T', 'content': 'v1'}, format='json')
+        note_id = response.data['id']
+        for version in range(2, 5):
+            self.client.patch(f'/api/v1/notes/{note_id}/', {'content': f'v{version}'}, format='json')
+        # Title-only edits do not add revisions
+        self.client.patch(f'/api/v1/notes/{note_id}/', {'title': 'T2'}, format='json')
+
+        listing = self.client.get(f'/api/v1/notes/{note_id}/revisions/')
+        self.assertEqual(listing.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['number'] for r in listing.data], [4, 3, 2, 1])
+        self.assertTrue(listing.data[-1]['is_snapshot'])
+
+        for number in range(1, 5):
+            detail = self.client.get(f'/api/v1/notes/{note_id}/revisions/{number}/')
+            self.assertEqual(detail.data['content'], f'v{number}')
+
+    def test_retention_compacts_history(self) -> None:
+        """
+        Old revisions beyond retention are dropped and the oldest kept becomes a snapshot.
+        """
+        note = Note.objects.create(user=self.user, title='T', content='0\n')
+        record_revision(note)
+        for version in range(1, 12):
+            previous = note.content
+            note.content = f'{version}\n'
+            note.save()
+            record_revision(note, previous_content=previous)
+
+        compact_revisions(note)
+        numbers = list(note.revisions.order_by('number').values_list('number', flat=True))
+        self.assertEqual(numbers, [9, 10, 11, 12])
+        self.assertTrue(note.revisions.get(number=9).is_snapshot)
+        self.assertEqual(rebuild_content(note, 9), '8\n')
+        self.assertEqual(rebuild_content(note, 12), '11\n')
+
+    def test_revision_number_taken_concurrently(self) -> None:
+        """
+        A save that read the latest revision before a concurrent save recorded the next
+        one is recorded after it instead of failing on the unique number.
+        """
+        note = Note.objects.create(user=self.user, title='T', content='one')
+        first = record_revision(note)
+        note.content = 'two'
+        record_revision(note, previous_content='one')
+
+        latest = revisions._latest
+        stale = [first]
+        note.content = 'three'
+        with patch.object(revisions, '_latest', side_effect=lambda note: stale.pop() if stale else latest(note)):
+            revision = record_revision(note, previous_content='one')
+        self.assertEqual(revision.number, 3)
+        self.assertEqual([rebuild_content(note, number) for number in (1, 2, 3)], ['one', 'two', 'three'])
+
+    def test_restore_revision(self) -> None:
+        """
+        Restoring a revision sets the content back and records a new revision.
+        """
+        note = Note.objects.create(user=self.user, title='T', content='first')
+        self.client.patch(f'/api/v1/notes/{note.id}/', {'content': 'second'}, format='json')
+
+        response = self.client.post(f'/api/v1/notes/{note.id}/revisions/1/restore/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['content'], 'first')
+        self.assertEqual(note.revisions.count(), 3)
+
+        missing = self.client.get(f'/api/v1/notes/{note.id}/revisions/99/')
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PartialUpdateTests(APITestCase):
+    """
+    Tests that note updates write only changed columns and accept content patches.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with one note and authenticates with a token.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.note = Note.objects.create(user=self.user, title='Title', content='line one\nline two')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.url = f'/api/v1/notes/{self.note.id}/'
+
+    def note_updates(self, payload: dict) -> list:
+        """
+        Sends a PATCH and returns the UPDATE statements it ran against the note table.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "notes_note"')]
+
+    def test_only_changed_columns_written(self) -> None:
+        """
+        Changing the title must not rewrite the content column.
+        """
+        updates = self.note_updates({'title': 'New title', 'content': 'line one\nline two'})
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"title"', updates[0])
+        self.assertNotIn('"content"', updates[0])
+
+    def test_unchanged_update_skips_write(self) -> None:
+        """
+        An autosave that changes nothing does not touch the row or updated_at.
+        """
+        updated_at = self.note.updated_at
+        self.assertEqual(self.note_updates({'title': 'Title', 'content': 'line one\nline two'}), [])
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.updated_at, updated_at)
+
+    def patch(self, delta: list, base: str = 'line one\nline two', **payload):
+        """
+        Sends a content_patch made against base.
+        """
+        payload.update(content_patch=delta, base_content_hash=content_hash(base))
+        return self.client.patch(self.url, payload, format='json')
+
+    def test_content_patch(self) -> None:
+        """
+        content_patch applies a delta to the stored content.
+        """
+        response = self.patch([9, -4, 'TWO'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['content'], 'line one\nTWO two')
+
+    def test_invalid_content_patch(self) -> None:
+        """
+        Patches that do not fit the content, are combined with content or lack the base hash are rejected.
+        """
+        self.assertEqual(self.patch([100, 'x']).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.patch(['y'], content='x').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(self.url, {'content_patch': [9, -4, 'TWO']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stale_content_patch_conflicts(self) -> None:
+        """
+        A patch made against content the note no longer has (a replay, another tab) gets 409 and changes nothing.
+        """
+        self.assertEqual(self.patch([9, -4, 'TWO']).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.patch([9, -4, 'TWO']).status_code, status.HTTP_409_CONFLICT)
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.content, 'line one\nTWO two')
+
+    def test_patch_racing_another_write_conflicts(self) -> None:
+        """
+        A write landing after a patch was checked against the content, but before it is
+        written, makes the patch 409 instead of being overwritten by it; its tags are not set.
+        """
+        def other_write(*args):
+            Note.objects.filter(pk=self.note.pk).update(content='line one\nother', updated_at=timezone.now())
+            return apply_delta(*args)
+
+        with patch('notes.serializers.apply_delta', side_effect=other_write):
+            response = self.patch([9, -4, 'TWO'], tags=['racing'])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.content, 'line one\nother')
+        self.assertFalse(Tag.objects.exists())
+
+
+class LLMStreamingTests(APITestCase):
+    """
+    Tests for the incremental JSON parser and the streaming populate_llm mode.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with one of the default categories.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.category = Category.objects.create(user=self.user, name='School', color='#FFF176')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_iter_json_objects_across_fragments(self) -> None:
+        """
+        Objects are yielded as they close, even when split mid-token, and a malformed one is skipped.
+        """
+        text = (
+            '[{"title": "A", "content": "has } brace"}, '
+            '{"title": "B" "content": "x"}, '
+            '{"title": "C", "content": "c"}]'
+        )
+        fragments = [text[i:i + 7] for i in range(0, len(text), 7)]
+        objects = list(iter_json_objects(fragments))
+        self.assertEqual([obj['title'] for obj in objects], ['A', 'C'])
+        self.assertEqual(objects[0]['content'], 'has } brace')
+
+    @patch.dict(os.environ, {'NEXT_PUBLIC_OPENAI_API_KEY': 'dummy_key'}, clear=True)
+    @patch('openai.ChatCompletion.create')
+    def test_stream_mode_emits_note_events(self, mock_create: MagicMock) -> None:
+        """
+        Each completed note is saved and sent as an SSE event, followed by 'done'.
+        """
+        text = json.dumps([{'title': 'T1', 'content': 'C1'}, {'title': 'T2', 'content': 'C2'}])
+        mock_create.return_value = iter(
+            [{'choices': [{'delta': {'content': text[i:i + 5]}}]} for i in range(0, len(text), 5)]
+        )
+
+        response = self.client.post('/api/v1/populate_llm/?stream=true', {'subject': 'S'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        body = b''.join(response.streaming_content).decode()
+        events = [block.split('\n') for block in body.strip().split('\n\n')]
+        self.assertEqual([lines[0] for lines in events], ['event: note', 'event: note', 'event: done'])
+        self.assertEqual(json.loads(events[-1][1][len('data: '):]), {'count': 2})
+        self.assertEqual(Note.objects.filter(user=self.user, category=self.category).count(), 2)
+        self.assertTrue(mock_create.call_args.kwargs['stream'])
+
+
+class LLMCombinedModeTests(APITestCase):
+    """
+    Tests for the single-request, multi-category populate_llm mode.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with the three default categories.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        for name in ['Random Thoughts', 'School', 'Personal']:
+            Category.objects.create(user=self.user, name=name)
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    @patch.dict(os.environ, {'NEXT_PUBLIC_OPENAI_API_KEY': 'dummy_key'}, clear=True)
+    @patch('openai.ChatCompletion.create')
+    def test_combined_mode_retries_only_invalid_sections(self, mock_create: MagicMock) -> None:
+        """
+        Valid sections are routed by name; the invalid one is retried alone.
+        """
+        combined = {
+            'Random Thoughts': [{'title': 'R1', 'content': 'r1'}, {'title': 'R2', 'content': 'r2'}],
+            'School': [{'title': 'S1', 'content': 's1'}],
+            'Personal': [{'title': 'P1'}],
+        }
+        retry = [{'title': 'P2', 'content': 'p2'}, {'title': 'P3', 'content': 'p3'}]
+        mock_create.side_effect = [
+            MagicMock(choices=[MagicMock(message={'function_call': {'arguments': json.dumps(combined)}})]),
+            MagicMock(choices=[MagicMock(message=MagicMock(content=json.dumps(retry)))]),
+        ]
+
+        response = self.client.post('/api/v1/populate_llm/', {'subject': 'S', 'mode': 'combined'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['retried'], ['Personal'])
+        self.assertEqual(mock_create.call_count, 2)
+        self.assertEqual(mock_create.call_args_list[0].kwargs['function_call'], {'name': 'save_notes'})
+        self.assertIn('Personal', mock_create.call_args_list[1].kwargs['messages'][1]['content'])
+
+        personal = Note.objects.filter(user=self.user, category__name='Personal')
+        self.assertEqual(sorted(personal.values_list('title', flat=True)), ['P2', 'P3'])
+        self.assertEqual(Note.objects.filter(user=self.user, category__name='School').count(), 1)
+
+    def test_split_sections_rejects_non_object(self) -> None:
+        """
+        A response that is not a JSON object marks every section invalid.
+        """
+        valid, invalid = split_sections('[1, 2]', ['A', 'B'])
+        self.assertEqual(valid, {})
+        self.assertEqual(invalid, ['A', 'B'])
+
+
+@override_settings(
+    NOTES_THROTTLE_ENABLED=True,
+    NOTES_THROTTLE_RATES={'user': '100/min', 'notes': '2/min'},
+    NOTES_GLOBAL_THROTTLE_RATES={'global': '1000/min'},
+    NOTES_CONCURRENCY_LIMITS={'populate_llm': 1}
+)
+class ThrottlingTests(APITestCase):
+    """
+    Tests for token-bucket throttles, the concurrency limiter and the metrics endpoint.
+    """
+
+    def setUp(self) -> None:
+        """
+        Clears throttle state and authenticates a user.
+        """
+        caches['throttle'].clear()
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_per_route_user_rate(self) -> None:
+        """
+        The notes scope allows a burst of 2, then returns 429 with Retry-After.
+        """
+        self.assertEqual(self.client.get('/api/v1/notes/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/v1/notes/').status_code, status.HTTP_200_OK)
+        response = self.client.get('/api/v1/notes/')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        # Other scopes keep their own bucket
+        self.assertEqual(self.client.get('/api/v1/categories/').status_code, status.HTTP_200_OK)
+
+    def test_token_bucket_refills(self) -> None:
+        """
+        Tokens refill at the configured rate.
+        """
+        self.assertTrue(consume('bucket', '1/s', now=100.0)[0])
+        allowed, wait = consume('bucket', '1/s', now=100.5)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.5)
+        self.assertTrue(consume('bucket', '1/s', now=101.1)[0])
+
+    def test_concurrent_requests_cannot_share_a_token(self) -> None:
+        """
+        Taking a token is atomic: of many requests racing for a bucket, only its capacity get through.
+        """
+        get = LocMemCache.get
+
+        def slow_get(cache, *args, **kwargs):
+            value = get(cache, *args, **kwargs)
+            time.sleep(0.01)
+            return value
+
+        results = []
+        # Caches are per thread, so the class is patched.
+        with patch.object(LocMemCache, 'get', slow_get):
+            threads = [
+                threading.Thread(target=lambda: results.append(consume('race', '5/min', now=100.0)[0]))
+                for _ in range(20)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results.count(True), 5)
+
+    def test_check_warns_on_process_local_store(self) -> None:
+        """
+        The system check warns while throttle counters are kept per process, not once they are shared.
+        """
+        self.assertEqual([warning.id for warning in check_throttle_cache()], ['notes.W002'])
+        shared = {**settings.CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with self.settings(CACHES=shared, NOTES_THROTTLE_CACHE='shared'):
+            self.assertEqual(check_throttle_cache(), [])
+        with self.settings(NOTES_THROTTLE_ENABLED=False):
+            self.assertEqual(check_throttle_cache(), [])
+
+    @override_settings(NOTES_GLOBAL_THROTTLE_RATES={'global': '1/min'})
+    def test_global_rate_shared_between_users(self) -> None:
+        """
+        The global bucket is charged by every user.
+        """
+        self.assertEqual(self.client.get('/api/v1/categories/').status_code, status.HTTP_200_OK)
+        other = User.objects.create_user(username='other@example.com')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=other).key)
+        self.assertEqual(self.client.get('/api/v1/categories/').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_concurrency_limit_rejects_instead_of_queueing(self) -> None:
+        """
+        With all populate_llm slots in use, requests get 429 at once; a finished request frees its slot.
+        """
+        limiter = ConcurrencyLimiter('populate_llm')
+        self.assertTrue(limiter.acquire())
+        response = self.client.post('/api/v1/populate_llm/', {'subject': 'x'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '5')
+        limiter.release()
+
+        # Missing API key -> 500, but the slot must be released afterwards
+        self.assertEqual(
+            self.client.post('/api/v1/populate_llm/', {'subject': 'x'}, format='json').status_code,
+            status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+        self.assertTrue(limiter.acquire())
+        limiter.release()
+
+    def test_metrics_endpoint_staff_only(self) -> None:
+        """
+        Metrics are rendered in Prometheus format for staff and hidden from others.
+        """
+        self.client.get('/api/v1/notes/')
+        self.assertEqual(self.client.get('/api/v1/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/v1/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'notes_throttle_requests_total{kind="user",result="allowed",scope="notes"}',
+            response.content.decode()
+        )
+
+
+class HealthCheckTests(TestCase):
+    """
+    Tests for the /healthz and /readyz probe endpoints.
+    """
+    # The warm-up connects to every database.
+    databases = {'default', 'shard_1'}
+
+    def test_healthz_skips_database_and_sessions(self) -> None:
+        """
+        Liveness answers without queries and without touching the session.
+        """
+        with self.assertNumQueries(0):
+            response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'ok'})
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+
+    def test_readyz_reports_ready_after_warmup(self) -> None:
+        """
+        Readiness is 200 once the database, migrations and warm-up checks all pass.
+        """
+        warmup.warm_up()
+        response = self.client.get('/readyz/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['checks'],
+            {'database': True, 'migrations': True, 'warmup': True}
+        )
+
+    @override_settings(NOTES_WARMUP_ON_STARTUP=True)
+    def test_readyz_unavailable_until_warm(self) -> None:
+        """
+        Readiness is 503 while the warm-up has not finished.
+        """
+        with patch.object(warmup, 'is_warm', return_value=False):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['checks']['warmup'])
+
+    def test_readyz_ready_with_warmup_disabled(self) -> None:
+        """
+        With NOTES_WARMUP=0 no warm-up runs, and readiness does not wait for one.
+        """
+        with patch.object(warmup, 'is_warm', return_value=False):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['checks']['warmup'])
+
+    @override_settings(NOTES_WARMUP_ATTEMPTS=3, NOTES_WARMUP_RETRY_DELAY=0)
+    def test_failed_warmup_is_retried_then_degraded(self) -> None:
+        """
+        A failing warm-up is retried, and the process is marked warm (degraded) once the attempts run out.
+        """
+        warm = warmup._warm
+        self.addCleanup(setattr, warmup, '_warm', warm)
+        self.addCleanup(setattr, warmup, '_degraded', False)
+        self.addCleanup(setattr, warmup, '_started', False)
+        warmup._warm, warmup._started = threading.Event(), False
+
+        with patch.object(warmup, 'warm_up', side_effect=ConnectionError('cache down')) as warm_up, \
+                self.assertLogs('notes.warmup', 'ERROR'):
+            warmup.start()
+            self.assertTrue(warmup._warm.wait(5))
+        self.assertEqual(warm_up.call_count, 3)
+        self.assertTrue(warmup.is_degraded())
+
+    def test_readyz_unavailable_without_database(self) -> None:
+        """
+        A failing database check makes the pod not ready and skips the migration check.
+        """
+        with patch.object(health, 'check_database', return_value=False):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['checks']['migrations'])
+
+
+class StartupTests(APITestCase):
+    """
+    Tests for the cold-start trimming: lazy openai import and the API-only profile.
+    """
+
+    def test_openai_not_imported_at_startup(self) -> None:
+        """
+        Loading the app and its views does not import openai.
+        """
+        snippet = (
+            'import sys, django; django.setup(); import turbo_ai.urls; '
+            'print(int("openai" in sys.modules))'
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='turbo_ai.settings', NOTES_WARMUP='0')
+        result = subprocess.run([sys.executable, '-c', snippet], env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '0')
+
+    @modify_settings(MIDDLEWARE={'remove': [
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    ]})
+    def test_logout_without_sessions(self) -> None:
+        """
+        Logout only needs the token when session middleware is not installed.
+        """
+        user = User.objects.create_user(username='test@example.com', password='password123')
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        response = self.client.post('/api/v1/logout/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Token.objects.filter(user=user).exists())
+
+
+class RealtimeTests(APITestCase):
+    """
+    Tests for realtime change push: brokers, viewset events and the ASGI endpoints.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token and installs a fresh in-process broker.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.broker = InProcessBroker()
+        patcher = patch.object(broker, '_broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_viewsets_publish_after_commit(self) -> None:
+        """
+        Note and category create/update/delete publish events for the owner once committed.
+        """
+        with patch.object(self.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                note_id = self.client.post('/api/v1/notes/', {'title': 'A', 'content': 'x'}, format='json').data['id']
+            self.assertEqual(publish.call_count, 1)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f'/api/v1/notes/{note_id}/', {'title': 'B'}, format='json')
+                self.client.delete(f'/api/v1/notes/{note_id}/')
+                category_id = self.client.post('/api/v1/categories/', {'name': 'Work'}, format='json').data['id']
+                self.client.delete(f'/api/v1/categories/{category_id}/')
+
+        events = [(args[0], args[1]['type'], args[1]['id']) for args, _ in publish.call_args_list]
+        self.assertEqual(events, [
+            (self.user.id, 'note.created', note_id),
+            (self.user.id, 'note.updated', note_id),
+            (self.user.id, 'note.deleted', note_id),
+            (self.user.id, 'category.created', category_id),
+            (self.user.id, 'category.deleted', category_id),
+        ])
+        self.assertEqual(publish.call_args_list[1][0][1]['data']['title'], 'B')
+
+    @override_settings(NOTES_REALTIME_QUEUE_SIZE=2)
+    async def test_slow_subscriber_gets_resync(self) -> None:
+        """
+        A subscriber that falls behind the queue size receives a single resync event.
+        """
+        subscription = self.broker.subscribe(1)
+        for pk in range(3):
+            self.broker.publish(1, make_event('note', 'updated', pk))
+        await asyncio.sleep(0)
+        self.assertEqual(await subscription.get(), RESYNC_EVENT)
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_pubsub_broker_crosses_processes(self) -> None:
+        """
+        Events published through one broker reach the matching user's subscribers on another.
+        """
+        transport = LocalPubSub()
+        publisher, receiver = PubSubBroker(transport), PubSubBroker(transport)
+        subscription = receiver.subscribe(7)
+        other = receiver.subscribe(8)
+        publisher.publish(7, make_event('note', 'deleted', 3))
+        event = await asyncio.wait_for(subscription.get(), 1)
+        self.assertEqual(event, {'type': 'note.deleted', 'id': 3, 'data': None})
+        self.assertTrue(other.queue.empty())
+
+    async def test_websocket_pushes_user_events(self) -> None:
+        """
+        An authenticated WebSocket receives the user's events and unsubscribes on disconnect.
+        """
+        communicator = ApplicationCommunicator(RealtimeRouter(None), {
+            'type': 'websocket',
+            'path': '/ws/notes/',
+            'query_string': f'token={self.token.key}'.encode(),
+            'headers': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(1))['type'], 'websocket.accept')
+
+        self.broker.publish(self.user.id, make_event('note', 'created', 5, {'title': 'A'}))
+        message = await communicator.receive_output(1)
+        self.assertEqual(json.loads(message['text'])['data'], {'title': 'A'})
+
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(1)
+        self.assertEqual(self.broker.connection_count(), 0)
+
+    async def test_websocket_rejects_invalid_token(self) -> None:
+        """
+        A WebSocket without a valid token is closed with code 4401.
+        """
+        communicator = ApplicationCommunicator(RealtimeRouter(None), {
+            'type': 'websocket',
+            'path': '/ws/notes/',
+            'query_string': b'token=nope',
+            'headers': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual(await communicator.receive_output(1), {'type': 'websocket.close', 'code': 4401})
+
+    async def test_sse_streams_user_events(self) -> None:
+        """
+        The SSE endpoint authenticates by header and streams events as they are published.
+        """
+        communicator = ApplicationCommunicator(RealtimeRouter(None), {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/v1/events/',
+            'query_string': b'',
+            'headers': [(b'authorization', f'Token {self.token.key}'.encode())],
+        })
+        start = await communicator.receive_output(1)
+        self.assertEqual(start['status'], 200)
+        self.assertEqual((await communicator.receive_output(1))['body'], b': connected\n\n')
+
+        self.broker.publish(self.user.id, make_event('category', 'deleted', 2))
+        body = (await communicator.receive_output(1))['body'].decode()
+        self.assertTrue(body.startswith('event: category.deleted\ndata: '))
+
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+        self.assertEqual(self.broker.connection_count(), 0)
+
+
+@override_settings(NOTES_LIST_CACHE_ENABLED=True)
+class NotesListCacheTests(APITestCase):
+    """
+    Tests for the per-user cache of the notes list.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token, a category and a note, and clears the cache.
+        """
+        caches['default'].clear()
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.category = Category.objects.create(user=self.user, name='Personal')
+        self.note = Note.objects.create(user=self.user, category=self.category, title='First', content='x')
+
+    def test_hit_skips_notes_queries(self) -> None:
+        """
+        A repeated list is served from the cache with only the token lookup, byte for byte.
+        """
+        first = self.client.get('/api/v1/notes/')
+        hits = metrics.get('notes_list_cache_requests_total', result='hit')
+        with self.assertNumQueries(1):
+            second = self.client.get('/api/v1/notes/')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual(metrics.get('notes_list_cache_requests_total', result='hit'), hits + 1)
+
+    def test_writes_invalidate(self) -> None:
+        """
+        Note updates, creates and category renames are visible on the next list.
+        """
+        self.client.get('/api/v1/notes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/v1/notes/{self.note.id}/', {'title': 'Renamed'}, format='json')
+        self.assertEqual(self.client.get('/api/v1/notes/').data[0]['title'], 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/notes/', {'title': 'Second', 'content': 'y'}, format='json')
+        self.assertEqual(len(self.client.get('/api/v1/notes/').json()), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/v1/categories/{self.category.id}/', {'name': 'Home'}, format='json')
+        names = {note['category']['name'] for note in self.client.get('/api/v1/notes/').json() if note['category']}
+        self.assertEqual(names, {'Home'})
+
+    def test_check_warns_on_process_local_cache(self) -> None:
+        """
+        The system check warns while the list cache is stored per process, not once it is shared.
+        """
+        self.assertEqual([warning.id for warning in check_list_cache()], ['notes.W001'])
+        shared = {**settings.CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with self.settings(CACHES=shared, NOTES_LIST_CACHE='shared'):
+            self.assertEqual(check_list_cache(), [])
+        with self.settings(NOTES_LIST_CACHE_ENABLED=False):
+            self.assertEqual(check_list_cache(), [])
+
+    def test_cache_is_per_user(self) -> None:
+        """
+        Another user's list is never served from this user's cache.
+        """
+        self.client.get('/api/v1/notes/')
+        other = User.objects.create_user(username='other@example.com')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=other).key)
+        self.assertEqual(self.client.get('/api/v1/notes/').json(), [])
+
+
+class ArchivalTests(APITestCase):
+    """
+    Tests for moving cold notes to the archive table and reading them transparently.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token, one recent note and one untouched for 400 days.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.category = Category.objects.create(user=self.user, name='Personal')
+        self.old = Note.objects.create(user=self.user, category=self.category, title='Old', content='ancient idea')
+        record_revision(self.old)
+        Note.objects.filter(id=self.old.id).update(updated_at=timezone.now() - timedelta(days=400))
+        self.recent = Note.objects.create(user=self.user, title='Recent', content='fresh idea')
+
+    def archive(self) -> None:
+        """
+        Runs the archive_notes command.
+        """
+        call_command('archive_notes', batch_size=1, stdout=io.StringIO())
+
+    def test_command_moves_only_cold_notes(self) -> None:
+        """
+        Cold notes move with their id and fields; their revisions are dropped.
+        """
+        self.archive()
+        self.assertEqual(list(Note.objects.values_list('id', flat=True)), [self.recent.id])
+        archived = ArchivedNote.objects.get()
+        self.assertEqual((archived.id, archived.title, archived.category_id), (self.old.id, 'Old', self.category.id))
+        self.assertFalse(NoteRevision.objects.filter(note_id=self.old.id).exists())
+
+    def test_list_and_search_include_archive(self) -> None:
+        """
+        The list merges hot and archived notes by recency; search covers both tables.
+        """
+        self.archive()
+        titles = [note['title'] for note in self.client.get('/api/v1/notes/').data]
+        self.assertEqual(titles, ['Recent', 'Old'])
+        self.assertEqual([n['title'] for n in self.client.get('/api/v1/notes/?search=ANCIENT').data], ['Old'])
+        self.assertEqual([n['title'] for n in self.client.get('/api/v1/notes/?archived=false').data], ['Recent'])
+
+    def test_replayed_create_returns_archived_note(self) -> None:
+        """
+        Replaying the create of a note archived since returns it instead of adding a copy.
+        """
+        Note.objects.filter(id=self.old.id).update(client_id='n-1')
+        self.archive()
+        response = self.client.post('/api/v1/notes/', {'title': 'Old', 'client_id': 'n-1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.old.id)
+        self.assertEqual(list(Note.objects.values_list('id', flat=True)), [self.recent.id])
+
+    def test_retrieve_serves_archive_and_update_rehydrates(self) -> None:
+        """
+        Archived notes are readable by id; an update moves the note back to the hot table.
+        """
+        self.archive()
+        response = self.client.get(f'/api/v1/notes/{self.old.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['category']['name'], 'Personal')
+        self.assertEqual(self.client.get(f'/api/v1/notes/{self.old.id}/revisions/').data, [])
+
+        response = self.client.patch(f'/api/v1/notes/{self.old.id}/', {'title': 'Revived'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Note.objects.get(id=self.old.id).title, 'Revived')
+        self.assertFalse(ArchivedNote.objects.exists())
+
+    def test_delete_archived_note(self) -> None:
+        """
+        Deleting an archived note removes it from the archive without rehydrating it.
+        """
+        self.archive()
+        response = self.client.delete(f'/api/v1/notes/{self.old.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(ArchivedNote.objects.exists())
+        self.assertFalse(Note.objects.filter(id=self.old.id).exists())
+
+
+class CompressedContentTests(APITestCase):
+    """
+    Tests for compressed content storage and the preview list mode.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+    def stored_content(self, note_id: int) -> str:
+        """
+        Returns the raw content column of a note, bypassing the field conversion.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT content FROM notes_note WHERE id = %s', [note_id])
+            return cursor.fetchone()[0]
+
+    def test_large_content_stored_compressed(self) -> None:
+        """
+        Content above the threshold is compressed in the database and read back unchanged.
+        """
+        text = 'All work and no play makes Jack a dull boy. ' * 500
+        note = Note.objects.create(user=self.user, title='Big', content=text)
+        stored = self.stored_content(note.id)
+        self.assertTrue(stored.startswith(MARKER + 'z:'))
+        self.assertLess(len(stored), len(text) // 10)
+        self.assertEqual(Note.objects.get(id=note.id).content, text)
+
+    def test_small_and_marker_content(self) -> None:
+        """
+        Small content is stored as is; text starting with the marker is always encoded.
+        """
+        plain = Note.objects.create(user=self.user, content='short')
+        self.assertEqual(self.stored_content(plain.id), 'short')
+        tricky = Note.objects.create(user=self.user, content=MARKER + 'z:not really')
+        self.assertNotEqual(self.stored_content(tricky.id), MARKER + 'z:not really')
+        self.assertEqual(Note.objects.get(id=tricky.id).content, MARKER + 'z:not really')
+
+    @override_settings(NOTES_CONTENT_COMPRESSION=None)
+    def test_compression_can_be_disabled(self) -> None:
+        """
+        With compression off, large content is stored as plain text.
+        """
+        note = Note.objects.create(user=self.user, content='x' * 10000)
+        self.assertEqual(self.stored_content(note.id), 'x' * 10000)
+
+    def test_preview_follows_content(self) -> None:
+        """
+        The preview is truncated with an ellipsis and refreshed by partial updates and bulk inserts.
+        """
+        note_id = self.client.post('/api/v1/notes/', {'title': 'A', 'content': 'a' * 300}, format='json').data['id']
+        self.assertEqual(Note.objects.get(id=note_id).preview, 'a' * 199 + '…')
+        self.client.patch(f'/api/v1/notes/{note_id}/', {'content': 'short now'}, format='json')
+        self.assertEqual(Note.objects.get(id=note_id).preview, 'short now')
+
+        Note.objects.bulk_create([Note(user=self.user, content='bulk')])
+        self.assertEqual(Note.objects.get(content='bulk').preview, 'bulk')
+
+    def test_preview_view_defers_content(self) -> None:
+        """
+        ?view=preview returns previews without selecting the content column.
+        """
+        Note.objects.create(user=self.user, title='Big', content='y' * 10000)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/notes/?view=preview')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('content', response.data[0])
+        self.assertEqual(len(response.data[0]['preview']), 200)
+        self.assertFalse(any('"notes_note"."content"' in query['sql'] for query in queries.captured_queries))
+
+    def test_search_matches_compressed_content(self) -> None:
+        """
+        Search finds compressed notes by the words in their body, not by fragments of the encoded form.
+        """
+        text = 'The quick brown fox jumps over the lazy dog. ' * 200
+        note = Note.objects.create(user=self.user, title='Big', content=text)
+        encoded = self.stored_content(note.id)[3:]
+        fragment = next(encoded[i:i + 3] for i in range(len(encoded)) if encoded[i:i + 3].lower() not in text.lower())
+
+        found = self.client.get('/api/v1/notes/', {'search': 'QUICK brown'}).data
+        self.assertEqual([item['id'] for item in found], [note.id])
+        self.assertEqual(self.client.get('/api/v1/notes/', {'search': fragment}).data, [])
+
+
+class DuplicateDetectionTests(APITestCase):
+    """
+    Tests for the fingerprint index and duplicate detection on create, import and the clusters endpoint.
+    """
+
+    TEXT = (
+        'Plan the quarterly roadmap review with the design team, collect open questions '
+        'about the release budget and send a summary to the client before Friday'
+    )
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+    def create(self, title: str, content: str) -> dict:
+        """
+        Creates a note through the API and returns the response data.
+        """
+        return self.client.post('/api/v1/notes/', {'title': title, 'content': content}, format='json').data
+
+    def test_create_reports_exact_and_near_duplicates(self) -> None:
+        """
+        Create responses list matching notes; formatting and a one-word edit still match.
+        """
+        first = self.create('Roadmap', self.TEXT)
+        self.assertEqual(first['duplicates'], [])
+        self.assertTrue(NoteFingerprint.objects.filter(note_id=first['id']).exists())
+
+        self.assertEqual(self.create('ROADMAP', self.TEXT.upper() + '!')['duplicates'], [first['id']])
+        near = self.create('Roadmap', self.TEXT.replace('Friday', 'Monday'))
+        self.assertIn(first['id'], near['duplicates'])
+        self.assertEqual(self.create('Groceries', 'milk eggs bread butter')['duplicates'], [])
+
+    def test_duplicates_are_per_user(self) -> None:
+        """
+        Another user's identical note is not a duplicate.
+        """
+        other = User.objects.create_user(username='other@example.com', password='password123')
+        note = Note.objects.create(user=other, title='Roadmap', content=self.TEXT)
+        fingerprints.index_note(note)
+        self.assertEqual(self.create('Roadmap', self.TEXT)['duplicates'], [])
+
+    def test_update_refreshes_fingerprint(self) -> None:
+        """
+        Editing a note's content moves it out of (or into) a duplicate cluster.
+        """
+        first = self.create('Roadmap', self.TEXT)
+        second = self.create('Roadmap', self.TEXT)
+        self.assertEqual(len(self.client.get('/api/v1/notes/duplicates/').data), 1)
+        self.client.patch(f"/api/v1/notes/{second['id']}/", {'content': 'something else entirely'}, format='json')
+        self.assertEqual(self.client.get('/api/v1/notes/duplicates/').data, [])
+        self.assertNotEqual(first['id'], second['id'])
+
+    def test_import_skip_duplicates(self) -> None:
+        """
+        Imports count duplicates of existing notes and of earlier rows, and skip them on request.
+        """
+        Note.objects.create(user=self.user, title='Roadmap', content=self.TEXT)
+        fingerprints.index_notes(Note.objects.filter(user=self.user))
+        rows = [
+            {'title': 'Roadmap', 'content': self.TEXT},
+            {'title': 'New', 'content': 'a brand new idea'},
+            {'title': 'New', 'content': 'A brand new idea.'},
+        ]
+        stream = io.StringIO(''.join(json.dumps(row) + '\n' for row in rows))
+        stats = import_notes(self.user, stream, 'ndjson', skip_duplicates=True)
+        self.assertEqual((stats.created, stats.duplicates), (1, 2))
+        self.assertEqual(Note.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(NoteFingerprint.objects.filter(user=self.user).count(), 2)
+
+        stats = import_notes(self.user, io.StringIO(json.dumps(rows[1]) + '\n'), 'ndjson')
+        self.assertEqual((stats.created, stats.duplicates), (1, 1))
+
+    def test_clusters_endpoint(self) -> None:
+        """
+        Exact and near duplicates are grouped into clusters; unrelated notes are left out.
+        """
+        a = self.create('Roadmap', self.TEXT)['id']
+        b = self.create('Roadmap', self.TEXT)['id']
+        c = self.create('Roadmap', self.TEXT.replace('Friday', 'Monday'))['id']
+        d = self.create('Shopping', 'milk eggs bread butter cheese apples')['id']
+        e = self.create('SHOPPING', 'milk, eggs, bread, butter, cheese, apples')['id']
+        self.create('Unrelated', 'call the plumber about the kitchen sink')
+
+        clusters = self.client.get('/api/v1/notes/duplicates/').data
+        self.assertEqual([[note['id'] for note in cluster['notes']] for cluster in clusters], [[a, b, c], [d, e]])
+        self.assertEqual([cluster['exact'] for cluster in clusters], [False, True])
+
+    def test_fingerprint_command_backfills(self) -> None:
+        """
+        fingerprint_notes indexes notes created without a fingerprint.
+        """
+        Note.objects.bulk_create([Note(user=self.user, title=f'Note {i}', content=self.TEXT) for i in range(3)])
+        call_command('fingerprint_notes', batch_size=2, stdout=io.StringIO())
+        self.assertEqual(NoteFingerprint.objects.filter(user=self.user).count(), 3)
+
+    @patch.dict(os.environ, {'NEXT_PUBLIC_OPENAI_API_KEY': 'dummy_key'}, clear=True)
+    @patch('openai.ChatCompletion.create')
+    def test_populate_llm_skip_duplicates(self, mock_create: MagicMock) -> None:
+        """
+        Re-running the same subject with skip_duplicates creates nothing new.
+        """
+        category = Category.objects.create(user=self.user, name='School')
+        mock_create.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content=json.dumps([
+            {'title': 'Study plan', 'content': self.TEXT},
+            {'title': 'Reading', 'content': 'read two chapters of the history book'},
+        ])))])
+        first = self.client.post('/api/v1/populate_llm/', {'subject': 'School'}, format='json')
+        self.assertEqual((first.data['count'], first.data['duplicates']), (2, 0))
+
+        again = self.client.post('/api/v1/populate_llm/', {'subject': 'School', 'skip_duplicates': True}, format='json')
+        self.assertEqual((again.data['count'], again.data['duplicates']), (0, 2))
+        self.assertEqual(Note.objects.filter(user=self.user, category=category).count(), 2)
+
+
+@override_settings(NOTES_BACKGROUND_EAGER=True, NOTES_EMBEDDER='hashing')
+class SemanticSearchTests(APITestCase):
+    """
+    Tests for note embeddings, their background refresh and the semantic search endpoints.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token and three notes on different topics, embedded.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.garden = Note.objects.create(user=self.user, title='Garden', content='plant tomatoes and water the garden')
+        self.taxes = Note.objects.create(user=self.user, title='Taxes', content='file the income tax return forms')
+        self.tomatoes = Note.objects.create(user=self.user, title='Tomatoes', content='tomatoes need water and sun')
+        embeddings.refresh_embeddings(self.user.id)
+
+    def test_embeddings_are_compact(self) -> None:
+        """
+        Vectors are stored as int8 and dequantize to unit length.
+        """
+        embedding = NoteEmbedding.objects.get(note=self.garden)
+        self.assertEqual(len(embedding.vector), settings.NOTES_EMBEDDING_DIMENSIONS)
+        vector = embeddings.dequantize(embedding.vector, embedding.scale)
+        self.assertAlmostEqual(float((vector ** 2).sum()), 1.0, places=2)
+
+    def test_semantic_search_ranks_related_notes(self) -> None:
+        """
+        The search returns previews ordered by similarity, with scores.
+        """
+        response = self.client.get('/api/v1/notes/semantic_search/?q=watering tomatoes&limit=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([note['id'] for note in response.data], [self.tomatoes.id, self.garden.id])
+        self.assertGreater(response.data[0]['score'], response.data[1]['score'])
+        self.assertIn('preview', response.data[0])
+        self.assertEqual(self.client.get('/api/v1/notes/semantic_search/').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_similar_excludes_the_note(self) -> None:
+        """
+        Similar notes of a note exclude the note itself.
+        """
+        response = self.client.get(f'/api/v1/notes/{self.garden.id}/similar/?limit=1')
+        self.assertEqual([note['id'] for note in response.data], [self.tomatoes.id])
+
+    def test_changes_refresh_embeddings_after_commit(self) -> None:
+        """
+        Creating and updating notes re-embeds them once the transaction commits.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/notes/', {'title': 'Budget', 'content': 'tax budget'}, format='json')
+        note_id = response.data['id']
+        self.assertTrue(NoteEmbedding.objects.filter(note_id=note_id).exists())
+
+        before = NoteEmbedding.objects.get(note=self.taxes).vector
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/v1/notes/{self.taxes.id}/', {'content': 'garden party'}, format='json')
+        self.assertNotEqual(bytes(NoteEmbedding.objects.get(note=self.taxes).vector), bytes(before))
+
+    def test_refresh_only_embeds_stale_notes(self) -> None:
+        """
+        Up-to-date embeddings are skipped; a different embedder makes every vector stale.
+        """
+        self.assertEqual(embeddings.refresh_embeddings(self.user.id), 0)
+        Note.objects.filter(id=self.garden.id).update(updated_at=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(embeddings.refresh_embeddings(self.user.id), 1)
+        with override_settings(NOTES_EMBEDDING_DIMENSIONS=64):
+            self.assertEqual(embeddings.refresh_embeddings(self.user.id, batch_size=2), 3)
+            self.assertEqual(len(NoteEmbedding.objects.get(note=self.garden).vector), 64)
+
+    def test_index_follows_embedding_changes(self) -> None:
+        """
+        The cached index merges new and re-embedded rows and is rebuilt after deletions.
+        """
+        name = embeddings.get_embedder().name
+        first = embeddings.get_index(self.user.id, name)
+        self.assertIs(embeddings.get_index(self.user.id, name), first)
+
+        added = Note.objects.create(user=self.user, title='Seeds', content='order tomato seeds')
+        Note.objects.filter(id=self.garden.id).update(title='Yard', updated_at=timezone.now() + timedelta(seconds=1))
+        embeddings.refresh_embeddings(self.user.id)
+        merged = embeddings.get_index(self.user.id, name)
+        self.assertEqual(list(merged.ids), [self.garden.id, self.taxes.id, self.tomatoes.id, added.id])
+        fresh = embeddings.VectorIndex.load(NoteEmbedding.objects.filter(user=self.user))
+        self.assertTrue((merged.matrix == fresh.matrix).all())
+
+        self.taxes.delete()
+        self.assertEqual(len(embeddings.get_index(self.user.id, name)), 3)
+
+    @override_settings(NOTES_EMBEDDER='openai')
+    @patch.dict(os.environ, {'NEXT_PUBLIC_OPENAI_API_KEY': 'dummy_key'}, clear=True)
+    @patch('openai.Embedding.create')
+    def test_openai_embedder(self, mock_create: MagicMock) -> None:
+        """
+        The OpenAI embedder sends note texts in batches and normalizes the result.
+        """
+        mock_create.side_effect = lambda model, input: {
+            'data': [{'index': i, 'embedding': [float(i + 1), 1.0, 0.0]} for i in range(len(input))]
+        }
+        call_command('embed_notes', batch_size=2, stdout=io.StringIO())
+        self.assertEqual(mock_create.call_count, 2)
+        self.assertEqual(NoteEmbedding.objects.filter(embedder='openai-text-embedding-ada-002').count(), 3)
+
+
+class BatchTests(APITestCase):
+    """
+    Tests for the batch endpoint and client-generated ids.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token and one category.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123', first_name='Ann')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.category = Category.objects.create(user=self.user, name='School')
+
+    def batch(self, *operations):
+        """
+        Posts a batch of (method, path[, body]) operations.
+        """
+        return self.client.post('/api/v1/batch/', {'operations': [
+            {'method': method, 'path': path, **({'body': rest[0]} if rest else {})}
+            for method, path, *rest in operations
+        ]}, format='json')
+
+    def test_dashboard_load_in_one_request(self) -> None:
+        """
+        Reads of notes, categories and the profile come back in order.
+        """
+        Note.objects.create(user=self.user, title='A', content='a')
+        response = self.batch(('GET', '/api/v1/notes/?view=preview'), ('GET', '/api/v1/categories/'),
+                              ('GET', '/api/v1/profile/'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        notes, categories, profile = response.data['results']
+        self.assertEqual([r['status'] for r in response.data['results']], [200, 200, 200])
+        self.assertEqual(notes['body'][0]['preview'], 'a')
+        self.assertEqual(categories['body'][0]['name'], 'School')
+        self.assertEqual(profile['body']['first_name'], 'Ann')
+
+    def test_writes_with_client_ids(self) -> None:
+        """
+        Later operations can address objects created earlier in the batch by client id.
+        """
+        response = self.batch(
+            ('POST', '/api/v1/categories/', {'name': 'Work', 'client_id': 'c-1'}),
+            ('POST', '/api/v1/notes/', {'title': 'Draft', 'client_id': 'n-1'}),
+            ('PATCH', '/api/v1/notes/client:n-1/', {'content': 'written offline'}),
+            ('DELETE', f'/api/v1/categories/{self.category.id}/'),
+        )
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 201, 200, 204])
+        note = Note.objects.get(user=self.user, client_id='n-1')
+        self.assertEqual(note.content, 'written offline')
+        self.assertEqual(list(Category.objects.values_list('client_id', flat=True)), ['c-1'])
+
+    def test_replay_is_idempotent(self) -> None:
+        """
+        Replaying a committed batch creates nothing new; deletes of gone objects are accepted.
+        """
+        note = Note.objects.create(user=self.user, title='Old')
+        operations = [
+            ('POST', '/api/v1/notes/', {'title': 'Draft', 'client_id': 'n-1'}),
+            ('DELETE', f'/api/v1/notes/{note.id}/'),
+        ]
+        first = self.batch(*operations)
+        second = self.batch(*operations)
+        self.assertEqual([r['status'] for r in first.data['results']], [201, 204])
+        self.assertEqual([r['status'] for r in second.data['results']], [200, 404])
+        self.assertEqual(second.data['results'][0]['body']['id'], first.data['results'][0]['body']['id'])
+        self.assertEqual(list(Note.objects.values_list('title', flat=True)), ['Draft'])
+
+    def test_failure_rolls_back_the_batch(self) -> None:
+        """
+        A failing operation undoes the earlier ones and reports its index and status.
+        """
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.batch(
+                ('POST', '/api/v1/notes/', {'title': 'Kept?'}),
+                ('PATCH', '/api/v1/notes/999999/', {'title': 'Missing'}),
+            )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertFalse(Note.objects.exists())
+        self.assertEqual(callbacks, [])
+
+    def test_rejects_other_paths_and_bad_input(self) -> None:
+        """
+        Only note, category and profile routes can be batched.
+        """
+        self.assertEqual(self.batch(('POST', '/api/v1/logout/')).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.batch(('GET', '/api/v1/batch/')).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.batch(('TRACE', '/api/v1/notes/')).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post('/api/v1/batch/', {}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Token.objects.filter(user=self.user).exists())
+
+    def test_client_id_cannot_change(self) -> None:
+        """
+        A client id is set on creation only.
+        """
+        note_id = self.client.post('/api/v1/notes/', {'title': 'A', 'client_id': 'n-1'}, format='json').data['id']
+        response = self.client.patch(f'/api/v1/notes/{note_id}/', {'client_id': 'n-2'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/v1/notes/client:n-1/').data['id'], note_id)
+
+
+class IdempotencyTests(APITestCase):
+    """
+    Tests for Idempotency-Key handling on create endpoints and populate_llm.
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+    def create_note(self, key: str, title: str = 'A'):
+        """
+        Posts a note with an Idempotency-Key.
+        """
+        return self.client.post('/api/v1/notes/', {'title': title}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_original_response(self) -> None:
+        """
+        Repeating a create with the same key returns the stored response without a second note.
+        """
+        first = self.create_note('k-1')
+        second = self.create_note('k-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+        self.assertEqual(Note.objects.count(), 1)
+        self.assertEqual(self.create_note('k-2').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Note.objects.count(), 2)
+
+    def test_key_reused_for_other_request(self) -> None:
+        """
+        A key sent with a different body is rejected; keys are scoped per user.
+        """
+        self.create_note('k-1')
+        self.assertEqual(self.create_note('k-1', title='B').status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        other = User.objects.create_user(username='other@example.com', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=other).key)
+        self.assertEqual(self.create_note('k-1', title='B').status_code, status.HTTP_201_CREATED)
+
+    def test_expired_and_abandoned_keys_run_again(self) -> None:
+        """
+        After the TTL, or when the first request never answered, the key is claimed anew.
+        """
+        self.create_note('k-1')
+        IdempotencyRecord.objects.update(expires_at=timezone.now())
+        self.assertFalse(self.create_note('k-1').has_header('Idempotent-Replayed'))
+        self.assertEqual(Note.objects.count(), 2)
+
+        IdempotencyRecord.objects.update(response_status=None, created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.create_note('k-1').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Note.objects.count(), 3)
+
+    def test_concurrent_duplicate_waits_for_result(self) -> None:
+        """
+        A duplicate arriving while the original is in flight returns its result once stored.
+        """
+        first = self.create_note('k-1')
+        record = IdempotencyRecord.objects.get()
+        stored = (record.response_status, record.response_body)
+        IdempotencyRecord.objects.update(response_status=None, response_body='')
+
+        def original_finishes(seconds: float) -> None:
+            """
+            Stands in for the in-flight request completing while the duplicate sleeps.
+            """
+            IdempotencyRecord.objects.update(response_status=stored[0], response_body=stored[1])
+
+        with patch('notes.idempotency.time.sleep', side_effect=original_finishes) as sleep:
+            second = self.create_note('k-1')
+        sleep.assert_called_once()
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Note.objects.count(), 1)
+
+    @override_settings(NOTES_IDEMPOTENCY_WAIT_TIMEOUT=0)
+    def test_in_flight_duplicate_times_out(self) -> None:
+        """
+        A duplicate that cannot wait long enough gets 409 with Retry-After.
+        """
+        IdempotencyRecord.objects.create(
+            user=self.user,
+            key='k-1',
+            fingerprint='',
+            expires_at=timezone.now() + timedelta(hours=1)
+        )
+        response = self.client.post('/api/v1/categories/', {'name': 'School'}, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='k-1')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        IdempotencyRecord.objects.update(fingerprint=idempotency.request_fingerprint(
+            MagicMock(method='POST', path='/api/v1/categories/', META={}, data={'name': 'School'})
+        ))
+        response = self.client.post('/api/v1/categories/', {'name': 'School'}, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='k-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(Category.objects.exists())
+
+    @patch.dict(os.environ, {'NEXT_PUBLIC_OPENAI_API_KEY': 'dummy_key'}, clear=True)
+    @patch('openai.ChatCompletion.create')
+    def test_populate_llm_is_not_repeated(self, mock_create: MagicMock) -> None:
+        """
+        A retried generation returns the first result without calling OpenAI again.
+        """
+        Category.objects.create(user=self.user, name='School')
+        mock_create.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content=json.dumps([
+            {'title': 'T', 'content': 'C'}
+        ])))])
+        for _ in range(2):
+            response = self.client.post('/api/v1/populate_llm/', {'subject': 'AI'}, format='json',
+                                        HTTP_IDEMPOTENCY_KEY='gen-1')
+            self.assertEqual(response.data['count'], 1)
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertEqual(Note.objects.count(), 1)
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_server_errors_are_not_stored(self) -> None:
+        """
+        A 5xx response releases the key so the request can be retried.
+        """
+        response = self.client.post('/api/v1/populate_llm/', {'subject': 'AI'}, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='gen-1')
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_batch_operations_ignore_the_key(self) -> None:
+        """
+        The batch's key is not passed on, so its creates do not replay each other.
+        """
+        response = self.client.post('/api/v1/batch/', {'operations': [
+            {'method': 'POST', 'path': '/api/v1/notes/', 'body': {'title': 'A'}},
+            {'method': 'POST', 'path': '/api/v1/notes/', 'body': {'title': 'A'}},
+        ]}, format='json', HTTP_IDEMPOTENCY_KEY='b-1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Note.objects.count(), 2)
+
+    def test_purge_expired(self) -> None:
+        """
+        The purge command removes expired records only.
+        """
+        self.create_note('k-1')
+        self.create_note('k-2')
+        IdempotencyRecord.objects.filter(key='k-1').update(expires_at=timezone.now())
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertEqual(list(IdempotencyRecord.objects.values_list('key', flat=True)), ['k-2'])
+
+
+class ProfilingTests(APITestCase):
+    """
+    Tests for on-demand request profiling and the profile ring.
+    """
+
+    def setUp(self) -> None:
+        """
+        Points the profile ring at a temporary directory and creates a staff and a regular user.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        ring = override_settings(NOTES_PROFILING_DIR=directory.name)
+        ring.enable()
+        self.addCleanup(ring.disable)
+        self.staff = User.objects.create_user(username='staff@example.com', password='password123', is_staff=True)
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.staff_token = Token.objects.create(user=self.staff).key
+        self.user_token = Token.objects.create(user=self.user).key
+
+    def get(self, path: str, token: str, **headers):
+        """
+        Sends an authenticated GET.
+        """
+        return self.client.get(path, HTTP_AUTHORIZATION='Token ' + token, **headers)
+
+    def test_staff_cprofile(self) -> None:
+        """
+        A staff request with X-Profile: cprofile is stored with a summary and downloadable as pstats.
+        """
+        Note.objects.create(user=self.staff, title='A', content='a')
+        response = self.get('/api/v1/notes/', self.staff_token, HTTP_X_PROFILE='cprofile')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profile_id = response['X-Profile-Id']
+
+        [summary] = self.get('/api/v1/profiling/', self.staff_token).data
+        self.assertEqual(summary['id'], profile_id)
+        self.assertEqual(
+            (summary['mode'], summary['trigger'], summary['path']),
+            ('cprofile', 'header', '/api/v1/notes/')
+        )
+        self.assertGreater(summary['sql_count'], 0)
+        self.assertIn('orm', summary['layers_ms'])
+
+        download = self.get(f'/api/v1/profiling/{profile_id}/', self.staff_token)
+        self.assertIn('attachment', download['Content-Disposition'])
+        with tempfile.NamedTemporaryFile(suffix='.pstats') as fh:
+            fh.write(b''.join(download.streaming_content))
+            fh.flush()
+            self.assertTrue(pstats.Stats(fh.name).total_calls)
+
+    @override_settings(NOTES_PROFILING_INTERVAL=0.0005)
+    def test_sampling_speedscope(self) -> None:
+        """
+        The sampling profiler stores a speedscope 'sampled' profile.
+        """
+        profile_id = self.get('/api/v1/categories/', self.staff_token, HTTP_X_PROFILE='sampling')['X-Profile-Id']
+        download = self.get(f'/api/v1/profiling/{profile_id}/', self.staff_token)
+        data = json.loads(b''.join(download.streaming_content))
+        profile = data['profiles'][0]
+        self.assertEqual(profile['type'], 'sampled')
+        self.assertEqual(len(profile['samples']), len(profile['weights']))
+        self.assertTrue(all(index < len(data['shared']['frames']) for stack in profile['samples'] for index in stack))
+
+    def test_header_ignored_for_other_users(self) -> None:
+        """
+        Only staff can ask for a profile, list or download them.
+        """
+        response = self.get('/api/v1/notes/', self.user_token, HTTP_X_PROFILE='cprofile')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(self.get('/api/v1/profiling/', self.user_token).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.get('/api/v1/profiling/', self.staff_token).data, [])
+
+    @override_settings(NOTES_PROFILING_SAMPLE_RATE=1.0, NOTES_PROFILING_MAX_FILES=2)
+    def test_sampled_requests_and_ring_size(self) -> None:
+        """
+        Sampled requests are profiled without exposing the id, and only the newest profiles are kept.
+        """
+        for _ in range(3):
+            self.assertFalse(self.get('/api/v1/notes/', self.user_token).has_header('X-Profile-Id'))
+        with override_settings(NOTES_PROFILING_SAMPLE_RATE=0):
+            profiles = self.get('/api/v1/profiling/', self.staff_token).data
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual({profile['trigger'] for profile in profiles}, {'sample'})
+        self.assertEqual(len(os.listdir(settings.NOTES_PROFILING_DIR)), 4)
+
+    def test_download_unknown_profile(self) -> None:
+        """
+        Ids that are not in the ring, or not ids at all, are 404.
+        """
+        self.assertEqual(self.get('/api/v1/profiling/0000000000000-00000000/', self.staff_token).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.get('/api/v1/profiling/..%2Fsecret/', self.staff_token).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(NOTES_SHARDS=['default', 'shard_1'])
+class ShardingTests(APITestCase):
+    """
+    Tests for user-id sharding over two local SQLite databases.
+    """
+    databases = {'default', 'shard_1'}
+
+    def setUp(self) -> None:
+        """
+        Gives the second shard its id range and starts from an empty shard map cache.
+        """
+        sharding.prepare_shard('shard_1')
+        sharding.forget()
+        self.addCleanup(sharding.forget)
+
+    def make_user(self, username: str, shard: str) -> User:
+        """
+        Creates a user placed on the given shard.
+        """
+        with patch('notes.sharding.placement', return_value=shard):
+            return User.objects.create_user(username=username, password='password123')
+
+    def login(self, user: User) -> None:
+        """
+        Authenticates the client with a token created in the user's shard.
+        """
+        with sharding.for_user(user.id):
+            token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_user_data_lives_in_its_shard(self) -> None:
+        """
+        A registered user's categories, token and notes are written to its shard only,
+        with ids from the shard's range.
+        """
+        with patch('notes.sharding.placement', return_value='shard_1'):
+            response = self.client.post(
+                '/api/v1/register/',
+                {'username': 'test@example.com', 'password': 'password123'},
+                format='json'
+            )
+        user_id = response.data['user']['id']
+        self.assertEqual(ShardAssignment.objects.get(user_id=user_id).shard, 'shard_1')
+        self.assertEqual(Category.objects.using('shard_1').filter(user_id=user_id).count(), 3)
+        self.assertFalse(Category.objects.using('default').filter(user_id=user_id).exists())
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + response.data['token'])
+        created = self.client.post('/api/v1/notes/', {'title': 'Sharded'}, format='json')
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertGreater(created.data['id'], settings.NOTES_SHARD_ID_SPACING)
+        self.assertTrue(Note.objects.using('shard_1').filter(id=created.data['id']).exists())
+        self.assertFalse(Note.objects.using('default').exists())
+        self.assertEqual([note['title'] for note in self.client.get('/api/v1/notes/').data], ['Sharded'])
+
+    def test_users_on_different_shards_are_isolated(self) -> None:
+        """
+        Each user only sees the notes in its own shard.
+        """
+        alice = self.make_user('alice@example.com', 'default')
+        bob = self.make_user('bob@example.com', 'shard_1')
+        with sharding.for_user(alice.id):
+            alice_note = Note.objects.create(user=alice, title='Alice')
+        with sharding.for_user(bob.id):
+            Note.objects.create(user=bob, title='Bob')
+
+        self.login(bob)
+        self.assertEqual([note['title'] for note in self.client.get('/api/v1/notes/').data], ['Bob'])
+        self.assertEqual(self.client.get(f'/api/v1/notes/{alice_note.id}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.login(alice)
+        self.assertEqual([note['title'] for note in self.client.get('/api/v1/notes/').data], ['Alice'])
+
+    def test_move_user_keeps_ids_and_timestamps(self) -> None:
+        """
+        Moving a user copies all of its rows with their ids and timestamps, deletes
+        them from the old shard, and the user's token keeps working.
+        """
+        user = self.make_user('test@example.com', 'default')
+        self.login(user)
+        note_id = self.client.post('/api/v1/notes/', {'title': 'Moving', 'content': 'v1'}, format='json').data['id']
+        self.client.patch(f'/api/v1/notes/{note_id}/', {'content': 'v2'}, format='json')
+        before = Note.objects.using('default').values('id', 'created_at', 'updated_at').get()
+        revisions = NoteRevision.objects.using('default').filter(note_id=note_id).count()
+
+        copied = sharding.move_user(user.id, 'shard_1')
+
+        self.assertEqual(copied['notes.Note'], 1)
+        self.assertEqual(copied['authtoken.Token'], 1)
+        self.assertEqual(Note.objects.using('shard_1').values('id', 'created_at', 'updated_at').get(), before)
+        self.assertEqual(NoteRevision.objects.using('shard_1').filter(note_id=note_id).count(), revisions)
+        self.assertFalse(Note.objects.using('default').exists())
+        self.assertFalse(Token.objects.using('default').exists())
+        self.assertEqual(ShardAssignment.objects.get(user=user).shard, 'shard_1')
+        self.assertTrue(User.objects.using('default').filter(pk=user.pk).exists())
+
+        response = self.client.patch(f'/api/v1/notes/{note_id}/', {'content': 'v3'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Note.objects.using('shard_1').get(id=note_id).content, 'v3')
+
+    def test_ids_stay_in_range_after_move(self) -> None:
+        """
+        Rows moved down from a shard with a higher range do not make the target hand out that shard's ids.
+        """
+        mover = self.make_user('mover@example.com', 'shard_1')
+        stayer = self.make_user('stayer@example.com', 'default')
+        other = self.make_user('other@example.com', 'shard_1')
+        with sharding.for_user(mover.id):
+            moved = Note.objects.create(user=mover, title='Moved')
+        sharding.move_user(mover.id, 'default')
+
+        with sharding.for_user(stayer.id):
+            on_default = Note.objects.create(user=stayer, title='Default')
+            Note.objects.bulk_create([Note(user=stayer, title='Bulk')])
+        with sharding.for_user(other.id):
+            on_shard = Note.objects.create(user=other, title='Shard')
+
+        default_ids = set(Note.objects.using('default').values_list('id', flat=True))
+        self.assertEqual(len(default_ids), 3)
+        self.assertIn(moved.id, default_ids)
+        self.assertTrue(all(note_id < settings.NOTES_SHARD_ID_SPACING for note_id in default_ids - {moved.id}))
+        self.assertGreater(on_shard.id, moved.id)
+        self.assertNotIn(on_shard.id, default_ids)
+        self.assertLess(on_default.id, settings.NOTES_SHARD_ID_SPACING)
+
+    def test_writes_refused_while_moving(self) -> None:
+        """
+        While a user is being moved reads are served and writes get 503 with Retry-After.
+        """
+        user = self.make_user('test@example.com', 'shard_1')
+        self.login(user)
+        ShardAssignment.objects.filter(user=user).update(state=ShardAssignment.STATE_MOVING)
+
+        self.assertEqual(self.client.get('/api/v1/notes/').status_code, status.HTTP_200_OK)
+        response = self.client.post('/api/v1/notes/', {'title': 'Blocked'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], str(sharding.MOVE_RETRY_AFTER))
+        self.assertFalse(Note.objects.using('shard_1').exists())
+
+    def test_jobs_leave_moving_users_alone(self) -> None:
+        """
+        While a user is being moved, code writing for it is refused and archival skips its notes.
+        """
+        user = self.make_user('test@example.com', 'shard_1')
+        with sharding.for_user(user.id):
+            note = Note.objects.create(user=user, title='Cold')
+        ShardAssignment.objects.filter(user=user).update(state=ShardAssignment.STATE_MOVING)
+
+        with sharding.for_user(user.id):
+            with self.assertRaises(sharding.ShardMoving):
+                sharding.atomic()
+        with sharding.use_shard('shard_1'):
+            self.assertEqual(archival.archive_notes(cutoff=timezone.now() + timedelta(days=1)), 0)
+        self.assertTrue(Note.objects.using('shard_1').filter(id=note.id).exists())
+
+    def test_move_called_off_when_source_written(self) -> None:
+        """
+        A write reaching the old shard between the copy and the flip calls the move off, losing nothing.
+        """
+        user = self.make_user('test@example.com', 'default')
+        with sharding.for_user(user.id):
+            Note.objects.create(user=user, title='Before')
+        copy_rows = sharding._copy_rows
+
+        def copy_then_write(model, *args):
+            copied = copy_rows(model, *args)
+            if model is Note:
+                # A writer that did not check the moving state.
+                Note.objects.using('default').create(user=user, title='During')
+            return copied
+
+        with patch('notes.sharding._copy_rows', side_effect=copy_then_write):
+            with self.assertRaises(sharding.ShardingError):
+                sharding.move_user(user.id, 'shard_1')
+
+        self.assertEqual(ShardAssignment.objects.filter(user=user).values_list('shard', 'state').get(),
+                         ('default', ShardAssignment.STATE_ACTIVE))
+        self.assertEqual(sorted(Note.objects.using('default').values_list('title', flat=True)), ['Before', 'During'])
+        self.assertFalse(Note.objects.using('shard_1').exists())
+
+    def test_rebalance_command(self) -> None:
+        """
+        The rebalance command plans, and with --apply carries out, moves evening out the shards.
+        """
+        users = [self.make_user(f'user{index}@example.com', 'default') for index in range(2)]
+        for user in users:
+            with sharding.for_user(user.id):
+                Note.objects.bulk_create(Note(user=user, title=f'Note {index}') for index in range(4))
+
+        out = io.StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('1 moves planned', out.getvalue())
+        self.assertEqual(Note.objects.using('shard_1').count(), 0)
+
+        call_command('rebalance_shards', '--apply', stdout=io.StringIO())
+        self.assertEqual(Note.objects.using('default').count(), 4)
+        self.assertEqual(Note.objects.using('shard_1').count(), 4)
+        self.assertEqual(ShardAssignment.objects.filter(shard='shard_1').count(), 1)
+
+    @override_settings(NOTES_BACKGROUND_EAGER=True)
+    def test_deferred_user_deletion_runs_on_users_shard(self) -> None:
+        """
+        A deferred deletion scheduled with another shard active (e.g. from the admin)
+        records its job and task and deletes the notes in batches on the user's shard.
+        """
+        user = self.make_user('test@example.com', 'shard_1')
+        with sharding.for_user(user.id):
+            Note.objects.bulk_create(Note(user=user, title=f'N{index}') for index in range(3))
+
+        with sharding.use_shard('default'):
+            job = schedule_user_deletion(user)
+        self.assertEqual(Task.objects.using('shard_1').get().owner_id, user.id)
+        while tasks.run_next('w1'):
+            pass
+
+        job = DeletionJob.objects.using('shard_1').get(id=job.id)
+        self.assertEqual((job.status, job.total, job.processed), (DeletionJob.STATUS_DONE, 3, 3))
+        self.assertFalse(DeletionJob.objects.using('default').exists())
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
+        self.assertFalse(Note.objects.using('shard_1').exists())
+
+    def test_deleting_user_removes_shard_rows(self) -> None:
+        """
+        Deleting a user deletes its mirror, and with it its data, in its shard.
+        """
+        user = self.make_user('test@example.com', 'shard_1')
+        with sharding.for_user(user.id):
+            Note.objects.create(user=user, title='Gone')
+        self.assertTrue(User.objects.using('shard_1').filter(pk=user.pk).exists())
+
+        user.delete()
+        self.assertFalse(User.objects.using('shard_1').filter(pk=user.pk).exists())
+        self.assertFalse(Note.objects.using('shard_1').exists())
+
+
+@override_settings(NOTES_AUTOSAVE_INTERVAL=60)
+class AutosaveTests(APITestCase):
+    """
+    Tests for coalescing of rapid note edits (notes/autosave.py).
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token and a note just written; the flusher thread is not started.
+        """
+        caches[settings.NOTES_AUTOSAVE_CACHE].clear()
+        patcher = patch('notes.autosave._start_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(autosave._pending.clear)
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.note_id = self.client.post('/api/v1/notes/', {'title': 'T', 'content': 'v1'}, format='json').data['id']
+
+    def edit(self, **data):
+        """
+        Patches the note.
+        """
+        return self.client.patch(f'/api/v1/notes/{self.note_id}/', data, format='json')
+
+    def test_burst_is_buffered_and_read_back(self) -> None:
+        """
+        Edits right after a write are buffered, reads see them, and they are written
+        once, with one revision, when due.
+        """
+        self.edit(content='v2')
+        last = self.edit(content='v3')
+        self.assertEqual(last.status_code, status.HTTP_200_OK)
+        self.assertEqual(last.data['content'], 'v3')
+        self.assertEqual(Note.objects.get(id=self.note_id).content, 'v1')
+        self.assertEqual(self.client.get(f'/api/v1/notes/{self.note_id}/').data['content'], 'v3')
+        self.assertEqual(self.client.get('/api/v1/notes/').data[0]['content'], 'v3')
+        self.assertEqual(self.client.get('/api/v1/notes/?view=preview').data[0]['preview'], 'v3')
+
+        self.assertEqual(autosave.flush_due(), 0)
+        self.assertEqual(autosave.flush_due(timezone.now() + timedelta(seconds=61)), 1)
+        note = Note.objects.get(id=self.note_id)
+        self.assertEqual(note.content, 'v3')
+        self.assertEqual(note.updated_at.isoformat().replace('+00:00', 'Z'), last.data['updated_at'])
+        self.assertEqual(list(note.revisions.order_by('number').values_list('content_length', flat=True)), [2, 2])
+        self.assertEqual(rebuild_content(note, 1), 'v1')
+
+    def test_buffered_patch_racing_another_edit_conflicts(self) -> None:
+        """
+        A content patch is only buffered over the version it was checked against: an edit
+        buffered meanwhile (another tab) makes it 409 instead of being overwritten by it.
+        """
+        def other_edit(*args):
+            self.edit(content='v1 other tab')
+            return apply_delta(*args)
+
+        with patch('notes.serializers.apply_delta', side_effect=other_edit):
+            response = self.edit(content_patch=[2, ' patched'], base_content_hash=content_hash('v1'))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.get(f'/api/v1/notes/{self.note_id}/').data['content'], 'v1 other tab')
+
+    def test_edit_after_interval_is_written(self) -> None:
+        """
+        An edit of a note not written within the interval goes straight to the database.
+        """
+        Note.objects.filter(id=self.note_id).update(updated_at=timezone.now() - timedelta(seconds=120))
+        self.edit(content='v2')
+        self.assertEqual(Note.objects.get(id=self.note_id).content, 'v2')
+        self.assertEqual(autosave.flush_all(), 0)
+
+    def test_category_change_writes_buffered_edits(self) -> None:
+        """
+        Edits of other fields are written at once, together with the buffered ones.
+        """
+        category = Category.objects.create(user=self.user, name='Work')
+        self.edit(title='Buffered')
+        self.assertEqual(Note.objects.get(id=self.note_id).title, 'T')
+
+        self.edit(category_id=category.id)
+        note = Note.objects.get(id=self.note_id)
+        self.assertEqual((note.title, note.category_id), ('Buffered', category.id))
+        self.assertEqual(autosave.flush_all(), 0)
+
+    def test_shutdown_flush_and_delete(self) -> None:
+        """
+        flush_all() writes everything buffered; deleting a note drops its buffer.
+        """
+        self.edit(title='Kept')
+        self.assertEqual(autosave.flush_all(), 1)
+        self.assertEqual(Note.objects.get(id=self.note_id).title, 'Kept')
+
+        self.edit(title='Lost')
+        self.client.delete(f'/api/v1/notes/{self.note_id}/')
+        self.assertEqual(autosave.flush_all(), 0)
+        self.assertFalse(Note.objects.filter(id=self.note_id).exists())
+
+
+    def test_flush_never_overwrites_a_later_write(self) -> None:
+        """
+        A buffer older than the note's row (e.g. written by another process) is dropped, not written.
+        """
+        self.edit(content='buffered')
+        Note.objects.filter(id=self.note_id).update(content='newer', updated_at=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(autosave.flush_all(), 0)
+        self.assertEqual(Note.objects.get(id=self.note_id).content, 'newer')
+
+    def test_lock_held_elsewhere_is_not_taken(self) -> None:
+        """
+        A buffer locked by another process past the wait raises BufferBusy and leaves that lock alone.
+        """
+        key = f'notes:autosave-lock:{self.note_id}'
+        caches[settings.NOTES_AUTOSAVE_CACHE].set(key, 'other', timeout=60)
+        with patch('notes.autosave.LOCK_WAIT', 0):
+            response = self.edit(content='v2')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(caches[settings.NOTES_AUTOSAVE_CACHE].get(key), 'other')
+
+    def test_check_refuses_process_local_cache(self) -> None:
+        """
+        Coalescing on a process-local cache is a system check error; on a shared one it is not.
+        """
+        self.assertEqual([error.id for error in check_autosave_cache()], ['notes.E001'])
+        shared = {**settings.CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with self.settings(CACHES=shared, NOTES_AUTOSAVE_CACHE='shared'):
+            self.assertEqual(check_autosave_cache(), [])
+
+
+class DashboardTests(APITestCase):
+    """
+    Tests for the precomputed dashboard summary (notes/dashboard.py).
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token, a category and a note in it.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.category = Category.objects.create(user=self.user, name='School', color='#ff0000')
+        Note.objects.create(user=self.user, category=self.category, title='First', content='one')
+
+    def counts(self) -> tuple:
+        """
+        Returns the category counts, the uncategorized count and the total from the dashboard.
+        """
+        data = self.client.get('/api/v1/dashboard/').data
+        categories = {entry['name']: entry['note_count'] for entry in data['categories']}
+        return categories, data['uncategorized_count'], data['note_count']
+
+    def test_summary_is_built_on_first_load(self) -> None:
+        """
+        The first load computes the summary from the notes and returns it with the profile.
+        """
+        response = self.client.get('/api/v1/dashboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['profile']['username'], 'test@example.com')
+        self.assertEqual(response.data['categories'][0]['color'], '#ff0000')
+        self.assertEqual(self.counts(), ({'School': 1}, 0, 1))
+        self.assertEqual([item['title'] for item in response.data['recent_notes']], ['First'])
+        self.assertTrue(DashboardSummary.objects.filter(user=self.user).exists())
+
+    def test_note_writes_update_counts(self) -> None:
+        """
+        Creating, recategorizing and deleting notes updates the summary in place.
+        """
+        self.counts()
+        note_id = self.client.post('/api/v1/notes/', {'title': 'Second', 'content': 'two'}, format='json').data['id']
+        self.assertEqual(self.counts(), ({'School': 1}, 1, 2))
+
+        self.client.patch(f'/api/v1/notes/{note_id}/', {'category_id': self.category.id}, format='json')
+        self.assertEqual(self.counts(), ({'School': 2}, 0, 2))
+        recent = self.client.get('/api/v1/dashboard/').data['recent_notes']
+        self.assertEqual([item['title'] for item in recent], ['Second', 'First'])
+
+        self.client.delete(f'/api/v1/notes/{note_id}/')
+        self.assertEqual(self.counts(), ({'School': 1}, 0, 1))
+        recent = self.client.get('/api/v1/dashboard/').data['recent_notes']
+        self.assertEqual([item['title'] for item in recent], ['First'])
+
+    def test_category_writes_update_summary(self) -> None:
+        """
+        New and renamed categories are listed; a deleted category's notes count as uncategorized.
+        """
+        self.counts()
+        self.client.post('/api/v1/categories/', {'name': 'Work', 'color': '#00ff00'}, format='json')
+        self.client.patch(f'/api/v1/categories/{self.category.id}/', {'name': 'College'}, format='json')
+        self.assertEqual(self.counts(), ({'College': 1, 'Work': 0}, 0, 1))
+
+        self.client.delete(f'/api/v1/categories/{self.category.id}/')
+        self.assertEqual(self.counts(), ({'Work': 0}, 1, 1))
+
+    def test_load_is_one_lookup_and_rebuild_matches(self) -> None:
+        """
+        A warm load reads only the summary row, and rebuild_dashboards recomputes the same summary.
+        """
+        self.client.post('/api/v1/notes/', {'title': 'Second', 'content': 'two'}, format='json')
+        self.client.get('/api/v1/dashboard/')
+        with CaptureQueriesContext(connection) as queries:
+            before = self.client.get('/api/v1/dashboard/').data
+        self.assertEqual(len([q for q in queries if 'notes_dashboardsummary' in q['sql']]), 1)
+        self.assertEqual(len([q for q in queries if 'notes_note' in q['sql']]), 0)
+
+        call_command('rebuild_dashboards', stdout=io.StringIO())
+        after = self.client.get('/api/v1/dashboard/').data
+        for key in ('categories', 'uncategorized_count', 'note_count', 'recent_notes'):
+            self.assertEqual(before[key], after[key])
+
+    def test_build_locks_summary_before_counting(self) -> None:
+        """
+        The first build creates and locks the summary row before reading the notes, so the
+        hook of a note written meanwhile updates the summary instead of finding none.
+        """
+        counts = dashboard._counts
+        seen = []
+
+        def racing_counts(user_id):
+            seen.append((connection.in_atomic_block, DashboardSummary.objects.filter(user_id=user_id).exists()))
+            note = Note.objects.create(user=self.user, title='Racing', content='two')
+            dashboard.note_created(note)
+            return counts(user_id)
+
+        with patch.object(dashboard, '_counts', side_effect=racing_counts):
+            self.client.get('/api/v1/dashboard/')
+        self.assertEqual(seen, [(True, True)])
+        self.assertEqual(self.counts(), ({'School': 1}, 1, 2))
+
+
+class TaskQueueTests(TestCase):
+    """
+    Tests for the database-backed task queue (notes/tasks.py).
+    """
+
+    def setUp(self) -> None:
+        """
+        Registers a recording task and a failing one.
+        """
+        self.calls = []
+
+        def fail() -> None:
+            raise RuntimeError('boom')
+
+        patcher = patch.dict(tasks.registry, {
+            'record': tasks.TaskSpec(self.calls.append, 0, None, None),
+            'fail': tasks.TaskSpec(fail, 0, None, None),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_priority_order_and_completion(self) -> None:
+        """
+        Due tasks run highest priority first, then oldest first; finished tasks are deleted.
+        """
+        tasks.enqueue('record', 'low', priority=-1)
+        tasks.enqueue('record', 'first')
+        tasks.enqueue('record', 'urgent', priority=5)
+        tasks.enqueue('record', 'later', delay=60)
+        while tasks.run_next('w1'):
+            pass
+        self.assertEqual(self.calls, ['urgent', 'first', 'low'])
+        self.assertEqual(list(Task.objects.values_list('args', flat=True)), [['later']])
+
+    def test_retries_with_backoff_then_fails(self) -> None:
+        """
+        A failing task is retried after a doubling delay and kept as failed after max_attempts.
+        """
+        queued = tasks.enqueue('fail')
+        for attempt in range(1, 4):
+            self.assertTrue(tasks.run_next('w1'))
+            queued.refresh_from_db()
+            self.assertEqual(queued.attempts, attempt)
+            if attempt < 3:
+                self.assertEqual(queued.status, Task.STATUS_QUEUED)
+                delay = (queued.run_after - timezone.now()).total_seconds()
+                self.assertAlmostEqual(delay, settings.NOTES_TASK_RETRY_DELAY * 2 ** (attempt - 1), delta=1)
+                self.assertFalse(tasks.run_next('w1'))
+                Task.objects.filter(pk=queued.pk).update(run_after=timezone.now())
+        self.assertEqual(queued.status, Task.STATUS_FAILED)
+        self.assertIn('RuntimeError: boom', queued.last_error)
+        self.assertFalse(tasks.run_next('w1'))
+
+    def test_visibility_timeout(self) -> None:
+        """
+        A claimed task is hidden until its claim expires, then claimed again; only the
+        current claim records the outcome, and an expired last attempt fails the task.
+        """
+        queued = tasks.enqueue('record', 'x')
+        first = tasks.claim('w1')
+        self.assertIsNone(tasks.claim('w2'))
+
+        Task.objects.filter(pk=queued.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        second = tasks.claim('w2')
+        self.assertEqual((second.locked_by, second.attempts), ('w2', 2))
+        tasks.run(first)
+        self.assertTrue(Task.objects.filter(pk=queued.pk).exists())
+        tasks.run(second)
+        self.assertFalse(Task.objects.filter(pk=queued.pk).exists())
+
+        abandoned = tasks.enqueue('record', 'y')
+        Task.objects.filter(pk=abandoned.pk).update(status=Task.STATUS_RUNNING, attempts=3,
+                                                    locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(tasks.claim('w1'))
+        abandoned.refresh_from_db()
+        self.assertEqual(abandoned.status, Task.STATUS_FAILED)
+
+    def test_claim_extended_while_task_runs(self) -> None:
+        """
+        The claim of a running task is pushed back every third of its visibility timeout,
+        so it is not claimed again while still running, and no longer once it was reclaimed.
+        """
+        queued = tasks.enqueue('record', 'x')
+        claimed = tasks.claim('w1')
+        Task.objects.filter(pk=queued.pk).update(locked_until=timezone.now())
+        stop = MagicMock(wait=MagicMock(side_effect=[False, True]))
+        tasks._keep_claimed(claimed, stop)
+        stop.wait.assert_called_with(settings.NOTES_TASK_VISIBILITY_TIMEOUT / 3)
+        self.assertIsNone(tasks.claim('w2'))
+        queued.refresh_from_db()
+        self.assertGreater(queued.locked_until, timezone.now() + timedelta(seconds=200))
+
+        Task.objects.filter(pk=queued.pk).update(locked_by='w2', locked_until=timezone.now())
+        tasks._keep_claimed(claimed, MagicMock(wait=MagicMock(side_effect=[False, True])))
+        queued.refresh_from_db()
+        self.assertLess(queued.locked_until, timezone.now())
+
+    def test_deletion_tasks_are_queued_per_job(self) -> None:
+        """
+        Scheduling a deferred deletion queues a task for its job in the same transaction,
+        and the sweep task leaves jobs another runner holds alone.
+        """
+        user = User.objects.create_user(username='test@example.com')
+        category = Category.objects.create(user=user, name='Big')
+        Note.objects.create(user=user, category=category, title='N')
+        job = schedule_category_deletion(category)
+        queued = Task.objects.get()
+        self.assertEqual((queued.name, queued.args, queued.owner_id), ('process_deletion_job', [job.id], user.id))
+
+        Task.objects.all().delete()
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status=DeletionJob.STATUS_RUNNING,
+            locked_by='web',
+            locked_until=timezone.now() + timedelta(minutes=1)
+        )
+        tasks.enqueue('process_deletions')
+        self.assertTrue(tasks.run_next('w1'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (DeletionJob.STATUS_RUNNING, 'web'))
+        self.assertTrue(Category.objects.filter(pk=category.pk).exists())
+
+    def test_run_workers_command(self) -> None:
+        """
+        --enqueue queues a maintenance task before the pool starts; unknown names are rejected.
+        """
+        with patch('notes.tasks.run_pool') as run_pool:
+            call_command('run_workers', '--enqueue', 'purge_idempotency_keys', '--burst', '--processes', '2',
+                         stdout=io.StringIO())
+        run_pool.assert_called_once_with(2, burst=True)
+        self.assertEqual(Task.objects.get().name, 'purge_idempotency_keys')
+        self.assertTrue(tasks.run_next('w1'))
+        self.assertFalse(Task.objects.exists())
+
+        with self.assertRaises(CommandError):
+            call_command('run_workers', '--enqueue', 'nope')
+
+
+class TagTests(APITestCase):
+    """
+    Tests for note tags and tag filters (notes/tagging.py).
+    """
+
+    def setUp(self) -> None:
+        """
+        Creates a user with a token and three tagged notes.
+        """
+        self.user = User.objects.create_user(username='test@example.com', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.ids = {
+            title: self.client.post('/api/v1/notes/', {'title': title, 'tags': tags}, format='json').data['id']
+            for title, tags in (('A', ['Work', '#urgent', 'work ']), ('B', ['work']), ('C', ['home']))
+        }
+
+    def counts(self) -> dict:
+        """
+        Returns the tag counts from the tags endpoint.
+        """
+        return {tag['name']: tag['note_count'] for tag in self.client.get('/api/v1/tags/').data}
+
+    def titles(self, query: str) -> list:
+        """
+        Returns the titles of the notes listed with the query string, sorted.
+        """
+        return sorted(note['title'] for note in self.client.get(f'/api/v1/notes/?{query}').data)
+
+    def test_tags_are_normalized_and_counted(self) -> None:
+        """
+        Tag names are stored lowercase without repeats, and counted per note.
+        """
+        note = self.client.get(f'/api/v1/notes/{self.ids["A"]}/').data
+        self.assertEqual(note['tags'], ['urgent', 'work'])
+        self.assertEqual(self.counts(), {'home': 1, 'urgent': 1, 'work': 2})
+        preview = self.client.get('/api/v1/notes/?view=preview').data
+        self.assertEqual({item['title']: item['tags'] for item in preview}['C'], ['home'])
+
+    def test_counts_follow_edits_deletes_and_archival(self) -> None:
+        """
+        Retagging and deleting notes update the counts; archived notes keep their tags.
+        """
+        response = self.client.patch(f'/api/v1/notes/{self.ids["B"]}/', {'tags': ['home', 'later']}, format='json')
+        self.assertEqual(response.data['tags'], ['home', 'later'])
+        self.assertEqual(self.counts(), {'home': 2, 'later': 1, 'urgent': 1, 'work': 1})
+
+        self.client.delete(f'/api/v1/notes/{self.ids["C"]}/')
+        self.assertEqual(self.counts()['home'], 1)
+
+        Note.objects.filter(id=self.ids['A']).update(updated_at=timezone.now() - timedelta(days=400))
+        call_command('archive_notes', stdout=io.StringIO())
+        self.assertTrue(ArchivedNote.objects.filter(id=self.ids['A']).exists())
+        self.assertEqual(self.titles('tags=urgent'), ['A'])
+        self.client.delete(f'/api/v1/notes/{self.ids["A"]}/')
+        self.assertEqual(self.counts(), {'home': 1, 'later': 1, 'urgent': 0, 'work': 0})
+
+    def test_all_and_any_filters(self) -> None:
+        """
+        ?tags= keeps notes with every tag, ?tags_any= notes with at least one; both combine.
+        """
+        self.assertEqual(self.titles('tags=work'), ['A', 'B'])
+        self.assertEqual(self.titles('tags=work,URGENT'), ['A'])
+        self.assertEqual(self.titles('tags_any=urgent,home'), ['A', 'C'])
+        self.assertEqual(self.titles('tags=work&tags_any=urgent,home'), ['A'])
+        self.assertEqual(self.titles('tags=work,nope'), [])
+        self.assertEqual(self.titles('tags_any=nope,home'), ['C'])
+        self.assertEqual(self.titles('tags_any=nope'), [])
+
+    def test_rename_delete_and_validation(self) -> None:
+        """
+        Tags can be renamed (not onto another tag's name) and deleted; notes carry a limited number.
+        """
+        tags = {tag['name']: tag['id'] for tag in self.client.get('/api/v1/tags/').data}
+        response = self.client.patch(f'/api/v1/tags/{tags["home"]}/', {'name': 'Work'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.patch(f'/api/v1/tags/{tags["home"]}/', {'name': 'House'}, format='json')
+        self.assertEqual(self.titles('tags=house'), ['C'])
+
+        self.client.delete(f'/api/v1/tags/{tags["work"]}/')
+        self.assertEqual(self.client.get(f'/api/v1/notes/{self.ids["A"]}/').data['tags'], ['urgent'])
+        self.assertFalse(Tag.objects.filter(name='work').exists())
+
+        too_many = [f'tag{index}' for index in range(settings.NOTES_MAX_TAGS_PER_NOTE + 1)]
+        response = self.client.post('/api/v1/notes/', {'title': 'D', 'tags': too_many}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,6 +1,7 @@
 """
 ASGI configuration for the turbo_ai project.
 Provides an ASGI application callable.
+Realtime change push (WebSocket /ws/notes/, SSE /api/v1/events/) is served in front of Django.
 """
 
 import os
@@ -9,4 +10,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'turbo_ai.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from notes.realtime import RealtimeRouter  # noqa: E402 (needs the app registry loaded above)
+
+application = RealtimeRouter(django_application)
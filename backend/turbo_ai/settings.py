@@ -4,6 +4,8 @@ Configures installed apps, middleware, database, REST framework, logging, etc.
 """
 
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -13,6 +15,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 env_path = os.path.join(BASE_DIR, '.env')
 load_dotenv(env_path)
 
+TESTING = sys.argv[1:2] == ['test']
+
 SECRET_KEY = 'django-insecure-CHANGE_ME_TO_SOMETHING_SECURE'
 DEBUG = True
 ALLOWED_HOSTS = ['*']
@@ -31,14 +35,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'notes.health.HealthCheckMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'notes.sharding.ShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'notes.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'turbo_ai.urls'
@@ -66,9 +73,23 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections open between requests; re-validated before reuse.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Sharding of user data by user id (see notes/sharding.py). NOTES_SHARDS lists the database
+# aliases holding user data; aliases other than 'default' are SQLite files next to db.sqlite3.
+# Append new shards at the end, ids are allocated by position.
+NOTES_SHARDS = [alias.strip() for alias in os.environ.get('NOTES_SHARDS', 'default').split(',') if alias.strip()]
+# Tests can always spread users over a second shard (see ShardingTests).
+for _alias in sorted(set(NOTES_SHARDS + (['shard_1'] if TESTING else [])) - {'default'}):
+    DATABASES[_alias] = {**DATABASES['default'], 'NAME': os.path.join(BASE_DIR, f'db_{_alias}.sqlite3')}
+DATABASE_ROUTERS = ['notes.sharding.ShardRouter']
+NOTES_SHARD_MAP_CACHE_SECONDS = 0 if TESTING else 5
+NOTES_SHARD_ID_SPACING = 10 ** 12
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -97,16 +118,164 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'notes.sharding.ShardedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'notes.throttling.UserTokenBucketThrottle',
+        'notes.throttling.GlobalTokenBucketThrottle',
+    ],
+}
+
+# Caches. The throttle cache should be shared between pods (e.g. Redis) in production.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'notes-default',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'notes-throttle',
+    },
 }
+# Redis cache shared by every pod, for the caches that go stale when kept per process (the notes list
+# cache, autosave buffers and throttle counters). Needs the redis package; without a URL the list cache
+# and autosave are off by default and throttles count per process.
+NOTES_CACHE_REDIS_URL = os.environ.get('NOTES_CACHE_REDIS_URL', '')
+if NOTES_CACHE_REDIS_URL:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': NOTES_CACHE_REDIS_URL,
+    }
+
+# Rate limiting (token buckets, keyed by the view's throttle_scope) and concurrency limits. Counted in
+# the shared cache with NOTES_CACHE_REDIS_URL, per process otherwise (a system check warns).
+# Disabled for the test suite; throttle tests enable it explicitly.
+NOTES_THROTTLE_ENABLED = os.environ.get('NOTES_THROTTLE_ENABLED', '1') == '1' and not TESTING
+NOTES_THROTTLE_CACHE = 'shared' if NOTES_CACHE_REDIS_URL else 'throttle'
+NOTES_THROTTLE_RATES = {
+    'user': '600/min',
+    'notes': '600/min',
+    'populate_llm': '10/min',
+    'import_notes': '20/hour',
+}
+NOTES_GLOBAL_THROTTLE_RATES = {
+    'global': '20000/min',
+    'populate_llm': '120/min',
+}
+NOTES_CONCURRENCY_LIMITS = {
+    'populate_llm': 4,
+}
+NOTES_CONCURRENCY_SLOT_TIMEOUT = 300
+NOTES_CONCURRENCY_RETRY_AFTER = 5
+
+# Warm-up run in a background thread at startup; /readyz waits for it. A failed attempt is
+# retried after NOTES_WARMUP_RETRY_DELAY seconds times the attempt number.
+NOTES_WARMUP_ON_STARTUP = os.environ.get('NOTES_WARMUP', '1') == '1' and not TESTING
+NOTES_WARMUP_ATTEMPTS = 5
+NOTES_WARMUP_RETRY_DELAY = 2
+NOTES_WARMUP_MODULES = [
+    'notes.views',
+    'notes.serializers',
+    'notes.llm',
+    'rest_framework.authtoken.models',
+]
+
+# Realtime change push: 'local' delivers within this process only; 'redis' fans out across pods.
+NOTES_REALTIME_BROKER = os.environ.get('NOTES_REALTIME_BROKER', 'local')
+NOTES_REALTIME_REDIS_URL = os.environ.get('NOTES_REALTIME_REDIS_URL', 'redis://localhost:6379/0')
+NOTES_REALTIME_QUEUE_SIZE = 100
+NOTES_REALTIME_HEARTBEAT = 25
+
+# Per-user cache of rendered notes list responses (invalidated by version stamp on writes).
+# Stamps are only bumped in the cache of the writing process, so with more than one process the
+# cache must be shared: on by default only with NOTES_CACHE_REDIS_URL (a system check warns otherwise).
+# Disabled for the test suite; cache tests enable it explicitly.
+NOTES_LIST_CACHE_ENABLED = (
+    os.environ.get('NOTES_LIST_CACHE_ENABLED', '1' if NOTES_CACHE_REDIS_URL else '0') == '1' and not TESTING
+)
+NOTES_LIST_CACHE = 'shared' if NOTES_CACHE_REDIS_URL else 'default'
+NOTES_LIST_CACHE_TIMEOUT = 300
+
+# Autosave write coalescing (see notes/autosave.py): title and content edits of a note written less than
+# this many seconds ago are buffered and written once per interval; 0 turns it off. The cache must be
+# shared by every process serving the API, so it needs NOTES_CACHE_REDIS_URL (a system check enforces it).
+# Off for the test suite; autosave tests enable it explicitly.
+NOTES_AUTOSAVE_INTERVAL = 0 if TESTING else float(os.environ.get('NOTES_AUTOSAVE_INTERVAL', '0'))
+NOTES_AUTOSAVE_CACHE = 'shared' if NOTES_CACHE_REDIS_URL else 'default'
 
 # CORS
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Background jobs (run in a thread pool after commit; inline when eager)
+NOTES_BACKGROUND_WORKERS = int(os.environ.get('NOTES_BACKGROUND_WORKERS', '2'))
+NOTES_BACKGROUND_EAGER = False
+
+# Task queue (see notes/tasks.py), run by `python manage.py run_workers`: seconds a claimed task is hidden
+# from other workers (the visibility timeout), attempts before a task fails, delay before the first retry
+# (doubled for every further one) and how often idle workers poll, in seconds
+NOTES_TASK_VISIBILITY_TIMEOUT = 300
+NOTES_TASK_MAX_ATTEMPTS = 3
+NOTES_TASK_RETRY_DELAY = 10
+NOTES_TASK_POLL_INTERVAL = 1.0
+
+# Deferred deletion: categories with more notes than the threshold are deleted in the background.
+# A running job is leased to its runner for NOTES_DELETION_LEASE seconds, renewed after every batch.
+NOTES_DEFERRED_DELETE_THRESHOLD = 1000
+NOTES_DELETION_BATCH_SIZE = 500
+NOTES_DELETION_LEASE = 300
+
+# Note revisions: a full snapshot every N revisions, at most M revisions kept per note
+NOTES_REVISION_SNAPSHOT_INTERVAL = 20
+NOTES_REVISION_RETENTION = 100
+
+# Note content at or above the threshold (bytes) is stored compressed: 'zlib', 'zstd' (needs zstandard) or None
+NOTES_CONTENT_COMPRESSION = os.environ.get('NOTES_CONTENT_COMPRESSION', 'zlib') or None
+NOTES_CONTENT_COMPRESS_THRESHOLD = 4096
+
+# Archival: notes not updated for this many days are moved to the archive table in batches
+NOTES_ARCHIVE_AFTER_DAYS = int(os.environ.get('NOTES_ARCHIVE_AFTER_DAYS', '180'))
+NOTES_ARCHIVE_BATCH_SIZE = 500
+
+# Duplicate detection: minimum estimated word-set similarity (0-1) for a near-duplicate,
+# and the most distinct texts compared within one LSH bucket when clustering
+NOTES_DUPLICATE_MIN_SIMILARITY = 0.7
+NOTES_DUPLICATE_MAX_BUCKET = 500
+
+# Semantic search: 'hashing' (local) or 'openai' embedder; stale vectors are re-embedded in background batches
+NOTES_EMBEDDER = os.environ.get('NOTES_EMBEDDER', 'hashing')
+NOTES_EMBEDDING_DIMENSIONS = 256
+NOTES_EMBEDDING_BATCH_SIZE = 64
+NOTES_OPENAI_EMBEDDING_MODEL = 'text-embedding-ada-002'
+NOTES_SEMANTIC_INDEX_CACHE_SIZE = 32
+
+# Batch endpoint: most operations accepted in one request
+NOTES_BATCH_MAX_OPERATIONS = 50
+
+# Tags (see notes/tagging.py): most tags on one note
+NOTES_MAX_TAGS_PER_NOTE = 20
+
+# Dashboard summary (see notes/dashboard.py): number of recent notes it lists
+NOTES_DASHBOARD_RECENT_NOTES = 10
+
+# Idempotency-Key: how long responses are kept for replays, how long a duplicate waits
+# for the in-flight original, and when an unanswered claim is considered abandoned (seconds)
+NOTES_IDEMPOTENCY_TTL = 24 * 3600
+NOTES_IDEMPOTENCY_WAIT_TIMEOUT = 60
+NOTES_IDEMPOTENCY_LOCK_TIMEOUT = 300
+
+# Request profiling (see notes/profiling.py): staff send X-Profile, and this fraction of all
+# requests is profiled with the default mode. Profiles are kept in a ring on disk.
+NOTES_PROFILING_SAMPLE_RATE = float(os.environ.get('NOTES_PROFILING_SAMPLE_RATE', '0'))
+NOTES_PROFILING_MODE = os.environ.get('NOTES_PROFILING_MODE', 'sampling')
+NOTES_PROFILING_INTERVAL = 0.005
+NOTES_PROFILING_DIR = os.environ.get('NOTES_PROFILING_DIR') or (
+    os.path.join(tempfile.gettempdir(), 'turbo_ai_test_profiles') if TESTING else os.path.join(BASE_DIR, 'profiles')
+)
+NOTES_PROFILING_MAX_FILES = 50
+
 # Simple logging configuration
 
 LOGGING = {
@@ -0,0 +1,39 @@
+"""
+API-only settings profile for turbo_ai.
+Extends the default settings, dropping the apps and middleware that only the admin
+and browser sessions need (admin, sessions, messages, static files, templates).
+
+Use it for pods that serve the token-authenticated JSON API:
+
+    DJANGO_SETTINGS_MODULE=turbo_ai.settings_api
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK
+
+API_ONLY_DROPPED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+]
+
+API_ONLY_DROPPED_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in API_ONLY_DROPPED_APPS]
+MIDDLEWARE = [name for name in MIDDLEWARE if name not in API_ONLY_DROPPED_MIDDLEWARE]
+TEMPLATES = []
+
+# JSON only: the browsable API needs templates and sessions.
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+}
@@ -1,33 +1,55 @@
 """
 Main URL routes for the turbo_ai Django project.
-Includes the routes for notes, categories, user authentication, and LLM population.
+Includes the routes for notes, categories, tags, user authentication, the dashboard summary, LLM population,
+bulk import, batches and the staff-only metrics and profiling endpoints.
 """
 
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from notes.views import (
     NoteViewSet,
     CategoryViewSet,
+    TagViewSet,
     RegisterView,
     LogoutView,
     LoginView,
     ProfileView,
-    PopulateLLMView
+    DashboardView,
+    PopulateLLMView,
+    ImportNotesView,
+    DeletionJobView,
+    BatchView,
+    MetricsView,
+    ProfilingListView,
+    ProfilingDownloadView
 )
 
-# Instantiate a router to automatically set up note/category endpoints
+# Instantiate a router to automatically set up note/category/tag endpoints
 router = DefaultRouter()
 router.register(r'notes', NoteViewSet, basename='note')
 router.register(r'categories', CategoryViewSet, basename='category')
+router.register(r'tags', TagViewSet, basename='tag')
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/v1/', include(router.urls)),
     path('api/v1/register/', RegisterView.as_view(), name='register'),
     path('api/v1/login/', LoginView.as_view(), name='login'),
     path('api/v1/logout/', LogoutView.as_view(), name='logout'),
     path('api/v1/profile/', ProfileView.as_view(), name='profile'),
+    path('api/v1/dashboard/', DashboardView.as_view(), name='dashboard'),
     path('api/v1/populate_llm/', PopulateLLMView.as_view(), name='populate-llm'),
+    path('api/v1/import_notes/', ImportNotesView.as_view(), name='import-notes'),
+    path('api/v1/deletions/<int:pk>/', DeletionJobView.as_view(), name='deletion-job'),
+    path('api/v1/batch/', BatchView.as_view(), name='batch'),
+    path('api/v1/metrics/', MetricsView.as_view(), name='metrics'),
+    path('api/v1/profiling/', ProfilingListView.as_view(), name='profiling-list'),
+    path('api/v1/profiling/<str:profile_id>/', ProfilingDownloadView.as_view(), name='profiling-download'),
 ]
+
+# The admin is not installed under the API-only settings profile (turbo_ai.settings_api).
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))
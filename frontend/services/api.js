@@ -120,5 +120,30 @@ export default {
    * @param {Object} data - The fields to update (first_name, last_name, etc.).
    * @returns {Promise} Axios response promise.
    */
-  updateProfile: (data) => apiClient.put('profile/', data)
+  updateProfile: (data) => apiClient.put('profile/', data),
+
+  /**
+   * Run several note, category and profile calls in one request and one transaction.
+   * Objects created with a client_id can be addressed as `notes/client:<client_id>/`.
+   * @param {Array<Object>} operations - Calls as {method, path, body}, e.g.
+   *   {method: 'PATCH', path: '/api/v1/notes/4/', body: {title: 'New'}}.
+   * @returns {Promise} Axios response promise; `data.results` holds {status, body} per call.
+   */
+  batch: (operations) => apiClient.post('batch/', {operations}),
+
+  /**
+   * Load notes, categories and the profile in a single round trip.
+   * @returns {Promise<Object>} Resolves to {notes, categories, profile}.
+   */
+  loadDashboard: async () => {
+    const res = await apiClient.post('batch/', {
+      operations: [
+        {method: 'GET', path: '/api/v1/notes/'},
+        {method: 'GET', path: '/api/v1/categories/'},
+        {method: 'GET', path: '/api/v1/profile/'}
+      ]
+    })
+    const [notes, categories, profile] = res.data.results.map(result => result.body)
+    return {notes, categories, profile}
+  }
 }